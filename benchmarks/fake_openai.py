@@ -0,0 +1,492 @@
+#!/usr/bin/env python
+"""Fake OpenAI-compatible chat completions server for offline load tests."""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from collections import OrderedDict
+from email import policy
+from email.parser import BytesParser
+from typing import Dict, List, Optional
+
+# Words the fake completions are made of
+WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing")
+# Prompt prefixes remembered by the simulated prompt cache
+MAX_CACHED_PREFIXES = 100000
+
+
+class FakeOpenAIServer:
+    """
+    Serve POST /v1/chat/completions with canned answers, random but
+    repeatable /v1/embeddings, and the file and batch endpoints of the Batch
+    API, whose batches complete batch_delay seconds after they're created.
+
+    Both plain and streamed (server-sent events) responses are supported, so
+    the OpenAI SDK can be pointed at it with OPENAI_BASE_URL. Latency,
+    response length and failure rates are configurable to model an upstream
+    under different conditions.
+
+    Like OpenAI's prompt cache, usage reports the longest run of leading
+    messages already seen as cached tokens, once it reaches
+    cache_min_tokens and in steps of 128 tokens.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.2,
+        jitter: float = 0.1,
+        token_delay: float = 0.005,
+        completion_tokens: int = 50,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        cache_min_tokens: int = 1024,
+        batch_delay: float = 1.0,
+        stream_abort_rate: float = 0.0,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.token_delay = token_delay
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.cache_min_tokens = cache_min_tokens
+        self.batch_delay = batch_delay
+        self.stream_abort_rate = stream_abort_rate
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._files: Dict[str, dict] = {}
+        self._batches: Dict[str, dict] = {}
+        self._prefixes: "OrderedDict[bytes, None]" = OrderedDict()
+
+        self.requests = 0
+        self.errors = 0
+
+    async def start(self) -> int:
+        """Start listening and return the bound port."""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def close(self) -> None:
+        """Stop listening."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        # Connections are kept alive, as the SDK pools them
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0"))
+                body = await reader.readexactly(length) if length else b""
+
+                method, path = request_line.decode("latin-1").split()[:2]
+                if method == "POST" and path.endswith("/chat/completions"):
+                    await self._complete(writer, json.loads(body or b"{}"))
+                elif method == "POST" and path.endswith("/embeddings"):
+                    self._embed(writer, json.loads(body or b"{}"))
+                elif method == "POST" and path.endswith("/files"):
+                    self._upload(writer, headers.get("content-type", ""), body)
+                elif method == "POST" and path.endswith("/batches"):
+                    self._create_batch(writer, json.loads(body or b"{}"))
+                elif method == "GET" and "/batches/" in path:
+                    self._retrieve_batch(writer, path.rsplit("/", 1)[1])
+                elif method == "GET" and path.endswith("/content"):
+                    self._file_content(writer, path.rsplit("/", 2)[1])
+                elif method == "GET" and path.endswith("/models"):
+                    # Used to warm up and keep connections alive
+                    self._write_json(writer, 200, {"object": "list", "data": []})
+                else:
+                    self._write_json(writer, 404, {"error": {"message": "Not found"}})
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def _write_head(self, writer: asyncio.StreamWriter, status: int, headers) -> None:
+        reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests"}.get(
+            status, "Internal Server Error"
+        )
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    def _write_json(
+        self, writer: asyncio.StreamWriter, status: int, payload, **headers
+    ) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        headers.update(
+            {"Content-Type": "application/json", "Content-Length": len(body)}
+        )
+        self._write_head(writer, status, headers)
+        writer.write(body)
+
+    def _write_chunk(self, writer: asyncio.StreamWriter, payload) -> None:
+        data = f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+
+    def _embed(self, writer: asyncio.StreamWriter, request: dict) -> None:
+        texts = request.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        dimensions = request.get("dimensions") or 256
+        data = []
+        for index, text in enumerate(texts):
+            # Seeded by the text, so equal texts get equal vectors
+            rng = random.Random(text)
+            embedding = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(len(text) // 4 + 1 for text in texts)
+        self._write_json(
+            writer,
+            200,
+            {
+                "object": "list",
+                "data": data,
+                "model": request.get("model", "fake-embedding"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            },
+        )
+
+    def _upload(
+        self, writer: asyncio.StreamWriter, content_type: str, body: bytes
+    ) -> None:
+        form = BytesParser(policy=policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+        )
+        fields = {}
+        for part in form.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            fields[name] = (part.get_filename(), part.get_payload(decode=True))
+        filename, data = fields.get("file", (None, b""))
+        purpose = (fields.get("purpose", (None, b"batch"))[1] or b"").decode()
+        file = {
+            "id": f"file-{len(self._files) + 1}",
+            "object": "file",
+            "bytes": len(data),
+            "created_at": int(time.time()),
+            "filename": filename or "upload.jsonl",
+            "purpose": purpose,
+            "status": "processed",
+        }
+        self._files[file["id"]] = {**file, "data": data}
+        self._write_json(writer, 200, file)
+
+    def _add_file(self, name: str, lines: List[dict]) -> str:
+        data = "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+        file_id = f"file-{len(self._files) + 1}"
+        self._files[file_id] = {"id": file_id, "filename": name, "data": data}
+        return file_id
+
+    def _create_batch(self, writer: asyncio.StreamWriter, request: dict) -> None:
+        if request.get("input_file_id") not in self._files:
+            self._write_json(writer, 404, {"error": {"message": "No such file"}})
+            return
+        batch = {
+            "id": f"batch_{len(self._batches) + 1}",
+            "object": "batch",
+            "endpoint": request.get("endpoint"),
+            "input_file_id": request["input_file_id"],
+            "completion_window": request.get("completion_window", "24h"),
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+        }
+        ready_at = time.time() + self.batch_delay
+        self._batches[batch["id"]] = {**batch, "ready_at": ready_at}
+        self._write_json(writer, 200, batch)
+
+    def _run_batch(self, batch: dict) -> None:
+        """Answer every request of a batch and write its output files."""
+        data = self._files[batch["input_file_id"]]["data"]
+        outputs, errors = [], []
+        for line in data.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            self.requests += 1
+            result = {
+                "id": f"batch_req_{self.requests}",
+                "custom_id": request["custom_id"],
+            }
+            if random.random() < self.error_rate:
+                self.errors += 1
+                result["response"] = {"status_code": 500, "body": {}}
+                errors.append(result)
+                continue
+            count = min(
+                request["body"].get("max_tokens") or self.completion_tokens,
+                self.completion_tokens,
+            )
+            content = " ".join(random.choice(WORDS) for _ in range(count))
+            result["response"] = {
+                "status_code": 200,
+                "body": {
+                    "object": "chat.completion",
+                    "model": request["body"].get("model", "fake-model"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                },
+            }
+            result["error"] = None
+            outputs.append(result)
+        batch["status"] = "completed"
+        batch["request_counts"] = {
+            "total": len(outputs) + len(errors),
+            "completed": len(outputs),
+            "failed": len(errors),
+        }
+        if outputs:
+            batch["output_file_id"] = self._add_file("output.jsonl", outputs)
+        if errors:
+            batch["error_file_id"] = self._add_file("errors.jsonl", errors)
+
+    def _retrieve_batch(self, writer: asyncio.StreamWriter, batch_id: str) -> None:
+        batch = self._batches.get(batch_id)
+        if batch is None:
+            self._write_json(writer, 404, {"error": {"message": "No such batch"}})
+            return
+        if batch["status"] == "in_progress" and time.time() >= batch["ready_at"]:
+            self._run_batch(batch)
+        self._write_json(
+            writer, 200, {k: v for k, v in batch.items() if k != "ready_at"}
+        )
+
+    def _file_content(self, writer: asyncio.StreamWriter, file_id: str) -> None:
+        file = self._files.get(file_id)
+        if file is None:
+            self._write_json(writer, 404, {"error": {"message": "No such file"}})
+            return
+        headers = {
+            "Content-Type": "application/octet-stream",
+            "Content-Length": len(file["data"]),
+        }
+        self._write_head(writer, 200, headers)
+        writer.write(file["data"])
+
+    def _cached_tokens(self, messages: List[dict], tokens: List[int]) -> int:
+        """Tokens of the longest known prefix, then remember every prefix."""
+        digest = hashlib.blake2b(digest_size=16)
+        prefix_tokens = cached = 0
+        for message, count in zip(messages, tokens):
+            digest.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+            prefix_tokens += count
+            key = digest.digest()
+            if key in self._prefixes:
+                self._prefixes.move_to_end(key)
+                cached = prefix_tokens
+            else:
+                self._prefixes[key] = None
+        while len(self._prefixes) > MAX_CACHED_PREFIXES:
+            self._prefixes.popitem(last=False)
+        if cached < max(self.cache_min_tokens, 1):
+            return 0
+        return cached - cached % 128 if cached >= 128 else cached
+
+    async def _complete(self, writer: asyncio.StreamWriter, request: dict) -> None:
+        self.requests += 1
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            self.errors += 1
+            error = {"error": {"message": "Rate limit reached", "type": "requests"}}
+            self._write_json(writer, 429, error, **{"retry-after-ms": 100})
+            return
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.errors += 1
+            error = {"error": {"message": "Server error", "type": "server_error"}}
+            self._write_json(writer, 500, error)
+            return
+
+        model = request.get("model", "fake-model")
+        max_tokens = request.get("max_tokens") or self.completion_tokens
+        count = min(max_tokens, self.completion_tokens)
+        words = [random.choice(WORDS) for _ in range(count)]
+        messages = request.get("messages", [])
+        tokens = [len(str(message.get("content", ""))) // 4 + 4 for message in messages]
+        prompt_tokens = sum(tokens)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+            "prompt_tokens_details": {
+                "cached_tokens": self._cached_tokens(messages, tokens)
+            },
+        }
+        base = {
+            "id": f"chatcmpl-{self.requests}",
+            "created": int(time.time()),
+            "model": model,
+        }
+
+        if not request.get("stream"):
+            self._write_json(
+                writer,
+                200,
+                {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": " ".join(words),
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                },
+            )
+            return
+
+        self._write_head(
+            writer,
+            200,
+            {"Content-Type": "text/event-stream", "Transfer-Encoding": "chunked"},
+        )
+        chunk = {**base, "object": "chat.completion.chunk"}
+        # Streams that drop the connection halfway, like a network failure
+        abort_at = len(words) // 2 if random.random() < self.stream_abort_rate else -1
+        for i, word in enumerate(words):
+            if i == abort_at:
+                self.errors += 1
+                raise ConnectionResetError("Stream aborted")
+            delta = {"content": word if i == 0 else f" {word}"}
+            if i == 0:
+                delta["role"] = "assistant"
+            choice = {"index": 0, "delta": delta, "finish_reason": None}
+            self._write_chunk(writer, {**chunk, "choices": [choice]})
+            await writer.drain()
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+        choice = {"index": 0, "delta": {}, "finish_reason": "stop"}
+        self._write_chunk(writer, {**chunk, "choices": [choice]})
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self._write_chunk(writer, {**chunk, "choices": [], "usage": usage})
+        data = b"data: [DONE]\n\n"
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n0\r\n\r\n")
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the fake server's options to a command line parser."""
+    parser.add_argument(
+        "--latency", type=float, default=0.2, help="Mean seconds before responding"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.1, help="Standard deviation of the latency"
+    )
+    parser.add_argument(
+        "--token-delay",
+        type=float,
+        default=0.005,
+        help="Seconds between streamed tokens",
+    )
+    parser.add_argument(
+        "--completion-tokens", type=int, default=50, help="Tokens per completion"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests failing with 500",
+    )
+    parser.add_argument(
+        "--rate-limit-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests failing with 429",
+    )
+    parser.add_argument(
+        "--cache-min-tokens",
+        type=int,
+        default=1024,
+        help="Shortest prompt prefix reported as cached",
+    )
+    parser.add_argument(
+        "--batch-delay",
+        type=float,
+        default=1.0,
+        help="Seconds before a batch completes",
+    )
+    parser.add_argument(
+        "--stream-abort-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of streams cut off halfway",
+    )
+
+
+def server_from_args(
+    args: argparse.Namespace, host: str, port: int
+) -> FakeOpenAIServer:
+    """Build a server from parsed add_server_arguments options."""
+    return FakeOpenAIServer(
+        host=host,
+        port=port,
+        latency=args.latency,
+        jitter=args.jitter,
+        token_delay=args.token_delay,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        cache_min_tokens=args.cache_min_tokens,
+        batch_delay=args.batch_delay,
+        stream_abort_rate=args.stream_abort_rate,
+    )
+
+
+async def serve(server: FakeOpenAIServer) -> None:
+    """Run a server until cancelled, announcing its port on stdout."""
+    port = await server.start()
+    # The load test reads this line to find the port
+    print(f"FAKE_OPENAI_PORT={port}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main():
+    """Run the fake server standalone."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(server_from_args(args, args.host, args.port)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+"""Offline load test of the /gpt pipeline with fake Discord and OpenAI backends."""
+
+import argparse
+import asyncio
+import gc
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord  # noqa: E402
+
+from bot_discord.commands import (  # noqa: E402
+    BUSY_MESSAGE,
+    INTERRUPTED_MESSAGE,
+    UNAVAILABLE_MESSAGE,
+    DiscordCommands,
+)
+from config.settings import Settings  # noqa: E402
+from core.conversation import ConversationManager  # noqa: E402
+from core.openai_client import OpenAIClient  # noqa: E402
+from core.storage import create_store  # noqa: E402
+from fake_openai import add_server_arguments  # noqa: E402
+
+FAKE_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_openai.py")
+
+
+class FakeDMChannel(discord.DMChannel):
+    """DM channel that passes the cog's isinstance check without a gateway."""
+
+    def __init__(self):
+        pass
+
+
+class FakeUser:
+    __slots__ = ("id",)
+
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+
+class FakeMessage:
+    """Message returned by followup.send, recording later edits."""
+
+    __slots__ = ("ctx", "content")
+
+    def __init__(self, ctx: "FakeContext", content: str):
+        self.ctx = ctx
+        self.content = content
+
+    async def edit(self, content: Optional[str] = None, **kwargs) -> "FakeMessage":
+        await self.ctx.discord_call()
+        self.content = content
+        self.ctx.output(content)
+        return self
+
+
+class FakeFollowup:
+    __slots__ = ("ctx",)
+
+    def __init__(self, ctx: "FakeContext"):
+        self.ctx = ctx
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> FakeMessage:
+        await self.ctx.discord_call()
+        self.ctx.output(content)
+        return FakeMessage(self.ctx, content)
+
+
+class FakeContext:
+    """
+    Stand-in for discord.ApplicationContext in a DM.
+
+    Discord API calls sleep for discord_latency to model the round trip, and
+    the time of the first and last visible output is recorded.
+    """
+
+    def __init__(self, user: FakeUser, channel: FakeDMChannel, discord_latency: float):
+        self.author = user
+        self.channel = channel
+        self.followup = FakeFollowup(self)
+        self.discord_latency = discord_latency
+        self.rejected = False
+        self.first_output_at: Optional[float] = None
+        self.last_output: Optional[str] = None
+
+    async def discord_call(self) -> None:
+        if self.discord_latency:
+            await asyncio.sleep(self.discord_latency)
+
+    def output(self, content: Optional[str]) -> None:
+        if self.first_output_at is None:
+            self.first_output_at = time.perf_counter()
+        self.last_output = content
+
+    async def defer(self, **kwargs) -> None:
+        await self.discord_call()
+
+    async def respond(self, content: Optional[str] = None, **kwargs) -> None:
+        await self.discord_call()
+        self.rejected = bool(kwargs.get("ephemeral"))
+        self.output(content)
+
+
+class LoadStats:
+    """Outcomes and latencies of all simulated turns."""
+
+    def __init__(self):
+        self.first_output: List[float] = []
+        self.full_response: List[float] = []
+        self.outcomes = {"ok": 0, "rejected": 0, "shed": 0, "cut_off": 0, "error": 0}
+
+    def record(self, ctx: FakeContext, started_at: float, finished_at: float) -> None:
+        output = ctx.last_output or ""
+        if ctx.rejected:
+            self.outcomes["rejected"] += 1
+        elif output in (BUSY_MESSAGE, UNAVAILABLE_MESSAGE):
+            self.outcomes["shed"] += 1
+        elif output == INTERRUPTED_MESSAGE:
+            self.outcomes["cut_off"] += 1
+        elif not output or output.startswith("❌"):
+            self.outcomes["error"] += 1
+        else:
+            self.outcomes["ok"] += 1
+            self.first_output.append(ctx.first_output_at - started_at)
+            self.full_response.append(finished_at - started_at)
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+def max_rss_bytes() -> int:
+    """Peak resident set size of this process."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def start_fake_server(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    """Run the fake OpenAI server in its own process, so it doesn't skew results."""
+    command = [
+        sys.executable,
+        FAKE_SERVER,
+        "--port",
+        "0",
+        "--latency",
+        str(args.latency),
+        "--jitter",
+        str(args.jitter),
+        "--token-delay",
+        str(args.token_delay),
+        "--completion-tokens",
+        str(args.completion_tokens),
+        "--error-rate",
+        str(args.error_rate),
+        "--rate-limit-rate",
+        str(args.rate_limit_rate),
+        "--stream-abort-rate",
+        str(args.stream_abort_rate),
+        "--cache-min-tokens",
+        str(args.cache_min_tokens),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline().strip()
+    if not line.startswith("FAKE_OPENAI_PORT="):
+        process.kill()
+        raise RuntimeError("Fake OpenAI server failed to start")
+    port = line.partition("=")[2]
+    return process, f"http://127.0.0.1:{port}/v1"
+
+
+def configure_environment(args: argparse.Namespace, base_url: str) -> None:
+    """Point the bot's settings at the fake backend."""
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["DISCORD_TOKEN"] = "fake-token"
+    os.environ["OPENAI_API_KEY"] = "fake-key"
+    os.environ["STREAM_RESPONSES"] = "true" if args.stream else "false"
+    os.environ["CONVERSATION_STORE"] = args.store
+    os.environ["RATE_LIMIT_PER_USER"] = "0"
+    os.environ["OPENAI_RPM_LIMIT"] = str(args.rpm)
+    os.environ["OPENAI_TPM_LIMIT"] = str(args.tpm)
+    if args.store == "sqlite":
+        os.environ["CONVERSATION_DB_PATH"] = "data/load_test.db"
+
+
+async def run_user(
+    cog,
+    user_id: int,
+    args: argparse.Namespace,
+    stats: LoadStats,
+    channel: FakeDMChannel,
+) -> None:
+    """Send one virtual user's turns, pausing between them."""
+    await asyncio.sleep(random.uniform(0, args.ramp))
+    user = FakeUser(user_id)
+    filler = "x" * args.prompt_length
+    for turn in range(args.turns):
+        ctx = FakeContext(user, channel, args.discord_latency)
+        prompt = f"{user_id}:{turn}:{filler}"
+        started_at = time.perf_counter()
+        await cog.gpt.callback(cog, ctx, prompt)
+        stats.record(ctx, started_at, time.perf_counter())
+        if args.think_time:
+            await asyncio.sleep(random.expovariate(1 / args.think_time))
+
+
+async def run(args: argparse.Namespace, base_url: str) -> None:
+    """Drive the cog with virtual users and print a report."""
+    configure_environment(args, base_url)
+    settings = Settings()
+    manager = ConversationManager(
+        max_messages=settings.max_conversation_messages,
+        max_prompt_tokens=settings.max_prompt_tokens or None,
+        model=settings.openai_model,
+        store=create_store(
+            settings.conversation_store,
+            settings.conversation_db_path,
+            settings.max_conversation_messages,
+        ),
+        flush_interval=settings.store_flush_interval,
+        max_conversations=settings.max_conversations or None,
+        max_bytes=settings.max_conversation_memory_mb * 1024 * 1024 or None,
+        idle_ttl=settings.conversation_idle_ttl or None,
+        sweep_interval=settings.conversation_sweep_interval,
+        eviction_block=settings.prompt_eviction_block,
+    )
+    client = OpenAIClient(settings)
+    cog = DiscordCommands(None, manager, client, settings)
+    manager.start()
+
+    stats = LoadStats()
+    channel = FakeDMChannel()
+    gc.collect()
+    rss_before = max_rss_bytes()
+
+    started_at = time.perf_counter()
+    await asyncio.gather(
+        *(run_user(cog, user_id, args, stats, channel) for user_id in range(args.users))
+    )
+    elapsed = time.perf_counter() - started_at
+
+    gc.collect()
+    rss_after = max_rss_bytes()
+    tracked_bytes = manager.total_bytes
+    scheduler = client.scheduler
+    prompt_cache = client.prompt_cache
+    if cog.memory is not None:
+        await cog.memory.close()
+    await manager.close()
+    await client.close()
+
+    stats.first_output.sort()
+    stats.full_response.sort()
+    total = sum(stats.outcomes.values())
+    print(f"\n📊 Load test: {args.users} users × {args.turns} turns")
+    print(f"   streaming {'on' if args.stream else 'off'}, upstream {base_url}\n")
+    print("Outcomes: " + ", ".join(f"{k} {v}" for k, v in stats.outcomes.items()))
+    print(f"\n{'Latency (s)':<16} | {'p50':>7} | {'p95':>7} | {'p99':>7} | {'max':>7}")
+    print("-" * 52)
+    for name, values in (
+        ("First output", stats.first_output),
+        ("Full response", stats.full_response),
+    ):
+        row = " | ".join(f"{percentile(values, p):>7.3f}" for p in (50, 95, 99, 100))
+        print(f"{name:<16} | {row}")
+    print(
+        f"\nThroughput: {stats.outcomes['ok'] / elapsed:.1f} ok turns/s, "
+        f"{total / elapsed:.1f} turns/s over {elapsed:.1f}s"
+    )
+    print(
+        f"Queue: {scheduler.waits} waits, max {scheduler.wait_seconds_max:.3f}s, "
+        f"{scheduler.shed} shed"
+    )
+    print(
+        f"Prompt cache: {prompt_cache.cached_tokens} of "
+        f"{prompt_cache.prompt_tokens} prompt tokens cached "
+        f"({prompt_cache.hit_rate() or 0.0:.0%})"
+    )
+    print(
+        f"Memory: peak RSS +{(rss_after - rss_before) / args.users:.0f} B/user, "
+        f"conversations ~{tracked_bytes / args.users:.0f} B/user"
+    )
+
+
+def main():
+    """Parse options, start the fake backend and run the load test."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=2000, help="Virtual users")
+    parser.add_argument("--turns", type=int, default=3, help="Prompts per user")
+    parser.add_argument(
+        "--ramp", type=float, default=5.0, help="Seconds over which users arrive"
+    )
+    parser.add_argument(
+        "--think-time", type=float, default=1.0, help="Mean seconds between turns"
+    )
+    parser.add_argument(
+        "--prompt-length", type=int, default=200, help="Characters per prompt"
+    )
+    parser.add_argument(
+        "--discord-latency",
+        type=float,
+        default=0.05,
+        help="Seconds per simulated Discord API call",
+    )
+    parser.add_argument(
+        "--stream",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Stream responses",
+    )
+    parser.add_argument(
+        "--store",
+        choices=("memory", "sqlite", "none"),
+        default="memory",
+        help="Conversation store backend",
+    )
+    parser.add_argument(
+        "--rpm", type=int, default=0, help="OPENAI_RPM_LIMIT, 0 disables it"
+    )
+    parser.add_argument(
+        "--tpm", type=int, default=0, help="OPENAI_TPM_LIMIT, 0 disables it"
+    )
+    parser.add_argument(
+        "--base-url", help="Use an already running fake server instead of starting one"
+    )
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    # Per-request logging would dominate the measurement
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    process = None
+    base_url = args.base_url
+    if base_url is None:
+        process, base_url = start_fake_server(args)
+    try:
+        asyncio.run(run(args, base_url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
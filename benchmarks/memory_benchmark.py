@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Benchmark conversation memory usage per user."""
+
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.conversation import ConversationManager  # noqa: E402
+
+
+def measure(users: int, messages: int, length: int, payload: bool) -> float:
+    """
+    Build a manager with simulated users and measure its memory.
+
+    Args:
+        users: Number of simulated users
+        messages: Messages stored per user
+        length: Characters per message
+        payload: Whether to build the cached OpenAI payload for each user
+
+    Returns:
+        Traced bytes per user
+    """
+    gc.collect()
+    tracemalloc.start()
+    manager = ConversationManager(max_messages=max(messages, 1))
+    filler = "x" * length
+    for user_id in range(users):
+        for i in range(messages):
+            role = "user" if i % 2 == 0 else "assistant"
+            # Unique strings, as real content is never shared between users
+            manager.add_message(user_id, role, f"{user_id}:{i}:{filler}")
+        if payload:
+            manager.get_messages(user_id)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del manager
+    return current / users
+
+
+def main():
+    """Run the benchmark for each user count."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--users", default="10000,100000,1000000", help="Comma-separated user counts"
+    )
+    parser.add_argument("--messages", type=int, default=4, help="Messages per user")
+    parser.add_argument(
+        "--length", type=int, default=100, help="Characters per message"
+    )
+    args = parser.parse_args()
+
+    print("📊 Conversation memory benchmark")
+    print(f"   {args.messages} messages of ~{args.length} characters per user\n")
+    print(f"{'Users':>10} | {'Idle B/user':>12} | {'Active B/user':>13}")
+    print("-" * 41)
+    for users in (int(n) for n in args.users.split(",")):
+        idle = measure(users, args.messages, args.length, payload=False)
+        active = measure(users, args.messages, args.length, payload=True)
+        print(f"{users:>10} | {idle:>12.0f} | {active:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Benchmark saving and lazily reopening conversation snapshots."""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.conversation import ConversationManager  # noqa: E402
+from core.snapshot import SnapshotReader, encode_record, write_snapshot  # noqa: E402
+
+
+def generate_records(users: int, messages: int, length: int):
+    """Yield encoded records for simulated users without holding them all."""
+    filler = "lorem ipsum " * (length // 12 + 1)
+    for user_id in range(users):
+        history = [
+            (1 + i % 2, f"{user_id}:{i}:{filler[:length]}") for i in range(messages)
+        ]
+        yield user_id, encode_record(None, history)
+
+
+async def first_touch(path: str, users: int, lookups: int) -> float:
+    """Open a snapshot in a fresh manager and load random users from it."""
+    manager = ConversationManager(snapshot_path=path)
+    started_at = time.perf_counter()
+    for user_id in random.sample(range(users), min(lookups, users)):
+        await manager.load_conversation(user_id)
+    elapsed = time.perf_counter() - started_at
+    manager.snapshot.close()
+    return elapsed / lookups
+
+
+def main():
+    """Run the benchmark for each user count."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--users", default="100000,1000000", help="Comma-separated user counts"
+    )
+    parser.add_argument("--messages", type=int, default=4, help="Messages per user")
+    parser.add_argument(
+        "--length", type=int, default=100, help="Characters per message"
+    )
+    parser.add_argument(
+        "--lookups", type=int, default=1000, help="Users loaded after opening"
+    )
+    parser.add_argument(
+        "--no-compress", action="store_true", help="Write uncompressed records"
+    )
+    args = parser.parse_args()
+
+    print("📊 Conversation snapshot benchmark")
+    print(f"   {args.messages} messages of ~{args.length} characters per user\n")
+    print(
+        f"{'Users':>10} | {'Write s':>8} | {'Size MB':>8} | "
+        f"{'Open ms':>8} | {'Load µs/user':>12}"
+    )
+    print("-" * 58)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "conversations.snapshot")
+        for users in (int(n) for n in args.users.split(",")):
+            started_at = time.perf_counter()
+            write_snapshot(
+                path,
+                generate_records(users, args.messages, args.length),
+                compress=not args.no_compress,
+            )
+            write_time = time.perf_counter() - started_at
+
+            started_at = time.perf_counter()
+            SnapshotReader(path).close()
+            open_time = time.perf_counter() - started_at
+
+            load_time = asyncio.run(first_touch(path, users, args.lookups))
+            size = os.path.getsize(path) / (1024 * 1024)
+            print(
+                f"{users:>10} | {write_time:>8.2f} | {size:>8.1f} | "
+                f"{open_time * 1000:>8.2f} | {load_time * 1e6:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Benchmark cold-start time of the bot, each stage in a fresh interpreter."""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CREATE_BOT = (
+    "from bot_discord.client import create_bot; "
+    "from config.settings import load_settings; "
+    "bot = create_bot(load_settings())"
+)
+
+# Each stage includes the ones before it
+STAGES = [
+    ("interpreter", "pass"),
+    ("import bot", "import bot"),
+    ("create bot", f"import bot; {CREATE_BOT}"),
+    ("OpenAI client", f"import bot; {CREATE_BOT}; bot.openai_client.client"),
+]
+
+
+def measure(statement: str, runs: int) -> list:
+    """Run statement in fresh interpreters and return the wall times."""
+    env = dict(
+        os.environ,
+        DISCORD_TOKEN="fake-token",
+        OPENAI_API_KEY="sk-benchmark",
+        CONVERSATION_STORE="none",
+        RESPONSE_CACHE="false",
+        LOG_LEVEL="ERROR",
+    )
+    times = []
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], cwd=ROOT, env=env, check=True)
+        times.append(time.perf_counter() - started_at)
+    return times
+
+
+def main():
+    """Run every stage and optionally fail if importing the bot is too slow."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5, help="Runs per stage")
+    parser.add_argument(
+        "--max-import-ms",
+        type=float,
+        default=0,
+        help="Exit with an error if the median 'import bot' time exceeds this",
+    )
+    args = parser.parse_args()
+
+    print("📊 Cold-start benchmark")
+    print(f"   {args.runs} fresh interpreters per stage\n")
+    print(f"{'Stage':<16} | {'Median ms':>10} | {'Min ms':>8} | {'Max ms':>8}")
+    print("-" * 51)
+    medians = {}
+    for name, statement in STAGES:
+        times = measure(statement, args.runs)
+        medians[name] = statistics.median(times) * 1000
+        print(
+            f"{name:<16} | {medians[name]:>10.1f} | "
+            f"{min(times) * 1000:>8.1f} | {max(times) * 1000:>8.1f}"
+        )
+
+    if args.max_import_ms and medians["import bot"] > args.max_import_ms:
+        print(
+            f"\n❌ Importing the bot took {medians['import bot']:.1f} ms, "
+            f"over the {args.max_import_ms:.0f} ms budget"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
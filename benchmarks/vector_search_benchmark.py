@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""Benchmark long-term memory search latency over many stored turns."""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.embeddings import HashingEmbeddingProvider, normalize  # noqa: E402
+from core.memory import LongTermMemory, VectorStore  # noqa: E402
+
+USER_ID = 1
+# Rows written per append while filling the store
+FILL_BATCH = 100000
+
+
+def fill(store: VectorStore, turns: int, rng: np.random.Generator) -> None:
+    """Store random unit vectors, which score like unrelated turns."""
+    for start in range(0, turns, FILL_BATCH):
+        count = min(FILL_BATCH, turns - start)
+        vectors = normalize(
+            rng.standard_normal((count, store.dimensions), dtype=np.float32)
+        )
+        texts = [f"turn {start + i}" for i in range(count)]
+        store.append(USER_ID, vectors, texts)
+
+
+def percentiles(samples: list) -> str:
+    """Format the p50 and p95 of samples in milliseconds."""
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2] * 1000
+    p95 = samples[int(len(samples) * 0.95)] * 1000
+    return f"{p50:>8.2f} | {p95:>8.2f}"
+
+
+def main():
+    """Run the benchmark for each stored turn count."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--turns", default="10000,100000,1000000", help="Comma-separated turn counts"
+    )
+    parser.add_argument("--dimensions", type=int, default=256, help="Vector length")
+    parser.add_argument("--top-k", type=int, default=3, help="Matches per query")
+    parser.add_argument("--batch", type=int, default=8, help="Queries per batch")
+    parser.add_argument("--searches", type=int, default=50, help="Searches per size")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    provider = HashingEmbeddingProvider(args.dimensions)
+    print("📊 Long-term memory search benchmark")
+    print(f"   {args.dimensions} dimensions, top {args.top_k}\n")
+    print(
+        f"{'Turns':>10} | {'1 query p50/p95 ms':>19} | "
+        f"{f'{args.batch} queries p50/p95 ms':>20} | {'Recall p50/p95 ms':>19}"
+    )
+    print("-" * 78)
+    for turns in (int(n) for n in args.turns.split(",")):
+        with tempfile.TemporaryDirectory() as directory:
+            store = VectorStore(directory, args.dimensions)
+            fill(store, turns, rng)
+            # Open the map and fault its pages in, as for a recently active user
+            warm_up = rng.standard_normal((1, args.dimensions), dtype=np.float32)
+            store.search(USER_ID, normalize(warm_up), 1)
+
+            results = []
+            for queries in (1, args.batch):
+                samples = []
+                for _ in range(args.searches):
+                    shape = (queries, args.dimensions)
+                    query = normalize(rng.standard_normal(shape, dtype=np.float32))
+                    started_at = time.perf_counter()
+                    store.search(USER_ID, query, args.top_k)
+                    samples.append(time.perf_counter() - started_at)
+                results.append(percentiles(samples))
+
+            # End to end: embed with the local provider, search, read texts
+            memory = LongTermMemory(store, provider, args.top_k, min_score=-1.0)
+
+            async def recall():
+                samples = []
+                for i in range(args.searches):
+                    started_at = time.perf_counter()
+                    await memory.recall(USER_ID, f"what did we say about item {i}?")
+                    samples.append(time.perf_counter() - started_at)
+                await memory.close()
+                return samples
+
+            results.append(percentiles(asyncio.run(recall())))
+            print(
+                f"{turns:>10} | {results[0]:>19} | {results[1]:>20} | {results[2]:>19}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,39 @@
 """Main entry point for DiscordGPT bot."""
 
-import asyncio
+import argparse
+import importlib
+import multiprocessing
 import os
 import signal
+import subprocess
 import sys
+import threading
+import time
 
-from config.settings import load_settings
-from bot_discord.client import create_bot
+from config.settings import Settings, load_settings
+from bot_discord.sharding import configure_shard_process
 from utils.logger import get_logger, setup_logger
 
+# Heavy modules only needed once the bot is ready, imported in the background
+# while it logs in to Discord
+PRELOAD_MODULES = ("openai",)
+
 
 def main():
     """Main function to start the bot."""
+    parser = argparse.ArgumentParser(
+        description="DiscordGPT - AI Assistant for Discord"
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Report where startup time goes and exit",
+    )
+    args = parser.parse_args()
+    if args.profile_startup:
+        profile_startup()
+        return
+
     # Setup logging
     setup_logger()
     logger = get_logger()
@@ -24,44 +46,160 @@ def main():
     try:
         # Load settings
         settings = load_settings()
+        setup_logger(settings)
         logger.info("Settings loaded successfully")
 
-        # Create bot
-        bot = create_bot(settings)
-        logger.info("Bot created successfully")
-
-        # Handle graceful shutdown
-        def handle_shutdown(signum, frame):
-            logger.info("Received shutdown signal, cleaning up...")
-            asyncio.create_task(shutdown(bot))
-
-        signal.signal(signal.SIGINT, handle_shutdown)
-        signal.signal(signal.SIGTERM, handle_shutdown)
-
-        # Start bot
-        logger.info("Starting bot...")
-        bot.run(settings.discord_token)
+        if settings.shard_processes > 1:
+            run_shard_processes(settings)
+        else:
+            run_bot(settings)
 
     except Exception as e:
         logger.error(f"Failed to start bot: {e}")
         sys.exit(1)
 
 
-async def shutdown(bot):
-    """Gracefully shutdown the bot."""
+def run_bot(
+    settings: Settings,
+    process_index: int = 0,
+    shutdown_signals=(signal.SIGINT, signal.SIGTERM),
+):
+    """Create the bot and run it until a shutdown signal has been handled."""
+    # py-cord is imported here, so the shard launcher never loads it
+    from bot_discord.client import create_bot
+    from bot_discord.lifecycle import BotLifecycle
+
     logger = get_logger()
-    logger.info("Shutting down bot...")
 
-    try:
-        if hasattr(bot, "openai_client"):
-            await bot.openai_client.close()
-            logger.info("OpenAI client closed")
+    # Create bot
+    bot = create_bot(settings, process_index)
+    logger.info("Bot created successfully")
 
-        await bot.close()
-        logger.info("Bot closed successfully")
+    # Start bot, draining in-flight requests on shutdown
+    logger.info("Starting bot...")
+    preload_modules()
+    lifecycle = BotLifecycle(bot, settings.shutdown_drain_timeout, shutdown_signals)
+    lifecycle.run(settings.discord_token)
 
-    except Exception as e:
-        logger.error(f"Error during shutdown: {e}")
+
+def preload_modules(names=PRELOAD_MODULES) -> threading.Thread:
+    """Import modules on a background thread, off the bot's startup path."""
+    logger = get_logger()
+
+    def preload():
+        for name in names:
+            started_at = time.monotonic()
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                logger.warning(f"Failed to preload {name}: {e}")
+                continue
+            logger.debug(f"Preloaded {name} in {time.monotonic() - started_at:.2f}s")
+
+    thread = threading.Thread(target=preload, name="preload-modules", daemon=True)
+    thread.start()
+    return thread
+
+
+def run_shard_process(process_index: int):
+    """Entry point of one of several shard processes."""
+    # The launcher stops shard processes with SIGTERM, Ctrl+C is its to handle
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    settings = load_settings()
+    configure_shard_process(settings, process_index)
+    setup_logger(settings, name=f"discordgpt_shard{process_index}")
+    run_bot(settings, process_index, shutdown_signals=(signal.SIGTERM,))
+
+
+def run_shard_processes(settings: Settings):
+    """Run the shards in SHARD_PROCESSES processes and wait for them to exit."""
+    logger = get_logger()
+    if settings.conversation_store != "sqlite":
+        logger.warning(
+            "Conversations are only shared between shard processes with "
+            "CONVERSATION_STORE=sqlite"
+        )
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=run_shard_process, args=(index,), name=f"shard-process-{index}"
+        )
+        for index in range(settings.shard_processes)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {len(processes)} shard processes")
+
+    def stop_processes(signum, frame):
+        logger.info("Received shutdown signal, stopping shard processes...")
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGINT, stop_processes)
+    signal.signal(signal.SIGTERM, stop_processes)
+
+    for process in processes:
+        process.join()
+    failed = [process.name for process in processes if process.exitcode]
+    if failed:
+        logger.error(f"Shard processes exited with errors: {', '.join(failed)}")
+
+
+def _import_times(statement: str) -> list:
+    """Get (seconds, package) for the packages statement imports, heaviest first."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+    )
+    totals = {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | name", nested names indented
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[0].split(":")[-1].strip().isdigit():
+            continue
+        package = parts[2].strip().split(".")[0]
+        self_time = int(parts[0].split(":")[-1]) / 1e6
+        totals[package] = totals.get(package, 0.0) + self_time
+    return sorted(((seconds, name) for name, seconds in totals.items()), reverse=True)
+
+
+def profile_startup(top: int = 15):
+    """Print how long each startup phase and the heaviest imports take."""
+    phases = []
+
+    def phase(name, call):
+        started_at = time.perf_counter()
+        result = call()
+        phases.append((name, time.perf_counter() - started_at))
+        return result
+
+    phase("import discord", lambda: importlib.import_module("discord"))
+    client_module = phase(
+        "import bot_discord.client",
+        lambda: importlib.import_module("bot_discord.client"),
+    )
+    phase("import openai (preloaded)", lambda: importlib.import_module("openai"))
+    try:
+        settings = phase("load settings", load_settings)
+    except ValueError as e:
+        settings = None
+        print(f"⚠ Skipping bot creation: {e}")
+    if settings is not None:
+        bot = phase("create bot", lambda: client_module.create_bot(settings))
+        phase("create OpenAI client", lambda: bot.openai_client.client)
+
+    print("⏱  Startup phases")
+    for name, seconds in phases:
+        print(f"   {name:<28} {seconds * 1000:>8.1f} ms")
+    print(f"   {'total':<28} {sum(s for _, s in phases) * 1000:>8.1f} ms")
+
+    print("\n📦 Import time by package (python -X importtime)")
+    modules = ", ".join(("bot_discord.client",) + PRELOAD_MODULES)
+    for seconds, name in _import_times(f"import {modules}")[:top]:
+        print(f"   {name:<28} {seconds * 1000:>8.1f} ms")
 
 
 if __name__ == "__main__":
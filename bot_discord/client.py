@@ -6,18 +6,27 @@ from discord.ext import commands
 from config.settings import Settings
 from core.conversation import ConversationManager
 from core.openai_client import OpenAIClient
-from bot_discord.commands import setup_commands
+from core.storage import create_store
+from bot_discord.commands import FORWARD_LOST_MESSAGE, setup_commands
+from bot_discord.sharding import (
+    ForwardLost,
+    InteractionRouter,
+    direct_message_payload,
+    shard_options,
+)
 from utils.logger import get_logger
+from utils.metrics import MetricsServer
 
 logger = get_logger()
 
 
-def create_bot(settings: Settings) -> commands.Bot:
+def create_bot(settings: Settings, process_index: int = 0) -> commands.Bot:
     """
     Create and configure the Discord bot.
 
     Args:
         settings: Application settings
+        process_index: Index of this process when shards run in several
 
     Returns:
         Configured Discord bot instance
@@ -26,28 +35,140 @@ def create_bot(settings: Settings) -> commands.Bot:
     intents.message_content = True
     intents.dm_messages = True
 
-    bot = commands.Bot(
-        command_prefix="!",  # Not used, but required
-        intents=intents,
-        description="DiscordGPT - AI Assistant for Discord",
-    )
+    bot_options = {
+        "command_prefix": "!",  # Not used, but required
+        "intents": intents,
+        "description": "DiscordGPT - AI Assistant for Discord",
+    }
+    if settings.sharded or settings.shard_processes > 1:
+        bot = commands.AutoShardedBot(
+            # Commands are global, so one process syncing them is enough
+            auto_sync_commands=process_index == 0,
+            **shard_options(settings, process_index),
+            **bot_options,
+        )
+    else:
+        bot = commands.Bot(**bot_options)
 
     # Initialize components
     conversation_manager = ConversationManager(
-        max_messages=settings.max_conversation_messages
+        max_messages=settings.max_conversation_messages,
+        max_prompt_tokens=settings.max_prompt_tokens,
+        model=settings.openai_model,
+        store=create_store(
+            settings.conversation_store,
+            settings.conversation_db_path,
+            settings.max_conversation_messages,
+        ),
+        flush_interval=settings.store_flush_interval,
+        max_conversations=settings.max_conversations or None,
+        max_bytes=settings.max_conversation_memory_mb * 1024 * 1024 or None,
+        idle_ttl=settings.conversation_idle_ttl or None,
+        sweep_interval=settings.conversation_sweep_interval,
+        eviction_block=settings.prompt_eviction_block,
+        snapshot_path=settings.snapshot_path or None,
+        snapshot_compress=settings.snapshot_compress,
     )
     openai_client = OpenAIClient(settings)
+    # The gauges are module-wide, so only the bot's own instances feed them
+    conversation_manager.register_metrics()
+    openai_client.register_metrics()
+    metrics_server = None
+    if settings.metrics_port:
+        metrics_server = MetricsServer(settings.metrics_host, settings.metrics_port)
+
+    router = None
+    if settings.shard_processes > 1:
+
+        async def handle_forwarded(payload):
+            if payload.get("direct_message"):
+                channel = bot.get_partial_messageable(
+                    int(payload["channel_id"]), type=discord.ChannelType.private
+                )
+                await bot.get_cog("DiscordCommands").handle_direct_message(
+                    int(payload["user"]["id"]),
+                    channel.get_partial_message(int(payload["id"])),
+                    payload["content"],
+                )
+                return
+            # Private, but it's how py-cord builds interactions from the gateway.
+            # Checked against py-cord 2.6 and 2.7, recheck when upgrading.
+            interaction = discord.Interaction(data=payload, state=bot._connection)
+            await bot.process_application_commands(interaction)
+
+        router = InteractionRouter(
+            process_index,
+            settings.shard_processes,
+            settings.shard_router_host,
+            settings.shard_router_port,
+            handle_forwarded,
+        )
 
     # Event handlers
     @bot.event
     async def on_ready():
         """Called when the bot is ready."""
+        conversation_manager.start()
+        openai_client.start()
+        commands_cog = bot.get_cog("DiscordCommands")
+        if commands_cog is not None and commands_cog.batch_processor is not None:
+            commands_cog.batch_processor.start()
+        if router is not None:
+            try:
+                await router.start()
+            except OSError as e:
+                logger.error(f"Failed to start shard router: {e}")
+        if metrics_server is not None:
+            try:
+                await metrics_server.start()
+            except OSError as e:
+                logger.error(f"Failed to start metrics server: {e}")
         logger.info(f"Bot is ready! Logged in as {bot.user}")
         logger.info(f"Bot ID: {bot.user.id}")
         logger.info("Registered commands:")
         for command in bot.pending_application_commands:
             logger.info(f"  /{command.name}")
 
+    @bot.event
+    async def on_interaction(interaction: discord.Interaction):
+        """Handle interactions here, or forward them to the user's owner process."""
+        if router is not None:
+            try:
+                # Private, the gateway payload handle_forwarded rebuilds it from
+                if await router.route(interaction._raw_data):
+                    return
+            except ForwardLost as e:
+                logger.error(str(e))
+                try:
+                    await interaction.response.send_message(
+                        FORWARD_LOST_MESSAGE, ephemeral=True
+                    )
+                except discord.HTTPException:
+                    # The owner got it after all and has responded
+                    pass
+                return
+        await bot.process_application_commands(interaction)
+
+    @bot.event
+    async def on_message(message: discord.Message):
+        """Answer plain DMs, or forward them to the user's owner process."""
+        if not settings.dm_chat or message.author.bot or not message.content:
+            return
+        if not isinstance(message.channel, discord.DMChannel):
+            return
+        if router is not None:
+            try:
+                if await router.route(direct_message_payload(message)):
+                    return
+            except ForwardLost as e:
+                logger.error(str(e))
+                await message.channel.send(FORWARD_LOST_MESSAGE)
+                return
+        commands_cog = bot.get_cog("DiscordCommands")
+        await commands_cog.handle_direct_message(
+            message.author.id, message, message.content
+        )
+
     @bot.event
     async def on_application_command_error(
         ctx: discord.ApplicationContext, error: Exception
@@ -66,5 +187,7 @@ def create_bot(settings: Settings) -> commands.Bot:
     # Store references for cleanup
     bot.conversation_manager = conversation_manager
     bot.openai_client = openai_client
+    bot.metrics_server = metrics_server
+    bot.router = router
 
     return bot
@@ -1,15 +1,67 @@
 """Discord bot commands."""
 
+import math
+import time
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
+
 import discord
 from discord import ApplicationContext, Option
 from discord.ext import commands
 
+from bot_discord.delivery import (
+    ReplyDestination,
+    StreamingMessageEditor,
+    send_response,
+)
 from config.settings import Settings
 from core.conversation import ConversationManager
-from core.openai_client import OpenAIClient
-from utils.logger import get_logger
+from core.drain import DrainGate
+from core.openai_client import OpenAIClient, StreamInterrupted
+from core.rate_limiter import OpenAIRateLimiter, RateLimiter
+from core.resilience import ERRORS
+from core.routing import Route
+from core.scheduler import SchedulerFull
+from core.summarizer import ConversationSummarizer
+from core.turns import MessageDebouncer, UserTurnQueue
+from utils.logger import get_logger, get_sampled_logger, redact_prompt
+from utils.metrics import Counter, Histogram
+
+if TYPE_CHECKING:
+    from core.batch import BatchJob, BatchProcessor
+    from core.memory import LongTermMemory
 
 logger = get_logger()
+# Per-request lines, subject to LOG_SAMPLE_RATES
+request_logger = get_sampled_logger()
+
+DEFER_LATENCY = Histogram(
+    "discordgpt_defer_latency_seconds", "Time to acknowledge a /gpt interaction"
+)
+REJECTIONS = Counter(
+    "discordgpt_rejections_total", "Prompts refused before deferring", ["reason"]
+)
+
+BUSY_MESSAGE = "⏳ I'm handling a lot of requests right now. Please try again shortly."
+UNAVAILABLE_MESSAGE = (
+    "⚠️ The AI service is temporarily unavailable. Please try again in a minute."
+)
+DRAINING_MESSAGE = "🔄 I'm restarting for an update. Please try again in a minute."
+INTERRUPTED_MESSAGE = (
+    "⚠️ My reply was cut off by an error, so I won't remember it. Please try again."
+)
+ERROR_MESSAGE = (
+    "❌ Sorry, I encountered an error while processing your request. Please try again."
+)
+FORWARD_LOST_MESSAGE = (
+    "⚠️ Your message may have been lost on its way to me. "
+    "If I don't answer, please send it again."
+)
+# Characters of a queued prompt quoted when its answer is delivered
+PROMPT_PREVIEW_CHARS = 100
+
+# A direct message, or a partial one forwarded from another shard process,
+# and its text
+DirectMessage = Tuple[Union[discord.Message, discord.PartialMessage], str]
 
 
 class DiscordCommands(commands.Cog):
@@ -26,11 +78,198 @@ class DiscordCommands(commands.Cog):
         self.conversation_manager = conversation_manager
         self.openai_client = openai_client
         self.settings = settings
+        self.user_limiter: Optional[RateLimiter] = None
+        if settings.rate_limit_per_user:
+            self.user_limiter = RateLimiter(settings.rate_limit_per_user)
+        self.openai_limiter = OpenAIRateLimiter(
+            settings.openai_rpm_limit, settings.openai_tpm_limit
+        )
+        self.turns = UserTurnQueue(settings.turn_policy, settings.max_queued_turns)
+        # Requests being answered, which shutdown waits for
+        self.drain = DrainGate()
+        self.dm_debouncer = MessageDebouncer(
+            self._answer_direct_messages,
+            settings.dm_debounce_delay,
+            settings.dm_debounce_max_delay,
+        )
+        self.summarizer: Optional[ConversationSummarizer] = None
+        if settings.summarization:
+            self.summarizer = ConversationSummarizer(
+                conversation_manager,
+                openai_client,
+                threshold=settings.summarize_after_messages,
+                batch_size=settings.summarize_batch_size,
+                max_tokens=settings.summary_max_tokens,
+            )
+        self.memory: Optional["LongTermMemory"] = None
+        if settings.long_term_memory:
+            # Imported here so NumPy is only loaded when memory is enabled
+            from core.memory import create_long_term_memory
+
+            self.memory = create_long_term_memory(settings, openai_client)
+        self.batch_processor: Optional["BatchProcessor"] = None
+        if settings.batch_mode:
+            from core.batch import create_batch_processor
+
+            self.batch_processor = create_batch_processor(
+                settings, openai_client, self._deliver_batch_answer
+            )
 
     def _is_dm(self, ctx: ApplicationContext) -> bool:
         """Check if the command is used in a DM."""
         return isinstance(ctx.channel, discord.DMChannel)
 
+    def in_flight(self) -> int:
+        """Count accepted requests not yet answered, including waiting DMs."""
+        return self.drain.active + len(self.dm_debouncer)
+
+    def _check_draining(self) -> Optional[str]:
+        """Get the rejection for new requests while shutting down, if any."""
+        if not self.drain.draining:
+            return None
+        REJECTIONS.labels("draining").inc()
+        return DRAINING_MESSAGE
+
+    def _check_admission(self, user_id: int, prompt: str) -> Optional[str]:
+        """
+        Decide whether to accept a prompt, reserving rate limit capacity.
+
+        Returns:
+            A rejection message, or None if the prompt may proceed
+        """
+        rejection = self.turns.check(user_id)
+        if rejection:
+            REJECTIONS.labels("turn").inc()
+            return rejection
+        if self.openai_client.circuit_open():
+            REJECTIONS.labels("circuit_open").inc()
+            return UNAVAILABLE_MESSAGE
+        if self.openai_client.scheduler.is_full():
+            REJECTIONS.labels("queue_full").inc()
+            return BUSY_MESSAGE
+
+        if self.user_limiter is not None:
+            retry_after = self.user_limiter.check(user_id)
+            if retry_after:
+                REJECTIONS.labels("user_rate_limit").inc()
+                return (
+                    "⏳ You're sending messages too fast. "
+                    f"Please try again in {math.ceil(retry_after)} seconds."
+                )
+
+        # Mirror OpenAI's accounting: prompt tokens plus max_tokens
+        tokens = (
+            self.conversation_manager.get_token_count(user_id)
+            + self.conversation_manager.token_counter.count_message(prompt)
+            + self.settings.max_response_tokens
+        )
+        retry_after = self.openai_limiter.check(tokens)
+        if retry_after:
+            REJECTIONS.labels("openai_rate_limit").inc()
+            return (
+                "⏳ I'm handling a lot of requests right now. "
+                f"Please try again in {math.ceil(retry_after)} seconds."
+            )
+        return None
+
+    async def _stream_response(
+        self, destination, user_id: int, messages: List[dict], route: Route
+    ) -> str:
+        """Stream a completion into a progressively edited message."""
+        editor = StreamingMessageEditor(
+            destination,
+            self.settings.stream_edit_interval,
+            self.settings.response_attachment_threshold,
+        )
+        stream = self.openai_client.stream_chat_completion(messages, user_id, route)
+        try:
+            async for delta in stream:
+                await editor.push(delta)
+        except StreamInterrupted:
+            # Show everything that arrived before telling the user
+            await editor.finish()
+            raise
+        finally:
+            # If an edit fails, release the connection and scheduler slot now
+            # rather than whenever the generator is garbage collected
+            await stream.aclose()
+        return await editor.finish()
+
+    async def _run_turn(self, destination, user_id: int, prompt: str) -> None:
+        """
+        Get a completion for a prompt and send it to the user.
+
+        Args:
+            destination: Where replies are sent, such as an interaction's
+                followup webhook or a ReplyDestination
+            user_id: User the prompt is from
+            prompt: The user's message
+        """
+        # Evicting the conversation mid-turn would lose the reply's context
+        with self.conversation_manager.pinned(user_id):
+            # Load stored history on first use, then add the user message
+            await self.conversation_manager.load_conversation(user_id)
+            recalled = None
+            if self.memory is not None:
+                # Turns in the prompt window are sent already, those older are
+                # only reachable through memory. A window starting with a
+                # reply counts its turn as sent.
+                window = self.conversation_manager.get_window_count(user_id)
+                recalled = await self.memory.recall(user_id, prompt, (window + 1) // 2)
+            self.conversation_manager.add_message(user_id, "user", prompt)
+
+            # Get conversation history
+            messages = self.conversation_manager.get_messages(user_id, recalled)
+            route = self.openai_client.route(
+                len(prompt), self.conversation_manager.get_token_count(user_id)
+            )
+
+            # Get AI response and send it to the user
+            try:
+                if self.settings.stream_responses:
+                    response = await self._stream_response(
+                        destination, user_id, messages, route
+                    )
+                else:
+                    response = await self.openai_client.get_chat_completion(
+                        messages, user_id, route=route
+                    )
+                    if response:
+                        await send_response(
+                            destination,
+                            response,
+                            self.settings.response_attachment_threshold,
+                        )
+            except SchedulerFull:
+                await destination.send(BUSY_MESSAGE)
+                logger.warning(f"Shed request for user {user_id}, queue is full")
+                return
+            except StreamInterrupted:
+                # The partial reply stays out of history, memory and summaries
+                await destination.send(INTERRUPTED_MESSAGE)
+                logger.warning(f"Stream for user {user_id} was cut off")
+                return
+
+            if response:
+                # Add assistant response to conversation
+                self.conversation_manager.add_message(user_id, "assistant", response)
+                self.conversation_manager.set_served_model(user_id, route.model)
+                if self.memory is not None:
+                    self.memory.remember(user_id, prompt, response)
+                request_logger.info(
+                    "Sent response to user {user_id} from {model} ({reason})",
+                    user_id=user_id,
+                    model=route.model,
+                    reason=route.reason,
+                )
+
+                # Summarize older history in the background, off the reply path
+                if self.summarizer is not None:
+                    self.summarizer.maybe_summarize(user_id)
+            else:
+                await destination.send(ERROR_MESSAGE)
+                logger.error(f"Failed to get response for user {user_id}")
+
     @discord.slash_command(name="gpt", description="Chat with GPT AI assistant")
     async def gpt(
         self,
@@ -54,38 +293,233 @@ class DiscordCommands(commands.Cog):
             )
             return
 
+        # Rejections are sent before deferring so they stay fast and ephemeral
+        user_id = ctx.author.id
+        rejection = self._check_draining() or self._check_admission(user_id, prompt)
+        if rejection:
+            await ctx.respond(rejection, ephemeral=True)
+            request_logger.info("Rejected prompt from user {user_id}", user_id=user_id)
+            return
+
+        with self.drain.track():
+            await self._answer_prompt(ctx, user_id, prompt)
+
+    async def _answer_prompt(
+        self, ctx: ApplicationContext, user_id: int, prompt: str
+    ) -> None:
+        """Defer a /gpt interaction and answer its prompt in the user's turn."""
+        started_at = time.monotonic()
         await ctx.defer()
+        DEFER_LATENCY.observe(time.monotonic() - started_at)
 
         try:
-            user_id = ctx.author.id
-            logger.info(f"User {user_id} sent prompt: {prompt[:50]}...")
+            request_logger.info(
+                "User {user_id} sent prompt: {prompt}",
+                user_id=user_id,
+                prompt=redact_prompt(prompt),
+            )
 
-            # Add user message to conversation
-            self.conversation_manager.add_message(user_id, "user", prompt)
+            # Turns for the same user run one at a time, in order
+            async with self.turns.turn(user_id, prompt) as turn_prompt:
+                if turn_prompt is None:
+                    await ctx.followup.send(
+                        "📎 Merged with your previous message, "
+                        "I'll answer them together."
+                    )
+                    return
+                await self._run_turn(ctx.followup, user_id, turn_prompt)
 
-            # Get conversation history
-            messages = self.conversation_manager.get_messages(user_id)
+        except Exception as e:
+            ERRORS.labels("command").inc()
+            logger.error(f"Error in /gpt command: {e}")
+            await ctx.followup.send(
+                "❌ An unexpected error occurred. Please try again later."
+            )
 
-            # Get AI response
-            response = await self.openai_client.get_chat_completion(messages)
+    async def handle_direct_message(
+        self,
+        user_id: int,
+        message: Union[discord.Message, discord.PartialMessage],
+        content: str,
+    ) -> None:
+        """
+        Answer a plain DM, like /gpt but without the interaction round trips.
+
+        Messages a user sends in quick succession are merged and answered
+        together, in a reply to the last of them.
+
+        Args:
+            user_id: Author of the message
+            message: The message, or a partial one when it was forwarded from
+                another shard process
+            content: Text of the message
+        """
+        rejection = self._check_draining()
+        if rejection:
+            await ReplyDestination(message).send(rejection)
+            request_logger.info("Rejected DM from user {user_id}", user_id=user_id)
+            return
+        self.dm_debouncer.push(user_id, (message, content))
+
+    async def _answer_direct_messages(
+        self, user_id: int, items: List[DirectMessage]
+    ) -> None:
+        """Run one turn for a burst of DMs from a user."""
+        # Tracked from the start, so a flushed burst is in flight until answered
+        with self.drain.track():
+            await self._answer_burst(user_id, items)
+
+    async def _answer_burst(self, user_id: int, items: List[DirectMessage]) -> None:
+        message = items[-1][0]
+        destination = ReplyDestination(message)
+        prompt = "\n\n".join(content for _, content in items)
+        if len(prompt) > self.settings.max_prompt_length:
+            await destination.send(
+                "❌ Message too long! Maximum length is "
+                f"{self.settings.max_prompt_length} characters."
+            )
+            return
+        rejection = self._check_admission(user_id, prompt)
+        if rejection:
+            await destination.send(rejection)
+            request_logger.info("Rejected DM from user {user_id}", user_id=user_id)
+            return
 
-            if response:
-                # Add assistant response to conversation
+        try:
+            request_logger.info(
+                "User {user_id} sent {count} DM(s): {prompt}",
+                user_id=user_id,
+                count=len(items),
+                prompt=redact_prompt(prompt),
+            )
+            async with self.turns.turn(user_id, prompt) as turn_prompt:
+                if turn_prompt is None:
+                    # Answered together with the turn it was merged into
+                    return
+                async with message.channel.typing():
+                    await self._run_turn(destination, user_id, turn_prompt)
+
+        except Exception as e:
+            ERRORS.labels("direct_message").inc()
+            logger.error(f"Error answering DM: {e}")
+            await destination.send(
+                "❌ An unexpected error occurred. Please try again later."
+            )
+
+    async def _deliver_batch_answer(
+        self, job: "BatchJob", response: Optional[str]
+    ) -> None:
+        """Add a queued prompt's answer to the user's history and DM it."""
+        user_id, prompt = job.user_id, job.prompt
+        preview = prompt[:PROMPT_PREVIEW_CHARS]
+        if len(prompt) > PROMPT_PREVIEW_CHARS:
+            preview += "…"
+        user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+
+        # Between the user's turns, so it doesn't split a prompt from its reply
+        async with self.turns.hold(user_id):
+            with self.conversation_manager.pinned(user_id):
+                await self.conversation_manager.load_conversation(user_id)
+                # Claimed last, so a /reset until here discards the answer
+                if not await self.batch_processor.claim(job):
+                    return
+                if response is None:
+                    await user.send(
+                        "❌ Sorry, I couldn't answer your queued prompt:\n"
+                        f"> {preview}\nPlease try again."
+                    )
+                    return
+
+                self.conversation_manager.add_message(user_id, "user", prompt)
                 self.conversation_manager.add_message(user_id, "assistant", response)
+                if self.memory is not None:
+                    self.memory.remember(user_id, prompt, response)
+                await user.send(
+                    f"📬 Here's the answer to your queued prompt:\n> {preview}"
+                )
+                await send_response(
+                    user, response, self.settings.response_attachment_threshold
+                )
+        request_logger.info("Sent batch response to user {user_id}", user_id=user_id)
 
-                # Send response to user
-                await ctx.followup.send(response)
-                logger.info(f"Sent response to user {user_id}")
-            else:
+    @discord.slash_command(
+        name="batch",
+        description="Queue a prompt to be answered later by DM, at lower cost",
+    )
+    async def batch(
+        self,
+        ctx: ApplicationContext,
+        prompt: Option(str, "Your message to GPT", required=True),
+    ):
+        """Handle /batch command to queue a prompt for the Batch API."""
+        if not self._is_dm(ctx):
+            await ctx.respond(
+                "❌ This bot only works in Direct Messages. Please DM me!",
+                ephemeral=True,
+            )
+            return
+        if self.batch_processor is None:
+            await ctx.respond(
+                "❌ Queued prompts aren't enabled. Use `/gpt` instead.",
+                ephemeral=True,
+            )
+            return
+        if len(prompt) > self.settings.max_prompt_length:
+            await ctx.respond(
+                "❌ Prompt too long! Maximum length is "
+                f"{self.settings.max_prompt_length} characters.",
+                ephemeral=True,
+            )
+            return
+        rejection = self._check_draining()
+        if rejection:
+            await ctx.respond(rejection, ephemeral=True)
+            return
+
+        user_id = ctx.author.id
+        with self.drain.track():
+            await self._queue_prompt(ctx, user_id, prompt)
+
+    async def _queue_prompt(
+        self, ctx: ApplicationContext, user_id: int, prompt: str
+    ) -> None:
+        """Queue a /batch prompt, or tell the user why it wasn't."""
+        # The job queue and history are on disk, which may take longer than
+        # Discord allows before the interaction is acknowledged
+        await ctx.defer(ephemeral=True)
+        try:
+            pending = await self.batch_processor.pending(user_id)
+            if pending >= self.settings.batch_max_jobs_per_user:
+                REJECTIONS.labels("batch_limit").inc()
                 await ctx.followup.send(
-                    "❌ Sorry, I encountered an error while processing your request. Please try again."
+                    f"⏳ You already have {pending} queued prompts. "
+                    "Please wait for their answers first.",
+                    ephemeral=True,
                 )
-                logger.error(f"Failed to get response for user {user_id}")
+                return
+
+            # The prompt is answered in the context of the conversation so far,
+            # and joins the history only once its answer arrives
+            await self.conversation_manager.load_conversation(user_id)
+            messages = self.conversation_manager.get_messages(user_id)
+            messages.append({"role": "user", "content": prompt})
+            await self.batch_processor.enqueue(user_id, prompt, messages)
+            await ctx.followup.send(
+                "📥 Queued! I'll send you the answer in a DM when it's ready, "
+                "usually within a few hours."
+            )
+            request_logger.info(
+                "User {user_id} queued prompt: {prompt}",
+                user_id=user_id,
+                prompt=redact_prompt(prompt),
+            )
 
         except Exception as e:
-            logger.error(f"Error in /gpt command: {e}")
+            ERRORS.labels("command").inc()
+            logger.error(f"Error in /batch command: {e}")
             await ctx.followup.send(
-                "❌ An unexpected error occurred. Please try again later."
+                "❌ An error occurred while queueing. Please try again.",
+                ephemeral=True,
             )
 
     @discord.slash_command(name="reset", description="Clear your conversation history")
@@ -100,8 +534,21 @@ class DiscordCommands(commands.Cog):
 
         try:
             user_id = ctx.author.id
+            discarded = 0
+            if self.batch_processor is not None:
+                # The job queue is on disk, so acknowledge the interaction first
+                await ctx.defer()
+                # Their answers would build on the history being cleared. Done
+                # first, so an answer being delivered is either dropped or
+                # added before the reset.
+                discarded = await self.batch_processor.discard(user_id)
             self.conversation_manager.reset_conversation(user_id)
-            await ctx.respond("✅ Your conversation history has been cleared!")
+            if self.memory is not None:
+                self.memory.forget(user_id)
+            message = "✅ Your conversation history has been cleared!"
+            if discarded:
+                message += f" {discarded} queued prompt(s) were cancelled."
+            await ctx.respond(message)
             logger.info(f"Reset conversation for user {user_id}")
 
         except Exception as e:
@@ -117,6 +564,9 @@ class DiscordCommands(commands.Cog):
 `/gpt <prompt>` - Chat with the AI assistant
 Send any message or question to get an AI response.
 
+`/batch <prompt>` - Queue a prompt that isn't urgent
+The answer arrives later in a DM, and joins your conversation then.
+
 `/reset` - Clear your conversation history
 Start fresh with a new conversation.
 
@@ -143,14 +593,25 @@ See how many messages are in your current conversation.
 
         try:
             user_id = ctx.author.id
+            await self.conversation_manager.load_conversation(user_id, create=False)
             message_count = self.conversation_manager.get_message_count(user_id)
             max_messages = self.settings.max_conversation_messages
+            token_count = self.conversation_manager.get_token_count(user_id)
+            max_tokens = self.settings.max_prompt_tokens
+            model = (
+                self.conversation_manager.get_served_model(user_id)
+                or self.settings.openai_model
+            )
+            prompt_tokens, cached_tokens = self.openai_client.prompt_cache.get(user_id)
+            cache_rate = cached_tokens / prompt_tokens if prompt_tokens else 0.0
 
             usage_text = f"""
 **Conversation Statistics** 📊
 
 Messages in history: {message_count}/{max_messages}
-Model: {self.settings.openai_model}
+Prompt tokens: {token_count}/{max_tokens}
+Model: {model}
+Cached prompt tokens: {cached_tokens:,}/{prompt_tokens:,} ({cache_rate:.0%})
 
 Your conversation history is maintained across messages.
 Use `/reset` to clear it.
@@ -0,0 +1,287 @@
+"""Delivery of responses as Discord messages, split to fit the message limit."""
+
+import io
+import time
+from typing import Iterator, List, Optional, Tuple, Union
+
+import discord
+
+from utils.metrics import Histogram
+
+DISCORD_SEND_LATENCY = Histogram(
+    "discordgpt_discord_send_latency_seconds",
+    "Time to send or edit a Discord message",
+    ["operation"],
+)
+
+# Discord rejects message content longer than this
+DISCORD_MESSAGE_LIMIT = 2000
+
+ATTACHMENT_MESSAGE = "📎 The response is long, so here it is as a file."
+CONTINUED_ATTACHMENT_MESSAGE = "📎 The response is long, so the rest is in a file."
+ATTACHMENT_FILENAME = "response.md"
+
+FENCE = "```"
+CLOSE_FENCE = "\n```"
+# Longer fence info strings are cut, so reopening a fence never eats a chunk
+MAX_FENCE_INFO = 20
+
+# Preferred places to split, best first. A split is only taken if it keeps at
+# least half of the chunk, otherwise the next kind of boundary is tried.
+BOUNDARIES = ("\n\n", "\n", ". ", " ")
+
+
+def _open_fence(fence: Optional[str]) -> str:
+    return "" if fence is None else f"{FENCE}{fence}\n"
+
+
+def _fence_after(text: str, fence: Optional[str]) -> Optional[str]:
+    """
+    Track code fences through text.
+
+    Args:
+        text: Markdown text
+        fence: Info string of the fence open before text, or None
+
+    Returns:
+        Info string of the fence still open after text, or None
+    """
+    if FENCE not in text:
+        return fence
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if stripped.startswith(FENCE):
+            fence = None if fence is not None else stripped[3:].strip()[:MAX_FENCE_INFO]
+    return fence
+
+
+def _code_start(text: str, fence: Optional[str]) -> Optional[int]:
+    """
+    Find where the code of the fence open after text starts.
+
+    Returns:
+        The index just past the line opening the fence, 0 if it was opened
+        before text, or None if no fence is open after text
+    """
+    start = 0 if fence is not None else None
+    position = 0
+    for line in text.split("\n"):
+        position += len(line) + 1
+        if line.strip().startswith(FENCE):
+            start = min(position, len(text)) if start is None else None
+    return start
+
+
+def _find_split(window: str, code_start: Optional[int] = None) -> int:
+    """
+    Get the index to split window at, preferring markdown boundaries.
+
+    Inside a code block, which starts at code_start, only line breaks after
+    its first line are used, anywhere in the window, since any other split
+    would break a line of code in two. Without one, the line is split hard,
+    rather than sending an empty code block.
+    """
+    if code_start is not None:
+        index = window.rfind("\n", code_start)
+        return index if index > code_start else len(window)
+    for boundary in BOUNDARIES:
+        index = window.rfind(boundary)
+        if index >= len(window) // 2:
+            # Sentences keep their full stop
+            return index + 1 if boundary == ". " else index
+    return len(window)
+
+
+def take_chunk(
+    text: str, fence: Optional[str] = None, limit: int = DISCORD_MESSAGE_LIMIT
+) -> Tuple[str, int, Optional[str]]:
+    """
+    Take the first message's worth of text.
+
+    A code fence open at the split is closed at the end of the chunk and
+    reopened, with the same language, at the start of the next one.
+
+    Args:
+        text: Remaining response text
+        fence: Info string of the fence open before text, or None
+        limit: Maximum message length
+
+    Returns:
+        The message content, how many characters of text it used, and the
+        fence open after them
+    """
+    opening = _open_fence(fence)
+    if len(opening) + len(text) <= limit:
+        return opening + text, len(text), _fence_after(text, fence)
+
+    window = text[: limit - len(opening) - len(CLOSE_FENCE)]
+    split = _find_split(window, _code_start(window, fence))
+    body = text[:split]
+    after = _fence_after(body, fence)
+
+    if after is None:
+        content = opening + body.rstrip()
+        rest = text[split:].lstrip()
+    else:
+        # Indentation matters inside code, so only newlines are trimmed
+        content = opening + body.rstrip("\n") + CLOSE_FENCE
+        rest = text[split:].lstrip("\n")
+    return content, len(text) - len(rest), after
+
+
+def split_message(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> Iterator[str]:
+    """Split text into messages of at most limit characters, lazily."""
+    fence = None
+    while text:
+        content, used, fence = take_chunk(text, fence, limit)
+        text = text[used:]
+        if content.strip():
+            yield content
+
+
+async def _timed(operation: str, call):
+    started_at = time.monotonic()
+    result = await call
+    DISCORD_SEND_LATENCY.labels(operation).observe(time.monotonic() - started_at)
+    return result
+
+
+class ReplyDestination:
+    """Send messages as replies to a message, like an interaction's followups."""
+
+    __slots__ = ("message",)
+
+    def __init__(self, message: Union[discord.Message, discord.PartialMessage]):
+        self.message = message
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> discord.Message:
+        """Reply to the message without pinging its author."""
+        return await self.message.reply(content, mention_author=False, **kwargs)
+
+
+def _response_file(text: str) -> discord.File:
+    return discord.File(io.BytesIO(text.encode("utf-8")), filename=ATTACHMENT_FILENAME)
+
+
+async def send_attachment(destination, text: str) -> None:
+    """Send a response as a markdown file, to a destination like send_response's."""
+    file = _response_file(text)
+    await _timed("send", destination.send(ATTACHMENT_MESSAGE, file=file))
+
+
+async def send_response(destination, text: str, attachment_threshold: int = 0) -> None:
+    """
+    Send a complete response as one or more messages.
+
+    Chunks are sent in order, each as soon as the previous one is accepted;
+    py-cord waits out Discord's rate limits between them.
+
+    Args:
+        destination: Anything with a send method, such as an interaction's
+            followup webhook, a user or a ReplyDestination
+        text: Response text
+        attachment_threshold: Length above which the response is sent as a
+            file instead, 0 to always send messages
+    """
+    if attachment_threshold and len(text) > attachment_threshold:
+        await send_attachment(destination, text)
+        return
+    for chunk in split_message(text):
+        await _timed("send", destination.send(chunk))
+
+
+class StreamingMessageEditor:
+    """
+    Coalesce streamed deltas into throttled edits of a sent message.
+
+    Messages go to any destination send_response accepts. Text that no
+    longer fits in one message is split the same way: finished chunks are
+    posted while the rest is still being generated, and the overflow
+    continues in a new message. Past attachment_threshold characters no more
+    chunks are posted, and once the stream ends the text not yet posted is
+    attached as a file, in place of the message showing it.
+    """
+
+    def __init__(
+        self,
+        destination,
+        interval: float,
+        attachment_threshold: int = 0,
+    ):
+        self.destination = destination
+        self.interval = interval
+        self.attachment_threshold = attachment_threshold
+        self.message: Optional[discord.Message] = None
+        self._parts: List[str] = []
+        self._length = 0
+        # Where the text of the current message starts, and the fence open there
+        self._start = 0
+        self._fence: Optional[str] = None
+        self._rendered = ""
+        self._last_edit = 0.0
+        self._attaching = False
+
+    def _text(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    async def _show(self, content: str) -> None:
+        """Send or edit the current message."""
+        if self.message is None:
+            self.message = await _timed("send", self.destination.send(content))
+        else:
+            await _timed("edit", self.message.edit(content=content))
+        self._rendered = content
+        self._last_edit = time.monotonic()
+
+    async def _flush(self) -> None:
+        """Post finished chunks, then show the rest in the current message."""
+        text = self._text()
+        while True:
+            remaining = text[self._start :]
+            opening = _open_fence(self._fence)
+            if len(opening) + len(remaining) <= DISCORD_MESSAGE_LIMIT:
+                break
+            if self._attaching:
+                return
+            content, used, self._fence = take_chunk(remaining, self._fence)
+            await self._show(content)
+            self.message = None
+            self._start += used
+
+        content = opening + remaining
+        if not content.strip() or content == self._rendered:
+            return
+        await self._show(content)
+
+    async def push(self, delta: str) -> None:
+        """Buffer a delta and edit the message if the interval has elapsed."""
+        self._parts.append(delta)
+        self._length += len(delta)
+        if self.attachment_threshold and self._length > self.attachment_threshold:
+            self._attaching = True
+
+        # The first delta is shown immediately, later ones are coalesced
+        elapsed = time.monotonic() - self._last_edit
+        if self.message is None or elapsed >= self.interval:
+            await self._flush()
+
+    async def finish(self) -> str:
+        """Deliver any pending text and return the full response."""
+        if self._attaching:
+            await self._attach()
+        else:
+            await self._flush()
+        return self._text()
+
+    async def _attach(self) -> None:
+        """Attach the text not in a posted chunk, which isn't repeated."""
+        rest = _open_fence(self._fence) + self._text()[self._start :]
+        content = CONTINUED_ATTACHMENT_MESSAGE if self._start else ATTACHMENT_MESSAGE
+        file = _response_file(rest)
+        if self.message is None:
+            await _timed("send", self.destination.send(content, file=file))
+        else:
+            # It shows the start of the rest, which is in the file
+            await _timed("edit", self.message.edit(content=content, file=file))
@@ -0,0 +1,154 @@
+"""Running the bot until a shutdown signal, then draining and closing it."""
+
+import asyncio
+import signal
+import time
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from discord.ext import commands
+
+from utils.logger import get_logger
+
+logger = get_logger()
+
+# Seconds between checks for in-flight requests while draining
+DRAIN_POLL_INTERVAL = 0.1
+
+
+class BotLifecycle:
+    """
+    Run the bot until it is told to stop, without dropping accepted requests.
+
+    Client.run replaces signal handlers with one that stops the loop and
+    cancels every task, so the bot is started on its own loop instead, with
+    the loop's own signal handlers. On the first signal new prompts get a
+    quick "try again" reply while those already accepted are answered, for up
+    to drain_timeout seconds. Then everything is closed, dependents first:
+    background workers, conversations (with their final flush), the metrics
+    server, the OpenAI HTTP pool and last the Discord gateway. A second signal
+    stops waiting for in-flight requests.
+    """
+
+    def __init__(
+        self,
+        bot: commands.Bot,
+        drain_timeout: float = 25.0,
+        signals: Sequence[int] = (signal.SIGINT, signal.SIGTERM),
+    ):
+        self.bot = bot
+        self.drain_timeout = drain_timeout
+        self.signals = signals
+        # Created on the bot's loop, which Python 3.9 needs for events
+        self._stopping: Optional[asyncio.Event] = None
+        self._forced = False
+
+    def run(self, token: str) -> None:
+        """Run the bot on its event loop until it has shut down."""
+        loop = self.bot.loop
+        try:
+            loop.run_until_complete(self._serve(token))
+        finally:
+            # Tasks the shutdown didn't end, like gateway reconnects
+            tasks = [task for task in asyncio.all_tasks(loop) if not task.done()]
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    def stop(self, signum: Optional[int] = None) -> None:
+        """Start shutting down, or when already draining, stop waiting."""
+        if self._stopping.is_set():
+            logger.warning("Stopping without waiting for in-flight requests")
+            self._forced = True
+            return
+        name = signal.Signals(signum).name if signum is not None else "stop"
+        logger.info(f"Received {name}, draining in-flight requests...")
+        self._stopping.set()
+
+    def _add_signal_handlers(self, loop: asyncio.AbstractEventLoop) -> None:
+        for signum in self.signals:
+            try:
+                loop.add_signal_handler(signum, self.stop, signum)
+            except NotImplementedError:
+                # Windows event loops have no signal handlers, so hand the
+                # signal over to the loop from the handler thread
+                signal.signal(
+                    signum,
+                    lambda number, _: loop.call_soon_threadsafe(self.stop, number),
+                )
+
+    async def _serve(self, token: str) -> None:
+        self._stopping = asyncio.Event()
+        self._add_signal_handlers(asyncio.get_running_loop())
+        bot_task = asyncio.create_task(self.bot.start(token))
+        stop_task = asyncio.create_task(self._stopping.wait())
+        await asyncio.wait({bot_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+        stop_task.cancel()
+        await self.shutdown()
+        # Closing the gateway ends start(), which raises if login failed
+        await bot_task
+
+    async def drain(self) -> None:
+        """Reject new requests and wait for accepted ones to be answered."""
+        commands_cog = self.bot.get_cog("DiscordCommands")
+        if commands_cog is None:
+            return
+        commands_cog.drain.close()
+        # DMs waiting to be merged with more are already accepted
+        commands_cog.dm_debouncer.flush()
+
+        deadline = time.monotonic() + self.drain_timeout
+        while commands_cog.in_flight() and not self._forced:
+            if time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)
+        remaining = commands_cog.in_flight()
+        if remaining:
+            logger.warning(f"Shutting down with {remaining} requests unanswered")
+            # Before they fail, and retry, against clients closed below
+            await commands_cog.drain.cancel()
+        else:
+            logger.info("In-flight requests drained")
+
+    def _closers(self) -> List[Tuple[str, Callable[[], Awaitable[None]]]]:
+        """Get what to close, in order, each after everything that uses it."""
+        bot = self.bot
+        commands_cog = bot.get_cog("DiscordCommands")
+        closers = []
+        # Forwarded interactions still being handled use everything below
+        if getattr(bot, "router", None) is not None:
+            closers.append(("interaction router", bot.router.close))
+        if commands_cog is not None:
+            closers.append(("DM debouncer", commands_cog.dm_debouncer.close))
+            for name in ("summarizer", "memory", "batch_processor"):
+                worker = getattr(commands_cog, name)
+                if worker is not None:
+                    closers.append((name.replace("_", " "), worker.close))
+        if hasattr(bot, "conversation_manager"):
+            closers.append(("conversation store", bot.conversation_manager.close))
+        if getattr(bot, "metrics_server", None) is not None:
+            closers.append(("metrics server", bot.metrics_server.close))
+        if hasattr(bot, "openai_client"):
+            closers.append(("OpenAI client", bot.openai_client.close))
+        closers.append(("Discord gateway", bot.close))
+        return closers
+
+    async def shutdown(self) -> None:
+        """Drain, then close everything, going on past any that fail."""
+        logger.info("Shutting down bot...")
+        try:
+            await self.drain()
+        except Exception as e:
+            logger.error(f"Error while draining: {e}")
+
+        for name, close in self._closers():
+            try:
+                await close()
+                logger.debug(f"Closed {name}")
+            except Exception as e:
+                logger.error(f"Error closing {name}: {e}")
+        logger.info("Bot closed successfully")
+
+        # Wait for background log sinks to write everything
+        await logger.complete()
@@ -0,0 +1,308 @@
+"""Sharded deployment: shard assignment and routing users to owner processes."""
+
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set
+
+from config.settings import Settings
+from utils.logger import get_logger
+
+logger = get_logger()
+
+# Interaction payloads are small, but prompts may push them past the default
+MAX_LINE_BYTES = 1024 * 1024
+
+# Line the owner sends back for each payload it has started handling
+ACK = b"+\n"
+
+# Seconds to wait for the owner's acknowledgement, well within the 3 seconds
+# Discord allows to answer an interaction
+ACK_TIMEOUT = 2.0
+
+
+class ForwardLost(Exception):
+    """
+    Raised when a payload was sent to its owner but not acknowledged.
+
+    The owner may or may not be handling it, so it must not be handled here
+    too; the user should be told to try again instead.
+    """
+
+
+def owner_of(user_id: int, processes: int) -> int:
+    """
+    Get the index of the process that owns a user's conversation.
+
+    Uses the timestamp part of the snowflake, like Discord's own shard
+    formula, since the low bits of user ids are far from uniform.
+    """
+    return (user_id >> 22) % processes
+
+
+def interaction_user_id(payload: Dict[str, Any]) -> Optional[int]:
+    """Get the id of the user who triggered a raw interaction payload."""
+    user = payload.get("user") or (payload.get("member") or {}).get("user")
+    return int(user["id"]) if user else None
+
+
+def direct_message_payload(message) -> Dict[str, Any]:
+    """
+    Describe a DM for forwarding to its owner process.
+
+    The user is under "user" like in interaction payloads, so the same
+    routing applies.
+    """
+    return {
+        "direct_message": True,
+        "id": str(message.id),
+        "channel_id": str(message.channel.id),
+        "user": {"id": str(message.author.id)},
+        "content": message.content,
+    }
+
+
+def shard_options(settings: Settings, process_index: int) -> Dict[str, Any]:
+    """
+    Get the AutoShardedBot shard arguments for a process.
+
+    With several processes, shards are dealt out round-robin and there is at
+    least one per process. A single process lets Discord recommend a count
+    unless SHARD_COUNT is set.
+    """
+    processes = settings.shard_processes
+    if processes > 1:
+        shard_count = max(settings.shard_count, processes)
+        return {
+            "shard_count": shard_count,
+            "shard_ids": list(range(process_index, shard_count, processes)),
+        }
+    if settings.shard_count:
+        return {"shard_count": settings.shard_count}
+    return {}
+
+
+def configure_shard_process(settings: Settings, process_index: int) -> None:
+    """
+    Adjust settings for one of several shard processes.
+
+    Global OpenAI limits are split evenly so the processes together stay
+    within them, each process serves metrics on its own port, and each keeps
+    its own batch job queue and conversation snapshot for the users it owns.
+    """
+    processes = settings.shard_processes
+    if settings.openai_rpm_limit:
+        settings.openai_rpm_limit = max(settings.openai_rpm_limit // processes, 1)
+    if settings.openai_tpm_limit:
+        settings.openai_tpm_limit = max(settings.openai_tpm_limit // processes, 1)
+    if settings.metrics_port:
+        settings.metrics_port += process_index
+    root, ext = os.path.splitext(settings.batch_db_path)
+    settings.batch_db_path = f"{root}.{process_index}{ext}"
+    settings.batch_path = os.path.join(settings.batch_path, str(process_index))
+    if settings.snapshot_path:
+        root, ext = os.path.splitext(settings.snapshot_path)
+        settings.snapshot_path = f"{root}.{process_index}{ext}"
+
+
+class _Peer:
+    """Connection to another process, and the forwards awaiting its ack."""
+
+    __slots__ = ("reader", "writer", "pending", "task")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        # Acks arrive in the order payloads were sent
+        self.pending: Deque[asyncio.Future] = deque()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def closed(self) -> bool:
+        return self.task.done() or self.reader.at_eof() or self.writer.is_closing()
+
+
+class InteractionRouter:
+    """
+    Forward interactions and DMs to the process that owns the user.
+
+    Discord delivers an interaction to whichever shard it chooses (DMs always
+    arrive on shard 0), so conversation state would otherwise be served by
+    several processes at once. Plain DMs are forwarded as
+    direct_message_payload descriptions. Each process listens on
+    base_port + index and the receiving process forwards the raw payload to
+    the user's owner, which acknowledges it once it has started handling it,
+    as if it came from its own gateway. Replies go through the interaction
+    webhook, so any process can send them.
+
+    If the owner can't be connected to, it isn't running, so the interaction
+    is handled locally rather than dropped; the shared store still holds the
+    user's history. Once a payload is sent, though, the owner may be handling
+    it, so a missing acknowledgement raises ForwardLost instead.
+
+    Rebuilding interactions from raw payloads relies on py-cord internals
+    (Interaction._raw_data and Bot._connection), checked against py-cord
+    2.6 and 2.7.
+    """
+
+    def __init__(
+        self,
+        process_index: int,
+        processes: int,
+        host: str,
+        base_port: int,
+        handler: Callable[[Dict[str, Any]], Awaitable[None]],
+    ):
+        self.process_index = process_index
+        self.processes = processes
+        self.host = host
+        self.base_port = base_port
+        self.handler = handler
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Dict[int, _Peer] = {}
+        self._connections: Set[asyncio.StreamWriter] = set()
+        self._peer_locks: Dict[int, asyncio.Lock] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.forwarded = 0
+        self.received = 0
+        self.lost = 0
+
+    async def start(self) -> None:
+        """Start accepting forwarded interactions. Calling it again does nothing."""
+        if self._server is not None:
+            return
+        self._server = await asyncio.start_server(
+            self._serve,
+            self.host,
+            self.base_port + self.process_index,
+            limit=MAX_LINE_BYTES,
+        )
+        logger.info(
+            f"Shard process {self.process_index}/{self.processes} routing on "
+            f"{self.host}:{self.base_port + self.process_index}"
+        )
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._connections.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.received += 1
+                task = asyncio.create_task(self._handle(json.loads(line)))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                writer.write(ACK)
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            logger.error(f"Shard routing connection failed: {e}")
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _handle(self, payload: Dict[str, Any]) -> None:
+        try:
+            await self.handler(payload)
+        except Exception as e:
+            logger.error(f"Failed to handle forwarded interaction: {e}")
+
+    async def _connect(self, owner: int) -> _Peer:
+        lock = self._peer_locks.setdefault(owner, asyncio.Lock())
+        async with lock:
+            peer = self._peers.get(owner)
+            if peer is None or peer.closed:
+                reader, writer = await asyncio.open_connection(
+                    self.host, self.base_port + owner
+                )
+                peer = _Peer(reader, writer)
+                peer.task = asyncio.create_task(self._read_acks(peer))
+                self._peers[owner] = peer
+            return peer
+
+    async def _read_acks(self, peer: _Peer) -> None:
+        """Resolve forwards as the owner acknowledges them, until it goes away."""
+        try:
+            while True:
+                line = await peer.reader.readline()
+                if not line:
+                    break
+                if peer.pending:
+                    acked = peer.pending.popleft()
+                    if not acked.done():
+                        acked.set_result(None)
+        except ConnectionError:
+            pass
+        finally:
+            peer.writer.close()
+            while peer.pending:
+                acked = peer.pending.popleft()
+                if not acked.done():
+                    acked.set_exception(ConnectionResetError("Connection closed"))
+
+    def _drop_peer(self, owner: int, peer: _Peer) -> None:
+        if self._peers.get(owner) is peer:
+            del self._peers[owner]
+        peer.writer.close()
+
+    async def route(self, payload: Dict[str, Any]) -> bool:
+        """
+        Forward an interaction to its owner if that is another process.
+
+        Returns:
+            True if the owner acknowledged it, False if it should be handled
+            here
+
+        Raises:
+            ForwardLost: If it was sent but the owner didn't acknowledge it
+        """
+        user_id = interaction_user_id(payload)
+        if user_id is None:
+            return False
+        owner = owner_of(user_id, self.processes)
+        if owner == self.process_index:
+            return False
+
+        try:
+            peer = await self._connect(owner)
+        except OSError as e:
+            logger.error(f"Shard process {owner} unreachable, handling locally: {e}")
+            return False
+
+        line = json.dumps(payload, separators=(",", ":")).encode("utf-8") + b"\n"
+        acked = asyncio.get_running_loop().create_future()
+        peer.pending.append(acked)
+        try:
+            peer.writer.write(line)
+            await peer.writer.drain()
+            await asyncio.wait_for(acked, ACK_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.lost += 1
+            self._drop_peer(owner, peer)
+            raise ForwardLost(
+                f"Shard process {owner} didn't acknowledge a forwarded payload: {e!r}"
+            ) from e
+
+        self.forwarded += 1
+        return True
+
+    async def close(self) -> None:
+        """Stop accepting interactions and finish the ones being handled."""
+        if self._server is not None:
+            self._server.close()
+            # Peers keep their connections open, so close them from this end
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        for peer in self._peers.values():
+            peer.writer.close()
+        readers = [peer.task for peer in self._peers.values()]
+        self._peers.clear()
+        await asyncio.gather(*readers, return_exceptions=True)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -6,5 +6,26 @@ Be friendly and professional in your interactions."""
 
 
 def get_system_prompt() -> str:
-    """Get the system prompt for conversations."""
+    """
+    Get the system prompt for conversations.
+
+    It starts every request, so keep it free of per-request content such as
+    timestamps or user names: any change to it invalidates OpenAI's prompt
+    cache for everything after it.
+    """
     return DEFAULT_SYSTEM_PROMPT
+
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+MEMORY_PREFIX = "Earlier parts of the conversation that may be relevant:\n"
+
+SUMMARIZE_PROMPT = """Update the running summary of a conversation between a user
+and an AI assistant. Keep facts, names, decisions and open questions that may
+matter later. Be concise. Reply with the updated summary only.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
@@ -2,11 +2,6 @@
 
 import os
 
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
 
 class Settings:
     """Application settings loaded from environment variables."""
@@ -16,12 +11,165 @@ class Settings:
         self.discord_token = os.getenv("DISCORD_TOKEN", "")
         self.openai_api_key = os.getenv("OPENAI_API_KEY", "")
         self.openai_model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        self.openai_base_url = os.getenv("OPENAI_BASE_URL") or None
         self.max_conversation_messages = int(
             os.getenv("MAX_CONVERSATION_MESSAGES", "20")
         )
         self.max_response_tokens = int(os.getenv("MAX_RESPONSE_TOKENS", "1000"))
+        self.max_prompt_tokens = int(os.getenv("MAX_PROMPT_TOKENS", "4000"))
         self.max_prompt_length = int(os.getenv("MAX_PROMPT_LENGTH", "2000"))
         self.rate_limit_per_user = int(os.getenv("RATE_LIMIT_PER_USER", "10"))
+        self.openai_rpm_limit = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+        self.openai_tpm_limit = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+        self.openai_max_in_flight = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "16"))
+        self.openai_max_queue = int(os.getenv("OPENAI_MAX_QUEUE", "100"))
+
+        # HTTP connection pool for OpenAI requests
+        self.openai_max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))
+        self.openai_max_keepalive_connections = int(
+            os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "16")
+        )
+        self.openai_keepalive_expiry = float(
+            os.getenv("OPENAI_KEEPALIVE_EXPIRY", "120.0")
+        )
+        self.openai_http2 = os.getenv("OPENAI_HTTP2", "false").lower() == "true"
+        self.openai_connect_timeout = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5.0"))
+        self.openai_warmup_connections = int(
+            os.getenv("OPENAI_WARMUP_CONNECTIONS", "2")
+        )
+        self.openai_keepalive_interval = float(
+            os.getenv("OPENAI_KEEPALIVE_INTERVAL", "0")
+        )
+
+        # Model routing (an empty fallback model sends everything to OPENAI_MODEL)
+        self.openai_fallback_model = os.getenv("OPENAI_FALLBACK_MODEL", "")
+        self.route_short_prompt_chars = int(os.getenv("ROUTE_SHORT_PROMPT_CHARS", "0"))
+        self.route_short_context_tokens = int(
+            os.getenv("ROUTE_SHORT_CONTEXT_TOKENS", "0")
+        )
+        self.route_queue_depth = int(os.getenv("ROUTE_QUEUE_DEPTH", "0"))
+        self.route_error_rate = float(os.getenv("ROUTE_ERROR_RATE", "0"))
+
+        # Prompt caching (old history is dropped this many messages at a time)
+        self.prompt_eviction_block = int(os.getenv("PROMPT_EVICTION_BLOCK", "6"))
+        self.openai_prompt_cache_key = (
+            os.getenv("OPENAI_PROMPT_CACHE_KEY", "true").lower() == "true"
+        )
+
+        # Resilience settings
+        self.openai_max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+        self.openai_retry_base_delay = float(
+            os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5")
+        )
+        self.openai_retry_max_delay = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "8.0"))
+        self.openai_request_deadline = float(
+            os.getenv("OPENAI_REQUEST_DEADLINE", "60.0")
+        )
+        self.circuit_failure_threshold = int(
+            os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")
+        )
+        self.circuit_reset_timeout = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30.0"))
+
+        # Response cache settings
+        self.response_cache = os.getenv("RESPONSE_CACHE", "false").lower() == "true"
+        self.response_cache_size = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+        self.response_cache_ttl = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+        self.response_cache_path = os.getenv("RESPONSE_CACHE_PATH") or None
+        self.response_cache_stateless_only = (
+            os.getenv("RESPONSE_CACHE_STATELESS_ONLY", "true").lower() == "true"
+        )
+
+        # Summarization of older history (threshold in messages)
+        self.summarization = os.getenv("SUMMARIZATION", "false").lower() == "true"
+        self.summarize_after_messages = int(os.getenv("SUMMARIZE_AFTER_MESSAGES", "16"))
+        self.summarize_batch_size = int(os.getenv("SUMMARIZE_BATCH_SIZE", "8"))
+        self.summary_max_tokens = int(os.getenv("SUMMARY_MAX_TOKENS", "300"))
+
+        # Long-term memory of older turns, recalled by embedding similarity
+        self.long_term_memory = os.getenv("LONG_TERM_MEMORY", "false").lower() == "true"
+        self.memory_path = os.getenv("MEMORY_PATH", "data/memory")
+        self.memory_embedding_provider = os.getenv(
+            "MEMORY_EMBEDDING_PROVIDER", "openai"
+        ).lower()
+        self.memory_embedding_model = os.getenv(
+            "MEMORY_EMBEDDING_MODEL", "text-embedding-3-small"
+        )
+        self.memory_dimensions = int(os.getenv("MEMORY_DIMENSIONS", "256"))
+        self.memory_top_k = int(os.getenv("MEMORY_TOP_K", "3"))
+        self.memory_min_score = float(os.getenv("MEMORY_MIN_SCORE", "0.3"))
+        self.memory_timeout = float(os.getenv("MEMORY_TIMEOUT", "2.0"))
+
+        # Deferred prompts answered through the OpenAI Batch API (/batch)
+        self.batch_mode = os.getenv("BATCH_MODE", "false").lower() == "true"
+        self.batch_db_path = os.getenv("BATCH_DB_PATH", "data/batch_jobs.db")
+        self.batch_path = os.getenv("BATCH_PATH", "data/batches")
+        self.batch_interval = float(os.getenv("BATCH_INTERVAL", "60"))
+        self.batch_poll_interval = float(os.getenv("BATCH_POLL_INTERVAL", "60"))
+        self.batch_max_requests = int(os.getenv("BATCH_MAX_REQUESTS", "1000"))
+        self.batch_max_jobs_per_user = int(os.getenv("BATCH_MAX_JOBS_PER_USER", "10"))
+
+        # Plain DMs answered like /gpt, with quick successive messages merged
+        self.dm_chat = os.getenv("DM_CHAT", "true").lower() == "true"
+        self.dm_debounce_delay = float(os.getenv("DM_DEBOUNCE_DELAY", "1.0"))
+        self.dm_debounce_max_delay = float(os.getenv("DM_DEBOUNCE_MAX_DELAY", "4.0"))
+
+        # Overlapping prompts from one user: queue, coalesce or reject
+        self.turn_policy = os.getenv("TURN_POLICY", "queue").lower()
+        self.max_queued_turns = int(os.getenv("MAX_QUEUED_TURNS", "3"))
+
+        # Metrics endpoint (port 0 disables it)
+        self.metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+        self.metrics_port = int(os.getenv("METRICS_PORT", "9464"))
+
+        # Logging settings
+        self.log_level = os.getenv("LOG_LEVEL", "INFO").upper()
+        self.log_file_level = os.getenv("LOG_FILE_LEVEL", "DEBUG").upper()
+        self.log_format = os.getenv("LOG_FORMAT", "text").lower()
+        self.log_enqueue = os.getenv("LOG_ENQUEUE", "true").lower() == "true"
+        self.log_sample_rates = os.getenv("LOG_SAMPLE_RATES", "")
+        self.log_redact_prompts = (
+            os.getenv("LOG_REDACT_PROMPTS", "false").lower() == "true"
+        )
+
+        # Sharding: AutoShardedBot, optionally spread over several processes
+        self.sharded = os.getenv("SHARDED", "false").lower() == "true"
+        self.shard_count = int(os.getenv("SHARD_COUNT", "0"))
+        self.shard_processes = int(os.getenv("SHARD_PROCESSES", "1"))
+        self.shard_router_host = os.getenv("SHARD_ROUTER_HOST", "127.0.0.1")
+        self.shard_router_port = int(os.getenv("SHARD_ROUTER_PORT", "9500"))
+
+        # Storage settings
+        self.conversation_store = os.getenv("CONVERSATION_STORE", "sqlite").lower()
+        self.conversation_db_path = os.getenv(
+            "CONVERSATION_DB_PATH", "data/conversations.db"
+        )
+        self.store_flush_interval = float(os.getenv("STORE_FLUSH_INTERVAL", "1.0"))
+        self.snapshot_path = os.getenv("SNAPSHOT_PATH", "")
+        self.snapshot_compress = (
+            os.getenv("SNAPSHOT_COMPRESS", "true").lower() == "true"
+        )
+
+        # Memory settings (0 disables a limit)
+        self.max_conversations = int(os.getenv("MAX_CONVERSATIONS", "10000"))
+        self.max_conversation_memory_mb = int(
+            os.getenv("MAX_CONVERSATION_MEMORY_MB", "256")
+        )
+        self.conversation_idle_ttl = int(os.getenv("CONVERSATION_IDLE_TTL", "3600"))
+        self.conversation_sweep_interval = int(
+            os.getenv("CONVERSATION_SWEEP_INTERVAL", "60")
+        )
+
+        # Streaming settings
+        self.stream_responses = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+        self.stream_edit_interval = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+        # Responses longer than this many characters are sent as a file (0 never)
+        self.response_attachment_threshold = int(
+            os.getenv("RESPONSE_ATTACHMENT_THRESHOLD", "0")
+        )
+
+        # Seconds shutdown waits for in-flight requests before closing anyway
+        self.shutdown_drain_timeout = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "25.0"))
 
         # Validate required settings
         if not self.discord_token:
@@ -31,5 +179,9 @@ class Settings:
 
 
 def load_settings() -> Settings:
-    """Load and validate settings from environment."""
+    """Load the .env file, then load and validate settings from environment."""
+    # Imported here so importing settings alone stays cheap
+    from dotenv import load_dotenv
+
+    load_dotenv()
     return Settings()
@@ -0,0 +1,440 @@
+"""Deferred prompts answered through the OpenAI Batch API."""
+
+import asyncio
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config.settings import Settings
+from core.openai_client import OpenAIClient
+from core.storage import SQLiteWorker
+from utils.logger import get_logger
+from utils.metrics import Counter
+
+logger = get_logger()
+
+BATCH_JOBS = Counter(
+    "discordgpt_batch_jobs_total", "Deferred prompts by outcome", ["outcome"]
+)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+# Batch statuses after which no more results will arrive
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Called with a job and its answer, or None if it failed. It claims the job
+# before delivering, so jobs discarded meanwhile are skipped.
+DeliverCallback = Callable[["BatchJob", Optional[str]], Awaitable[None]]
+
+
+class BatchJob:
+    """A deferred prompt and the messages it is sent with."""
+
+    __slots__ = ("id", "user_id", "prompt", "messages")
+
+    def __init__(
+        self, job_id: int, user_id: int, prompt: str, messages: List[Dict[str, str]]
+    ):
+        self.id = job_id
+        self.user_id = user_id
+        self.prompt = prompt
+        self.messages = messages
+
+    @property
+    def custom_id(self) -> str:
+        """Identifier of the job's request in a batch file."""
+        return f"job-{self.id}"
+
+
+def build_batch_file(jobs: List[BatchJob], model: str, max_tokens: int) -> bytes:
+    """
+    Pack jobs into a Batch API input file.
+
+    Returns:
+        One JSON request per line, in the jobs' order
+    """
+    lines = [
+        json.dumps(
+            {
+                "custom_id": job.custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {
+                    "model": model,
+                    "messages": job.messages,
+                    "max_tokens": max_tokens,
+                },
+            },
+            ensure_ascii=False,
+        )
+        for job in jobs
+    ]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def parse_batch_output(text: str) -> Dict[str, Optional[str]]:
+    """
+    Read the answers from a Batch API output or error file.
+
+    Returns:
+        custom_id -> answer text, or None for requests that failed
+    """
+    results: Dict[str, Optional[str]] = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            logger.warning("Skipping malformed line in batch output")
+            continue
+        content = None
+        response = record.get("response") or {}
+        if response.get("status_code") == 200:
+            choices = (response.get("body") or {}).get("choices") or []
+            if choices:
+                content = choices[0].get("message", {}).get("content")
+        results[record.get("custom_id")] = content
+    return results
+
+
+class BatchJobQueue:
+    """
+    Durable queue of deferred prompts and the batch files made from them.
+
+    Jobs are kept in SQLite until their answer is delivered, so a restart
+    neither loses queued prompts nor forgets batches that are still running.
+    Batch files are read and written on the database's SQLiteWorker too.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "user_id INTEGER NOT NULL, "
+        "prompt TEXT NOT NULL, "
+        "messages TEXT NOT NULL, "
+        "batch_id TEXT, "
+        "created_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id, id)",
+        "CREATE TABLE IF NOT EXISTS batches ("
+        "id TEXT PRIMARY KEY, "
+        "file TEXT NOT NULL, "
+        "submitted_at REAL NOT NULL)",
+    )
+
+    def __init__(self, path: str, directory: str):
+        self.path = path
+        self.directory = directory
+        self._db = SQLiteWorker(path, self.SCHEMA, "batch-queue")
+
+    def _add(self, user_id: int, prompt: str, messages: List[Dict[str, str]]) -> int:
+        conn = self._db.connect()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (user_id, prompt, messages, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (user_id, prompt, json.dumps(messages), time.time()),
+            )
+        return cursor.lastrowid
+
+    def _pending(self, user_id: int) -> int:
+        row = (
+            self._db.connect()
+            .execute("SELECT COUNT(*) FROM jobs WHERE user_id = ?", (user_id,))
+            .fetchone()
+        )
+        return row[0]
+
+    def _select(self, where: str, args: tuple) -> List[BatchJob]:
+        rows = (
+            self._db.connect()
+            .execute(
+                f"SELECT id, user_id, prompt, messages FROM jobs WHERE {where}", args
+            )
+            .fetchall()
+        )
+        return [
+            BatchJob(job_id, user_id, prompt, json.loads(messages))
+            for job_id, user_id, prompt, messages in rows
+        ]
+
+    def _write_file(self, name: str, data: bytes) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return path
+
+    def _mark_submitted(self, batch_id: str, path: str, job_ids: List[int]) -> None:
+        conn = self._db.connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO batches (id, file, submitted_at) VALUES (?, ?, ?)",
+                (batch_id, path, time.time()),
+            )
+            conn.executemany(
+                "UPDATE jobs SET batch_id = ? WHERE id = ?",
+                [(batch_id, job_id) for job_id in job_ids],
+            )
+
+    def _batches(self) -> List[Tuple[str, str]]:
+        return (
+            self._db.connect()
+            .execute("SELECT id, file FROM batches ORDER BY submitted_at")
+            .fetchall()
+        )
+
+    def _complete(self, job_ids: List[int]) -> int:
+        conn = self._db.connect()
+        with conn:
+            cursor = conn.executemany(
+                "DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids]
+            )
+        return cursor.rowcount
+
+    def _discard(self, user_id: int) -> int:
+        conn = self._db.connect()
+        with conn:
+            cursor = conn.execute("DELETE FROM jobs WHERE user_id = ?", (user_id,))
+        return cursor.rowcount
+
+    def _finish_batch(self, batch_id: str, path: str) -> None:
+        conn = self._db.connect()
+        with conn:
+            conn.execute("DELETE FROM batches WHERE id = ?", (batch_id,))
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    async def add(
+        self, user_id: int, prompt: str, messages: List[Dict[str, str]]
+    ) -> int:
+        """Queue a prompt and return its job id."""
+        return await self._db.run(self._add, user_id, prompt, messages)
+
+    async def pending(self, user_id: int) -> int:
+        """Count a user's prompts that haven't been answered yet."""
+        return await self._db.run(self._pending, user_id)
+
+    async def queued(self, limit: int) -> List[BatchJob]:
+        """Get the oldest jobs not yet submitted in a batch."""
+        return await self._db.run(
+            self._select, "batch_id IS NULL ORDER BY id LIMIT ?", (limit,)
+        )
+
+    async def batch_jobs(self, batch_id: str) -> List[BatchJob]:
+        """Get the jobs of a batch that haven't been delivered yet."""
+        return await self._db.run(self._select, "batch_id = ? ORDER BY id", (batch_id,))
+
+    async def write_file(self, name: str, data: bytes) -> str:
+        """Save a batch input file and return its path."""
+        return await self._db.run(self._write_file, name, data)
+
+    async def mark_submitted(
+        self, batch_id: str, path: str, job_ids: List[int]
+    ) -> None:
+        """Record that jobs were submitted as a batch."""
+        await self._db.run(self._mark_submitted, batch_id, path, job_ids)
+
+    async def batches(self) -> List[Tuple[str, str]]:
+        """Get the id and input file of every submitted batch, oldest first."""
+        return await self._db.run(self._batches)
+
+    async def complete(self, job_ids: List[int]) -> int:
+        """Remove delivered jobs and return how many were still queued."""
+        return await self._db.run(self._complete, job_ids)
+
+    async def discard(self, user_id: int) -> int:
+        """Remove a user's jobs, submitted or not, and return how many."""
+        return await self._db.run(self._discard, user_id)
+
+    async def finish_batch(self, batch_id: str, path: str) -> None:
+        """Forget a batch whose jobs were all delivered and delete its file."""
+        await self._db.run(self._finish_batch, batch_id, path)
+
+    async def close(self) -> None:
+        """Close the database and stop the queue thread."""
+        await self._db.close()
+
+
+class BatchProcessor:
+    """
+    Answer deferred prompts through the OpenAI Batch API.
+
+    Every interval seconds the queued prompts are packed into JSONL files of
+    up to max_requests requests, each submitted as one batch. Submitted
+    batches are polled every poll_interval seconds. When one ends, each
+    answer is handed to deliver, and prompts without an answer are delivered
+    as failed. Anything not yet delivered is picked up again after a restart.
+    """
+
+    def __init__(
+        self,
+        queue: BatchJobQueue,
+        openai_client: OpenAIClient,
+        deliver: DeliverCallback,
+        model: str,
+        max_tokens: int,
+        interval: float = 60.0,
+        poll_interval: float = 60.0,
+        max_requests: int = 1000,
+    ):
+        self.queue = queue
+        self.openai_client = openai_client
+        self.deliver = deliver
+        self.model = model
+        self.max_tokens = max_tokens
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self.max_requests = max_requests
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Start submitting and polling in the background."""
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._every(self.interval, self.submit)),
+                asyncio.create_task(self._every(self.poll_interval, self.poll)),
+            ]
+
+    async def _every(self, interval: float, step) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await step()
+            except Exception as e:
+                logger.error(f"Batch processing failed: {e}")
+
+    async def enqueue(
+        self, user_id: int, prompt: str, messages: List[Dict[str, str]]
+    ) -> int:
+        """Queue a prompt with the messages to send for it."""
+        job_id = await self.queue.add(user_id, prompt, messages)
+        BATCH_JOBS.labels("queued").inc()
+        return job_id
+
+    async def pending(self, user_id: int) -> int:
+        """Count a user's prompts that haven't been answered yet."""
+        return await self.queue.pending(user_id)
+
+    async def claim(self, job: BatchJob) -> bool:
+        """
+        Take a job for delivery.
+
+        Returns:
+            False if it was discarded since its batch was read, so its answer
+            must not be delivered
+        """
+        return await self.queue.complete([job.id]) == 1
+
+    async def discard(self, user_id: int) -> int:
+        """
+        Drop a user's unanswered prompts, as their answers would be built on
+        a conversation that no longer exists.
+
+        Returns:
+            Number of prompts dropped
+        """
+        count = await self.queue.discard(user_id)
+        BATCH_JOBS.labels("discarded").inc(count)
+        return count
+
+    async def submit(self) -> int:
+        """
+        Submit queued prompts as batches.
+
+        Returns:
+            Number of prompts submitted
+        """
+        submitted = 0
+        while True:
+            jobs = await self.queue.queued(self.max_requests)
+            if not jobs:
+                return submitted
+            name = f"batch-{jobs[0].id}-{jobs[-1].id}.jsonl"
+            data = build_batch_file(jobs, self.model, self.max_tokens)
+            path = await self.queue.write_file(name, data)
+            batch_id = await self.openai_client.create_batch(
+                name, data, BATCH_ENDPOINT, COMPLETION_WINDOW
+            )
+            if batch_id is None:
+                # Left queued for the next round
+                return submitted
+            await self.queue.mark_submitted(batch_id, path, [job.id for job in jobs])
+            submitted += len(jobs)
+            logger.info(f"Submitted batch {batch_id} with {len(jobs)} prompts")
+
+    async def poll(self) -> None:
+        """Deliver the answers of batches that have ended."""
+        for batch_id, path in await self.queue.batches():
+            batch = await self.openai_client.get_batch(batch_id)
+            if batch is None or batch.status not in FINAL_STATUSES:
+                continue
+
+            results: Dict[str, Optional[str]] = {}
+            for file_id in (batch.error_file_id, batch.output_file_id):
+                if not file_id:
+                    continue
+                text = await self.openai_client.get_file_content(file_id)
+                if text is None:
+                    # Retried on the next poll
+                    break
+                results.update(parse_batch_output(text))
+            else:
+                await self._deliver_batch(batch_id, path, batch.status, results)
+
+    async def _deliver_batch(
+        self,
+        batch_id: str,
+        path: str,
+        status: str,
+        results: Dict[str, Optional[str]],
+    ) -> None:
+        jobs = await self.queue.batch_jobs(batch_id)
+        failed = 0
+        for job in jobs:
+            response = results.get(job.custom_id) or None
+            if response is None:
+                failed += 1
+            BATCH_JOBS.labels("failed" if response is None else "completed").inc()
+            try:
+                await self.deliver(job, response)
+            except Exception as e:
+                logger.error(f"Failed to deliver batch answer to {job.user_id}: {e}")
+            # Delivery claimed the job unless it failed before, never retry it
+            await self.queue.complete([job.id])
+        await self.queue.finish_batch(batch_id, path)
+        logger.info(
+            f"Batch {batch_id} {status}: {len(jobs) - failed} answered, {failed} failed"
+        )
+
+    async def close(self) -> None:
+        """Stop background work and close the queue."""
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        await self.queue.close()
+
+
+def create_batch_processor(
+    settings: Settings, openai_client: OpenAIClient, deliver: DeliverCallback
+) -> BatchProcessor:
+    """Create the batch processor from settings."""
+    return BatchProcessor(
+        BatchJobQueue(settings.batch_db_path, settings.batch_path),
+        openai_client,
+        deliver,
+        model=settings.openai_model,
+        max_tokens=settings.max_response_tokens,
+        interval=settings.batch_interval,
+        poll_interval=settings.batch_poll_interval,
+        max_requests=settings.batch_max_requests,
+    )
@@ -1,80 +1,789 @@
 """Conversation management and memory storage."""
 
-from collections import deque
-from typing import Dict, List
+import asyncio
+import heapq
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 from config.prompts import get_system_prompt
+from core.prompt_builder import (
+    build_memory_message,
+    build_messages,
+    build_summary_message,
+)
+from core.snapshot import SnapshotError, SnapshotReader, SnapshotWriter, encode_record
+from core.storage import ConversationStore, StoreOp
+from core.tokenizer import TokenCounter
+from utils.logger import get_logger
+from utils.metrics import Counter, Gauge
+
+logger = get_logger()
+
+ACTIVE_CONVERSATIONS = Gauge(
+    "discordgpt_active_conversations", "Conversations held in memory"
+)
+CONVERSATION_BYTES = Gauge(
+    "discordgpt_conversation_bytes", "Approximate memory used by conversations"
+)
+EVICTIONS = Counter(
+    "discordgpt_conversation_evictions_total",
+    "Conversations evicted from memory",
+    ["reason"],
+)
+
+DEFAULT_TOKEN_MODEL = "gpt-4o-mini"
+
+# Snapshot records encoded on the event loop between writes to disk
+SNAPSHOT_BATCH_SIZE = 1000
+
+# Approximate fixed memory cost of a Message, of its cached payload entry and
+# of an empty Conversation, excluding the content string itself
+MESSAGE_OVERHEAD_BYTES = 96
+PAYLOAD_ENTRY_BYTES = 192
+CONVERSATION_OVERHEAD_BYTES = 200
+
+
+class Role(IntEnum):
+    """Message author, stored as a small int instead of a string per message."""
+
+    SYSTEM = 0
+    USER = 1
+    ASSISTANT = 2
+
+
+ROLE_NAMES = tuple(role.name.lower() for role in Role)
+ROLES_BY_NAME = {name: Role(i) for i, name in enumerate(ROLE_NAMES)}
 
 
 class Message:
     """Represents a single message in a conversation."""
 
-    def __init__(self, role: str, content: str):
+    __slots__ = ("role", "content", "tokens")
+
+    def __init__(self, role: Role, content: str, tokens: int = 0):
         self.role = role
         self.content = content
+        self.tokens = tokens
 
     def to_dict(self) -> Dict[str, str]:
         """Convert message to OpenAI API format."""
-        return {"role": self.role, "content": self.content}
+        return {"role": ROLE_NAMES[self.role], "content": self.content}
 
 
-class Conversation:
-    """Manages a single user's conversation history."""
+class ConversationConfig:
+    """Settings and system prompt shared by every conversation of a manager."""
 
-    def __init__(self, max_messages: int = 20):
+    __slots__ = (
+        "max_messages",
+        "max_prompt_tokens",
+        "eviction_block",
+        "token_counter",
+        "system_message",
+        "system_tokens",
+    )
+
+    def __init__(
+        self,
+        max_messages: int = 20,
+        max_prompt_tokens: Optional[int] = None,
+        token_counter: Optional[TokenCounter] = None,
+        eviction_block: int = 1,
+    ):
         self.max_messages = max_messages
-        self.system_prompt = get_system_prompt()
-        self.messages: deque = deque(maxlen=max_messages)
+        self.max_prompt_tokens = max_prompt_tokens
+        self.eviction_block = max(eviction_block, 1)
+        self.token_counter = token_counter or TokenCounter(DEFAULT_TOKEN_MODEL)
+        system_prompt = get_system_prompt()
+        # Built once and shared, so every request starts with the same bytes
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.system_tokens = self.token_counter.count_message(system_prompt)
+
+
+class Conversation:
+    """
+    Manages a single user's conversation history.
+
+    The token window is maintained incrementally: appending or trimming a
+    message only moves its start. Old messages are dropped eviction_block at
+    a time, so the start of the prompt stays the same for several turns and
+    OpenAI can reuse its cached prefix. The OpenAI payload is built on the first
+    get_messages call and then updated in place, so later turns don't rebuild
+    it. The payload dicts are shared between calls and must not be mutated.
+
+    Older turns can be folded into a running summary, which is sent after the
+    system prompt and counts against the token budget.
+    """
+
+    __slots__ = (
+        "config",
+        "messages",
+        "size_bytes",
+        "last_used",
+        "summary",
+        "summary_message",
+        "summary_tokens",
+        "served_model",
+        "_payload",
+        "_window_start",
+        "_window_tokens",
+    )
+
+    def __init__(self, config: Optional[ConversationConfig] = None):
+        self.config = config or ConversationConfig()
+        self.messages: List[Message] = []
+        self.size_bytes = CONVERSATION_OVERHEAD_BYTES
+        self.last_used = time.monotonic()
+        self.summary: Optional[str] = None
+        self.summary_message: Optional[Dict[str, str]] = None
+        self.summary_tokens = 0
+        # Model that generated the latest response, when routing picks one
+        self.served_model: Optional[str] = None
+        self._payload: Optional[List[Dict[str, str]]] = None
+        self._window_start = 0
+        self._window_tokens = 0
+
+    @property
+    def system_prompt(self) -> str:
+        return self.config.system_message["content"]
+
+    def _message_bytes(self, content: str) -> int:
+        size = sys.getsizeof(content) + MESSAGE_OVERHEAD_BYTES
+        if self._payload is not None:
+            size += PAYLOAD_ENTRY_BYTES
+        return size
 
     def add_message(self, role: str, content: str) -> None:
         """Add a message to the conversation."""
-        self.messages.append(Message(role, content))
+        config = self.config
+        tokens = config.token_counter.count_message(content)
+        msg = Message(ROLES_BY_NAME[role], content, tokens)
+        self.messages.append(msg)
+        if self._payload is not None:
+            self._payload.append(msg.to_dict())
+        self.size_bytes += self._message_bytes(content)
+
+        self._window_tokens += msg.tokens
+        self._shrink_window()
 
-    def get_messages(self) -> List[Dict[str, str]]:
-        """Get all messages including system prompt in OpenAI format."""
-        result = [{"role": "system", "content": self.system_prompt}]
-        result.extend([msg.to_dict() for msg in self.messages])
-        return result
+        if len(self.messages) > config.max_messages:
+            # Drop a whole block, never the newest message
+            excess = len(self.messages) - config.max_messages
+            block = min(config.eviction_block, len(self.messages) - 1)
+            self._drop_oldest(max(excess, block))
+
+    def _shrink_window(self) -> None:
+        """
+        Move the window start forward until it fits, keeping the newest.
+
+        The start moves a block of messages at a time, so it stays put until
+        the budget is exceeded again rather than sliding every turn.
+        """
+        config = self.config
+        if config.max_prompt_tokens is None:
+            return
+        budget = config.max_prompt_tokens - config.system_tokens - self.summary_tokens
+        last = len(self.messages) - 1
+        while self._window_tokens > budget and self._window_start < last:
+            end = min(self._window_start + config.eviction_block, last)
+            for msg in self.messages[self._window_start : end]:
+                self._window_tokens -= msg.tokens
+            self._window_start = end
+
+    def _drop_oldest(self, count: int = 1) -> None:
+        """Remove the oldest count messages, keeping the window aligned."""
+        dropped = self.messages[:count]
+        if self._window_start < count:
+            for msg in dropped[self._window_start :]:
+                self._window_tokens -= msg.tokens
+            self._window_start = 0
+        else:
+            self._window_start -= count
+        for msg in dropped:
+            self.size_bytes -= self._message_bytes(msg.content)
+        del self.messages[:count]
+        if self._payload is not None:
+            del self._payload[:count]
+
+    def set_summary(self, summary: str, folded: List[Message]) -> int:
+        """
+        Replace the oldest messages with a summary of them.
+
+        Args:
+            summary: Summary covering the previous summary and folded messages
+            folded: Messages the summary covers, oldest first. Any that were
+                already trimmed or reset away are skipped.
+
+        Returns:
+            Number of messages removed
+        """
+        folded_ids = {id(msg) for msg in folded}
+        count = 0
+        while count < len(self.messages) and id(self.messages[count]) in folded_ids:
+            count += 1
+        if folded and not count:
+            # The history changed underneath the summary, e.g. a reset
+            return 0
+
+        for msg in self.messages[:count]:
+            self.size_bytes -= self._message_bytes(msg.content)
+        del self.messages[:count]
+        if self._payload is not None:
+            del self._payload[:count]
+
+        if self.summary is not None:
+            self.size_bytes -= sys.getsizeof(self.summary)
+        self.summary = summary
+        self.summary_message = build_summary_message(summary)
+        self.summary_tokens = self.config.token_counter.count_message(
+            self.summary_message["content"]
+        )
+        self.size_bytes += sys.getsizeof(summary)
+
+        # The budget changed, so recompute the window from the full history
+        self._window_start = 0
+        self._window_tokens = sum(msg.tokens for msg in self.messages)
+        self._shrink_window()
+        return count
+
+    def get_window(self) -> List[Message]:
+        """
+        Get the longest suffix of history that fits the prompt token budget.
+
+        The newest message is always included so a request is never empty.
+        """
+        return self.messages[self._window_start :]
+
+    def get_messages(
+        self, recalled: Optional[List[str]] = None
+    ) -> List[Dict[str, str]]:
+        """
+        Get the system prompt and in-budget history in OpenAI format.
+
+        Args:
+            recalled: Older turns from long-term memory to include, if any
+        """
+        if self._payload is None:
+            self._payload = [msg.to_dict() for msg in self.messages]
+            self.size_bytes += PAYLOAD_ENTRY_BYTES * len(self._payload)
+        return build_messages(
+            self.config.system_message,
+            self._payload[self._window_start :],
+            self.summary_message,
+            build_memory_message(recalled) if recalled else None,
+        )
+
+    def token_count(self) -> int:
+        """Get the prompt tokens the next request would use."""
+        return self.config.system_tokens + self.summary_tokens + self._window_tokens
 
     def reset(self) -> None:
         """Clear all messages except system prompt."""
         self.messages.clear()
+        self.size_bytes = CONVERSATION_OVERHEAD_BYTES
+        self.summary = None
+        self.summary_message = None
+        self.summary_tokens = 0
+        self._payload = None
+        self._window_start = 0
+        self._window_tokens = 0
 
     def message_count(self) -> int:
         """Get the number of messages (excluding system prompt)."""
         return len(self.messages)
 
+    def window_count(self) -> int:
+        """Get the number of messages within the prompt token budget."""
+        return len(self.messages) - self._window_start
+
 
 class ConversationManager:
-    """Manages conversations for all users."""
+    """
+    Manages conversations for all users.
+
+    With a store configured, history is loaded lazily per user by
+    load_conversation and writes are buffered and flushed by a background
+    task, so add_message never waits on disk.
 
-    def __init__(self, max_messages: int = 20):
+    Conversations are kept in least-recently-used order. They are evicted
+    when idle for longer than the TTL, or oldest first whenever the count or
+    approximate byte ceiling is exceeded. Evicted users are reloaded from the
+    store on their next request.
+
+    With a snapshot path, conversations are saved to a binary snapshot on
+    close and the previous one is opened on startup. Users are read from it
+    on first access, after the store, which takes over their history. Users
+    the store has seen reset are never read from it.
+    """
+
+    def __init__(
+        self,
+        max_messages: int = 20,
+        max_prompt_tokens: Optional[int] = None,
+        model: str = DEFAULT_TOKEN_MODEL,
+        store: Optional[ConversationStore] = None,
+        flush_interval: float = 1.0,
+        max_conversations: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        idle_ttl: Optional[float] = None,
+        sweep_interval: float = 60.0,
+        snapshot_path: Optional[str] = None,
+        snapshot_compress: bool = True,
+        eviction_block: int = 1,
+    ):
         self.max_messages = max_messages
-        self.conversations: Dict[int, Conversation] = {}
+        self.max_prompt_tokens = max_prompt_tokens
+        self.token_counter = TokenCounter(model)
+        self.config = ConversationConfig(
+            max_messages, max_prompt_tokens, self.token_counter, eviction_block
+        )
+        self.conversations: "OrderedDict[int, Conversation]" = OrderedDict()
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.total_bytes = 0
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+        self._pending: List[StoreOp] = []
+        # user_id -> turns running, whose conversations must stay in memory
+        self._pinned: Dict[int, int] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._sweep_task: Optional[asyncio.Task] = None
+
+        self.snapshot_path = snapshot_path
+        self.snapshot_compress = snapshot_compress
+        self.snapshot: Optional[SnapshotReader] = None
+        # Users read from the snapshot, or reset, whose record is now stale
+        self._snapshot_taken: Set[int] = set()
+        if snapshot_path and os.path.exists(snapshot_path):
+            try:
+                self.snapshot = SnapshotReader(snapshot_path)
+                logger.info(
+                    f"Opened snapshot of {len(self.snapshot)} conversations "
+                    f"at {snapshot_path}"
+                )
+            except (OSError, SnapshotError) as e:
+                logger.error(f"Failed to open conversation snapshot: {e}")
+
+    def _new_conversation(self) -> Conversation:
+        return Conversation(self.config)
+
+    def _insert(self, user_id: int, conversation: Conversation) -> Conversation:
+        """Track a new conversation and enforce the memory ceilings."""
+        self.conversations[user_id] = conversation
+        self.total_bytes += conversation.size_bytes
+        self._enforce_limits()
+        return conversation
+
+    def _evict(self, user_id: int) -> None:
+        conversation = self.conversations.pop(user_id)
+        self.total_bytes -= conversation.size_bytes
+
+    def _over_limits(self) -> bool:
+        return (
+            self.max_conversations is not None
+            and len(self.conversations) > self.max_conversations
+        ) or (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+
+    def _eviction_candidate(self) -> Optional[int]:
+        """Get the least recently used conversation that isn't in use."""
+        # The most recent conversation, and those of running turns, are in use
+        newest = next(reversed(self.conversations), None)
+        for user_id in self.conversations:
+            if user_id == newest:
+                return None
+            if user_id not in self._pinned:
+                return user_id
+        return None
+
+    def _enforce_limits(self) -> None:
+        """Evict least recently used conversations until under the ceilings."""
+        while self._over_limits():
+            user_id = self._eviction_candidate()
+            if user_id is None:
+                break
+            self._evict(user_id)
+            self.evicted_capacity += 1
+            EVICTIONS.labels("capacity").inc()
+
+    @contextmanager
+    def pinned(self, user_id: int) -> Iterator[None]:
+        """
+        Keep a user's conversation in memory for the duration of a turn.
+
+        Otherwise another user's request could evict it between the user
+        message and the reply, and the reply would start a new, empty
+        conversation.
+        """
+        self._pinned[user_id] = self._pinned.get(user_id, 0) + 1
+        try:
+            yield
+        finally:
+            if self._pinned[user_id] == 1:
+                del self._pinned[user_id]
+            else:
+                self._pinned[user_id] -= 1
+            # Evictions skipped while it was pinned
+            self._enforce_limits()
+
+    def _touch(self, user_id: int) -> Conversation:
+        conversation = self.conversations[user_id]
+        conversation.last_used = time.monotonic()
+        self.conversations.move_to_end(user_id)
+        return conversation
 
     def get_conversation(self, user_id: int) -> Conversation:
         """Get or create a conversation for a user."""
-        if user_id not in self.conversations:
-            self.conversations[user_id] = Conversation(self.max_messages)
-        return self.conversations[user_id]
+        if user_id in self.conversations:
+            return self._touch(user_id)
+        return self._insert(user_id, self._new_conversation())
+
+    async def load_conversation(
+        self, user_id: int, create: bool = True
+    ) -> Optional[Conversation]:
+        """
+        Get a user's conversation, loading it from the store on first access.
+
+        Args:
+            user_id: Discord user ID
+            create: Whether to create an empty conversation for unknown users
+
+        Returns:
+            The conversation, or None if it doesn't exist and create is False
+        """
+        if user_id in self.conversations:
+            return self._touch(user_id)
+
+        rows: List[Tuple[str, str]] = []
+        summary = None
+        stale_snapshot = False
+        if self.store is not None:
+            # Buffered writes may belong to this user if it was evicted recently
+            if self._pending:
+                await self.flush()
+            rows = await self.store.load(user_id)
+            summary = await self.store.load_summary(user_id)
+            if not rows and not summary and self.snapshot is not None:
+                # After a reset and a restart, the snapshot's copy is stale
+                stale_snapshot = await self.store.was_reset(user_id)
+
+            # Another coroutine may have loaded the same user while we waited
+            if user_id in self.conversations:
+                return self._touch(user_id)
+
+        if not rows and not summary and not stale_snapshot:
+            rows, summary = self._take_from_snapshot(user_id)
+        if not rows and not summary and not create:
+            return None
+
+        conversation = self._new_conversation()
+        if summary:
+            conversation.set_summary(summary, [])
+        for role, content in rows:
+            conversation.add_message(role, content)
+        return self._insert(user_id, conversation)
+
+    def _take_from_snapshot(
+        self, user_id: int
+    ) -> Tuple[List[Tuple[str, str]], Optional[str]]:
+        """Read a user's history from the snapshot, at most once."""
+        if self.snapshot is None or user_id in self._snapshot_taken:
+            return [], None
+        record = self.snapshot.get(user_id)
+        if record is None:
+            return [], None
+        self._snapshot_taken.add(user_id)
+
+        summary, messages = record
+        rows = [(ROLE_NAMES[role], content) for role, content in messages]
+        if self.store is not None:
+            # The store takes over, so the history survives eviction
+            if summary:
+                self._pending.append(StoreOp("summarize", user_id, content=summary))
+            self._pending.extend(
+                StoreOp("append", user_id, role, content) for role, content in rows
+            )
+        return rows, summary
 
     def add_message(self, user_id: int, role: str, content: str) -> None:
         """Add a message to a user's conversation."""
         conversation = self.get_conversation(user_id)
+        size_before = conversation.size_bytes
         conversation.add_message(role, content)
+        self.total_bytes += conversation.size_bytes - size_before
+        if self.store is not None:
+            self._pending.append(StoreOp("append", user_id, role, content))
+        self._enforce_limits()
 
-    def get_messages(self, user_id: int) -> List[Dict[str, str]]:
+    def get_messages(
+        self, user_id: int, recalled: Optional[List[str]] = None
+    ) -> List[Dict[str, str]]:
         """Get all messages for a user in OpenAI format."""
         conversation = self.get_conversation(user_id)
-        return conversation.get_messages()
+        size_before = conversation.size_bytes
+        messages = conversation.get_messages(recalled)
+        self.total_bytes += conversation.size_bytes - size_before
+        return messages
 
     def reset_conversation(self, user_id: int) -> None:
         """Reset a user's conversation."""
+        if self.snapshot is not None:
+            self._snapshot_taken.add(user_id)
+        if self.store is not None:
+            # Keep an empty conversation so a later load doesn't read stale rows
+            self.get_conversation(user_id)
+            self._pending.append(StoreOp("reset", user_id))
         if user_id in self.conversations:
-            self.conversations[user_id].reset()
+            conversation = self.conversations[user_id]
+            self.total_bytes -= conversation.size_bytes
+            conversation.reset()
+            self.total_bytes += conversation.size_bytes
+
+    def apply_summary(
+        self,
+        user_id: int,
+        conversation: Conversation,
+        summary: str,
+        folded: List[Message],
+    ) -> None:
+        """Fold summarized messages out of a conversation and persist it."""
+        # Skip conversations evicted while the summary was being generated
+        if self.conversations.get(user_id) is not conversation:
+            return
+        size_before = conversation.size_bytes
+        count = conversation.set_summary(summary, folded)
+        if not count:
+            return
+        self.total_bytes += conversation.size_bytes - size_before
+        if self.store is not None:
+            # Every message still in memory was appended before this op
+            self._pending.append(
+                StoreOp(
+                    "summarize",
+                    user_id,
+                    content=summary,
+                    keep=conversation.message_count(),
+                )
+            )
 
     def get_message_count(self, user_id: int) -> int:
         """Get the number of messages for a user."""
-        if user_id not in self.conversations:
+        conversation = self.conversations.get(user_id)
+        if conversation is None:
+            return 0
+        return conversation.message_count()
+
+    def get_window_count(self, user_id: int) -> int:
+        """Get the number of a user's messages the next request would send."""
+        conversation = self.conversations.get(user_id)
+        if conversation is None:
+            return 0
+        return conversation.window_count()
+
+    def get_token_count(self, user_id: int) -> int:
+        """Get the prompt tokens a user's next request would use."""
+        conversation = self.conversations.get(user_id)
+        if conversation is None:
             return 0
-        return self.conversations[user_id].message_count()
+        return conversation.token_count()
+
+    def set_served_model(self, user_id: int, model: str) -> None:
+        """Record which model answered a user's latest prompt."""
+        conversation = self.conversations.get(user_id)
+        if conversation is not None:
+            conversation.served_model = model
+
+    def get_served_model(self, user_id: int) -> Optional[str]:
+        """Get the model that answered a user's latest prompt, if known."""
+        conversation = self.conversations.get(user_id)
+        if conversation is None:
+            return None
+        return conversation.served_model
+
+    def sweep(self) -> int:
+        """
+        Evict conversations idle for longer than the TTL.
+
+        Returns:
+            Number of conversations evicted
+        """
+        if self.idle_ttl is None:
+            return 0
+
+        cutoff = time.monotonic() - self.idle_ttl
+        expired = []
+        for user_id, conversation in self.conversations.items():
+            if conversation.last_used > cutoff:
+                break
+            if user_id not in self._pinned:
+                expired.append(user_id)
+        for user_id in expired:
+            self._evict(user_id)
+        evicted = len(expired)
+
+        self.evicted_idle += evicted
+        EVICTIONS.labels("idle").inc(evicted)
+        logger.debug(
+            f"Conversation sweep - Evicted: {evicted}, "
+            f"Active: {len(self.conversations)}, "
+            f"Bytes: {self.total_bytes}, "
+            f"Total evicted (idle/capacity): "
+            f"{self.evicted_idle}/{self.evicted_capacity}"
+        )
+        return evicted
+
+    def snapshot_records(self) -> Iterator[Tuple[int, bytes, bool]]:
+        """
+        Yield (user id, record, whether it's compressed) for every
+        conversation, by user id.
+
+        Covers the conversations in memory and the users of the open
+        snapshot that were never loaded. Records are encoded as they are
+        consumed, so only one is held at a time, and those never loaded are
+        copied as stored in the open snapshot, without decompressing them.
+        """
+        memory_ids = ((user_id, None) for user_id in sorted(self.conversations))
+        snapshot_records = (
+            () if self.snapshot is None else self.snapshot.stored_records()
+        )
+        compressed = self.snapshot is not None and self.snapshot.compressed
+        previous = None
+        # merge is stable, so a user in memory comes before its stale record
+        for user_id, payload in heapq.merge(
+            memory_ids, snapshot_records, key=lambda record: record[0]
+        ):
+            if user_id == previous:
+                continue
+            previous = user_id
+            if payload is not None:
+                if user_id not in self._snapshot_taken:
+                    yield user_id, payload, compressed
+                continue
+
+            # Evicted since the ids were listed, so it's in the store
+            conversation = self.conversations.get(user_id)
+            if conversation is None or not (
+                conversation.messages or conversation.summary
+            ):
+                continue
+            messages = [(msg.role, msg.content) for msg in conversation.messages]
+            yield user_id, encode_record(conversation.summary, messages), False
+
+    async def save_snapshot(
+        self,
+        path: str,
+        compress: bool = True,
+        batch_size: int = SNAPSHOT_BATCH_SIZE,
+    ) -> int:
+        """
+        Stream all conversations to a snapshot file.
+
+        Conversations in memory are encoded on the event loop in batches, and
+        compressed and written on a worker thread, so the loop keeps serving
+        requests. Records of users never loaded are copied as they are stored,
+        and only recompressed, on the worker thread, if compress differs from
+        the open snapshot.
+
+        Args:
+            path: Snapshot file to create or replace
+            compress: Whether to zlib-compress each record
+            batch_size: Records encoded between writes
+
+        Returns:
+            Number of users written
+        """
+        loop = asyncio.get_running_loop()
+        writer = await loop.run_in_executor(None, SnapshotWriter, path, compress)
+        try:
+            batch: List[Tuple[int, bytes, bool]] = []
+            for record in self.snapshot_records():
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    await loop.run_in_executor(None, writer.write_records, batch)
+                    batch = []
+            await loop.run_in_executor(None, writer.write_records, batch)
+            await loop.run_in_executor(None, writer.finish)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.count
+
+    def register_metrics(self) -> None:
+        """Export this manager's conversations as the process's gauges."""
+        ACTIVE_CONVERSATIONS.set_function(lambda: len(self.conversations))
+        CONVERSATION_BYTES.set_function(lambda: self.total_bytes)
+
+    def start(self) -> None:
+        """Start the background tasks. Must be called on the event loop."""
+        if self.store is not None and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        if self.idle_ttl is not None and self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush conversation store: {e}")
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+    async def flush(self) -> None:
+        """Write all buffered changes to the store."""
+        if self.store is None or not self._pending:
+            return
+        ops, self._pending = self._pending, []
+        try:
+            await self.store.write_batch(ops)
+        except Exception:
+            # Keep the batch so the next flush retries it in order
+            self._pending[:0] = ops
+            raise
+
+    async def close(self) -> None:
+        """
+        Stop background tasks, write pending changes, save the snapshot and
+        close the store.
+        """
+        for task in (self._flush_task, self._sweep_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._flush_task = None
+        self._sweep_task = None
+        if self.store is not None:
+            await self.flush()
+
+        if self.snapshot_path:
+            started_at = time.monotonic()
+            try:
+                count = await self.save_snapshot(
+                    self.snapshot_path, self.snapshot_compress
+                )
+                logger.info(
+                    f"Saved snapshot of {count} conversations in "
+                    f"{time.monotonic() - started_at:.2f}s"
+                )
+            except Exception as e:
+                logger.error(f"Failed to save conversation snapshot: {e}")
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+        if self.store is not None:
+            await self.store.close()
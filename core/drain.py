@@ -0,0 +1,45 @@
+"""Tracking of in-flight requests, so shutdown can let them finish."""
+
+import asyncio
+from contextlib import contextmanager
+from typing import Iterator, Set
+
+
+class DrainGate:
+    """
+    Track the tasks handling requests, and stop admitting new ones on shutdown.
+
+    Handlers check draining before accepting a request and wrap the work in
+    track(), entered before their first await so a request is never accepted
+    without being tracked.
+    """
+
+    def __init__(self):
+        self.draining = False
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def active(self) -> int:
+        """Number of requests in flight."""
+        return len(self._tasks)
+
+    def close(self) -> None:
+        """Stop admitting requests; those already tracked carry on."""
+        self.draining = True
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        """Count the current task's request as in flight during the block."""
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            yield
+        finally:
+            self._tasks.discard(task)
+
+    async def cancel(self) -> None:
+        """Cancel the requests still in flight and wait for them to end."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,121 @@
+"""Pluggable text embedding providers for long-term memory."""
+
+import hashlib
+import re
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+if TYPE_CHECKING:
+    from core.openai_client import OpenAIClient
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def normalize(vectors: "np.ndarray") -> "np.ndarray":
+    """Scale rows to unit length so dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Empty texts embed to zero and stay zero
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+class EmbeddingProvider(ABC):
+    """Interface for turning texts into fixed-size vectors."""
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> Optional["np.ndarray"]:
+        """
+        Embed a batch of texts.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            A (len(texts), dimensions) float32 array of unit vectors, or None
+            if the provider is unavailable
+        """
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic local embeddings from hashed word and word pair counts.
+
+    Only texts sharing words score as similar, but it needs no network or
+    model, so it's a stand-in for tests, benchmarks and offline development.
+    """
+
+    def _embed_one(self, text: str, vector: "np.ndarray") -> None:
+        words = WORD_PATTERN.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            # The low bit picks the sign, so collisions tend to cancel out
+            vector[(value >> 1) % self.dimensions] += 1.0 if value & 1 else -1.0
+
+    async def embed(self, texts: List[str]) -> Optional["np.ndarray"]:
+        """Embed a batch of texts locally."""
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for text, vector in zip(texts, vectors):
+            self._embed_one(text, vector)
+        return normalize(vectors)
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the OpenAI API, shortened to the configured dimensions."""
+
+    def __init__(
+        self,
+        openai_client: "OpenAIClient",
+        model: str,
+        dimensions: int,
+        timeout: float = 2.0,
+    ):
+        super().__init__(dimensions)
+        self.openai_client = openai_client
+        self.model = model
+        self.timeout = timeout
+
+    async def embed(self, texts: List[str]) -> Optional["np.ndarray"]:
+        """Embed a batch of texts in one API request."""
+        embeddings = await self.openai_client.get_embeddings(
+            texts, self.model, self.dimensions, self.timeout
+        )
+        if embeddings is None:
+            return None
+        return normalize(np.asarray(embeddings, dtype=np.float32))
+
+
+def create_embedding_provider(
+    backend: str,
+    openai_client: "OpenAIClient",
+    model: str,
+    dimensions: int,
+    timeout: float = 2.0,
+) -> EmbeddingProvider:
+    """
+    Create an embedding provider from configuration.
+
+    Args:
+        backend: "openai" or "local"
+        openai_client: Client used by the OpenAI backend
+        model: Embedding model for the OpenAI backend
+        dimensions: Length of the vectors
+        timeout: Seconds an OpenAI embedding request may take
+
+    Returns:
+        Configured provider
+    """
+    if backend == "openai":
+        return OpenAIEmbeddingProvider(openai_client, model, dimensions, timeout)
+    if backend == "local":
+        return HashingEmbeddingProvider(dimensions)
+    raise ValueError(f"Unknown embedding provider: {backend}")
@@ -0,0 +1,421 @@
+"""Long-term memory: past turns recalled by embedding similarity."""
+
+import asyncio
+import os
+import struct
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+from config.settings import Settings
+from core.embeddings import EmbeddingProvider, create_embedding_provider
+from core.storage import DiskWorker
+from utils.logger import get_logger
+from utils.metrics import Histogram
+
+if TYPE_CHECKING:
+    from core.openai_client import OpenAIClient
+
+logger = get_logger()
+
+RECALL_LATENCY = Histogram(
+    "discordgpt_memory_recall_seconds",
+    "Time to embed a prompt and search a user's long-term memory",
+)
+
+# Rows scored per matrix product, which bounds the memory a search needs
+SEARCH_BLOCK_ROWS = 65536
+# Longer turns are cut before they are embedded and stored
+MAX_TURN_CHARS = 2000
+# Turns embedded in one request by the background writer
+REMEMBER_BATCH_SIZE = 64
+# Turns waiting to be stored past which new ones are dropped. Forgetting a
+# user is never dropped, so it doesn't count against this.
+MAX_PENDING_TURNS = 10000
+
+# Text index entry: offset and length of a turn in the text file
+TEXT_ENTRY = struct.Struct("<QI")
+
+
+def top_k_cosine(
+    matrix: "np.ndarray", queries: "np.ndarray", k: int
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Find the k rows most similar to each query.
+
+    Rows and queries must be unit vectors, so dot products are cosine
+    similarities. The matrix is scored in blocks, which keeps memory flat for
+    memory-mapped matrices of any size.
+
+    Args:
+        matrix: (rows, dimensions) stored vectors
+        queries: (queries, dimensions) query vectors
+        k: Matches to return per query
+
+    Returns:
+        (queries, k) arrays of row indices and scores, best first. k is
+        capped at the number of rows.
+    """
+    rows = matrix.shape[0]
+    k = min(k, rows)
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, rows, SEARCH_BLOCK_ROWS):
+        block = np.asarray(matrix[start : start + SEARCH_BLOCK_ROWS])
+        scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+        indices = np.concatenate(
+            [
+                best_rows,
+                np.broadcast_to(
+                    np.arange(start, start + len(block)), (len(queries), len(block))
+                ),
+            ],
+            axis=1,
+        )
+        if scores.shape[1] > k:
+            keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(scores, keep, axis=1)
+            indices = np.take_along_axis(indices, keep, axis=1)
+        best_scores, best_rows = scores, indices
+
+    order = np.argsort(-best_scores, axis=1)
+    return (
+        np.take_along_axis(best_rows, order, axis=1),
+        np.take_along_axis(best_scores, order, axis=1),
+    )
+
+
+class VectorStore:
+    """
+    Append-only per-user embedding matrices on disk.
+
+    Each user has three files: a float32 matrix with one row per turn, read
+    through a memory map, the turn texts, and an index of where each text
+    is. Files are spread over 256 directories so none gets too large.
+    Memory maps of recently searched users are kept open.
+
+    Not thread-safe; LongTermMemory uses it from a single thread.
+    """
+
+    def __init__(self, path: str, dimensions: int, max_open: int = 256):
+        self.path = path
+        self.dimensions = dimensions
+        self.max_open = max_open
+        self._row_bytes = dimensions * 4
+        self._matrices: "OrderedDict[int, np.memmap]" = OrderedDict()
+
+    def _base(self, user_id: int) -> str:
+        return os.path.join(self.path, f"{user_id % 256:02x}", str(user_id))
+
+    def count(self, user_id: int) -> int:
+        """Get the number of turns stored for a user."""
+        try:
+            return os.path.getsize(self._base(user_id) + ".vec") // self._row_bytes
+        except FileNotFoundError:
+            return 0
+
+    def append(self, user_id: int, vectors: "np.ndarray", texts: Sequence[str]) -> None:
+        """Store turns and their unit vectors."""
+        base = self._base(user_id)
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        self._matrices.pop(user_id, None)
+
+        # A crash mid-append can leave a partial row, drop it first
+        rows = self.count(user_id)
+        for suffix, size in ((".vec", self._row_bytes), (".idx", TEXT_ENTRY.size)):
+            try:
+                if os.path.getsize(base + suffix) != rows * size:
+                    os.truncate(base + suffix, rows * size)
+            except FileNotFoundError:
+                pass
+
+        # Texts and their index first, so every stored row has its text
+        entries = []
+        with open(base + ".txt", "ab") as file:
+            for text in texts:
+                data = text.encode("utf-8")
+                entries.append(TEXT_ENTRY.pack(file.tell(), len(data)))
+                file.write(data)
+        with open(base + ".idx", "ab") as file:
+            file.write(b"".join(entries))
+        with open(base + ".vec", "ab") as file:
+            file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+
+    def _matrix(self, user_id: int) -> Optional["np.memmap"]:
+        matrix = self._matrices.get(user_id)
+        if matrix is not None:
+            self._matrices.move_to_end(user_id)
+            return matrix
+        rows = self.count(user_id)
+        if not rows:
+            return None
+        matrix = np.memmap(
+            self._base(user_id) + ".vec",
+            dtype=np.float32,
+            mode="r",
+            shape=(rows, self.dimensions),
+        )
+        self._matrices[user_id] = matrix
+        if len(self._matrices) > self.max_open:
+            self._matrices.popitem(last=False)
+        return matrix
+
+    def search(
+        self, user_id: int, queries: "np.ndarray", k: int, rows: Optional[int] = None
+    ) -> Tuple["np.ndarray", "np.ndarray"]:
+        """
+        Find a user's turns most similar to each query.
+
+        Args:
+            user_id: Discord user ID
+            queries: (queries, dimensions) unit vectors
+            k: Matches per query
+            rows: Only search the oldest rows turns
+
+        Returns:
+            Row indices and scores as for top_k_cosine
+        """
+        matrix = self._matrix(user_id)
+        if matrix is not None and rows is not None:
+            matrix = matrix[:rows]
+        if matrix is None or not len(matrix):
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        return top_k_cosine(matrix, queries, k)
+
+    def texts(self, user_id: int, rows: Sequence[int]) -> List[str]:
+        """Read the texts of a user's turns."""
+        base = self._base(user_id)
+        texts = []
+        with open(base + ".idx", "rb") as index, open(base + ".txt", "rb") as file:
+            for row in rows:
+                index.seek(row * TEXT_ENTRY.size)
+                offset, length = TEXT_ENTRY.unpack(index.read(TEXT_ENTRY.size))
+                file.seek(offset)
+                texts.append(file.read(length).decode("utf-8"))
+        return texts
+
+    def delete(self, user_id: int) -> None:
+        """Remove everything stored for a user."""
+        self._matrices.pop(user_id, None)
+        for suffix in (".vec", ".idx", ".txt"):
+            try:
+                os.remove(self._base(user_id) + suffix)
+            except FileNotFoundError:
+                pass
+
+    def close(self) -> None:
+        """Unmap open matrices."""
+        self._matrices.clear()
+
+
+class LongTermMemory:
+    """
+    Recall a user's older turns that are relevant to a new prompt.
+
+    Completed turns are embedded and appended to the user's vector store in
+    the background, in batches and in order. Each prompt is embedded and
+    matched against the stored turns that are no longer in the recent
+    history, and the best few above min_score are returned for the prompt.
+
+    Disk access and searches run on one DiskWorker thread, so the store needs
+    no locking.
+    """
+
+    def __init__(
+        self,
+        store: VectorStore,
+        provider: EmbeddingProvider,
+        top_k: int = 3,
+        min_score: float = 0.3,
+    ):
+        self.store = store
+        self.provider = provider
+        self.top_k = top_k
+        self.min_score = min_score
+        self._worker = DiskWorker("long-term-memory")
+        # (user id, turn text), or (user id, None) to forget the user. Turns
+        # are bounded by _enqueue, so a forget always fits behind them.
+        self._queue: "asyncio.Queue[Tuple[int, Optional[str]]]" = asyncio.Queue()
+        self._pending_turns = 0
+        self._writer: Optional[asyncio.Task] = None
+        # user_id -> turns remembered but not yet stored. Only decreased on
+        # the memory thread, so it's consistent with the stored count there.
+        self._unstored: Dict[int, int] = {}
+
+    def _searchable_rows(self, user_id: int, skip_recent: int) -> int:
+        """Count the stored turns older than the newest skip_recent turns."""
+        stored = self.store.count(user_id)
+        # Writes lag behind, so the newest turns may not be stored yet
+        remembered = stored + self._unstored.get(user_id, 0)
+        return min(stored, remembered - skip_recent)
+
+    def _store_turns(
+        self, user_id: int, vectors: Optional["np.ndarray"], texts: List[str]
+    ) -> None:
+        """Append turns, or drop them if they couldn't be embedded."""
+        try:
+            if vectors is not None:
+                self.store.append(user_id, vectors, texts)
+        finally:
+            left = self._unstored.get(user_id, 0) - len(texts)
+            if left > 0:
+                self._unstored[user_id] = left
+            else:
+                self._unstored.pop(user_id, None)
+
+    def _recall(self, user_id: int, query: "np.ndarray", rows: int) -> List[str]:
+        indices, scores = self.store.search(user_id, query, self.top_k, rows)
+        matches = sorted(
+            int(row)
+            for row, score in zip(indices[0], scores[0])
+            if score >= self.min_score
+        )
+        # Chronological order reads more naturally in the prompt
+        return self.store.texts(user_id, matches)
+
+    async def recall(
+        self, user_id: int, prompt: str, skip_recent: int = 0
+    ) -> List[str]:
+        """
+        Get a user's stored turns most relevant to a prompt.
+
+        Args:
+            user_id: Discord user ID
+            prompt: The new prompt
+            skip_recent: Newest turns to leave out, as they are still in the
+                prompt window. Counted from the turns remembered, stored yet
+                or not.
+
+        Returns:
+            Turn texts, oldest first. Empty if nothing relevant was found or
+            the embedding provider failed.
+        """
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        try:
+            rows = await self._worker.run(self._searchable_rows, user_id, skip_recent)
+            if rows <= 0:
+                return []
+            query = await self.provider.embed([prompt])
+            if query is None:
+                return []
+            turns = await self._worker.run(self._recall, user_id, query, rows)
+        except Exception as e:
+            # Memory only enriches the prompt, so answer without it
+            logger.error(f"Failed to recall long-term memory for user {user_id}: {e}")
+            return []
+        RECALL_LATENCY.observe(loop.time() - started_at)
+        return turns
+
+    def remember(self, user_id: int, prompt: str, response: str) -> None:
+        """Queue a completed turn to be embedded and stored."""
+        text = f"User: {prompt}\nAssistant: {response}"[:MAX_TURN_CHARS]
+        self._enqueue(user_id, text)
+
+    def forget(self, user_id: int) -> None:
+        """Queue the removal of everything stored for a user."""
+        self._enqueue(user_id, None)
+
+    def _enqueue(self, user_id: int, text: Optional[str]) -> None:
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+        if text is not None:
+            if self._pending_turns >= MAX_PENDING_TURNS:
+                logger.warning("Long-term memory queue is full, dropped a turn")
+                return
+            self._pending_turns += 1
+            self._unstored[user_id] = self._unstored.get(user_id, 0) + 1
+        self._queue.put_nowait((user_id, text))
+
+    async def _write_loop(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < REMEMBER_BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._write(batch)
+            except Exception as e:
+                logger.error(f"Failed to store long-term memory: {e}")
+            finally:
+                for _, text in batch:
+                    if text is not None:
+                        self._pending_turns -= 1
+                    self._queue.task_done()
+
+    async def _write(self, batch: List[Tuple[int, Optional[str]]]) -> None:
+        """Embed a batch of turns in one request and store them in order."""
+        texts = [text for _, text in batch if text is not None]
+        vectors = await self.provider.embed(texts) if texts else None
+        if texts and vectors is None:
+            logger.warning(f"Failed to embed {len(texts)} turns for long-term memory")
+
+        # Consecutive turns of the same user are appended together
+        start = position = 0
+        while start < len(batch):
+            user_id, text = batch[start]
+            if text is None:
+                await self._worker.run(self.store.delete, user_id)
+                start += 1
+                continue
+            end = start + 1
+            while (
+                end < len(batch)
+                and batch[end][0] == user_id
+                and batch[end][1] is not None
+            ):
+                end += 1
+            run = [text for _, text in batch[start:end]]
+            await self._worker.run(
+                self._store_turns,
+                user_id,
+                None if vectors is None else vectors[position : position + len(run)],
+                run,
+            )
+            position += end - start
+            start = end
+
+    async def close(self) -> None:
+        """Store the queued turns and release the store."""
+        if self._writer is not None:
+            await self._queue.join()
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        await self._worker.run(self.store.close)
+        await self._worker.close()
+
+
+def create_long_term_memory(
+    settings: Settings, openai_client: "OpenAIClient"
+) -> Optional[LongTermMemory]:
+    """
+    Create long-term memory from configuration.
+
+    Returns:
+        Configured memory, or None if NumPy isn't installed
+    """
+    if np is None:
+        logger.warning("LONG_TERM_MEMORY needs the numpy package, disabling it")
+        return None
+    provider = create_embedding_provider(
+        settings.memory_embedding_provider,
+        openai_client,
+        settings.memory_embedding_model,
+        settings.memory_dimensions,
+        settings.memory_timeout,
+    )
+    logger.info(f"Using long-term memory at {settings.memory_path}")
+    return LongTermMemory(
+        VectorStore(settings.memory_path, settings.memory_dimensions),
+        provider,
+        top_k=settings.memory_top_k,
+        min_score=settings.memory_min_score,
+    )
@@ -1,62 +1,660 @@
-"""OpenAI API client wrapper."""
+"""
+OpenAI API client wrapper.
 
-from typing import Dict, List, Optional
+The OpenAI SDK and httpx take most of the bot's import time, so they are
+imported when the client is first used rather than with this module.
+"""
 
-from openai import AsyncOpenAI
-from openai.types.chat import ChatCompletion
+import asyncio
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional
 
 from config.settings import Settings
-from utils.logger import get_logger
+from core.prompt_cache import PromptCacheStats
+from core.response_cache import ResponseCache, make_cache_key
+from core.resilience import (
+    ERRORS,
+    CircuitBreaker,
+    ErrorClass,
+    RetryPolicy,
+    classify_error,
+    get_retry_after,
+)
+from core.routing import ROUTES, ModelRouter, Route
+from core.scheduler import RequestScheduler
+from utils.logger import get_logger, get_sampled_logger
+from utils.metrics import Counter, Gauge, Histogram
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+    from openai.types import Batch
+    from openai.types.chat import ChatCompletion
 
 logger = get_logger()
+request_logger = get_sampled_logger()
+
+OPENAI_LATENCY = Histogram(
+    "discordgpt_openai_latency_seconds",
+    "Duration of successful OpenAI requests, excluding queue wait and retries",
+    ["mode"],
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "discordgpt_time_to_first_token_seconds",
+    "Time from sending a streamed request to its first content delta",
+)
+TOKENS = Counter("discordgpt_tokens_total", "OpenAI tokens used", ["kind"])
+POOL_CONNECTIONS = Gauge(
+    "discordgpt_openai_pool_connections", "Open connections in the OpenAI HTTP pool"
+)
+POOL_IDLE_CONNECTIONS = Gauge(
+    "discordgpt_openai_pool_idle_connections",
+    "Idle connections in the OpenAI HTTP pool",
+)
+
+
+def create_http_client(settings: Settings) -> "httpx.AsyncClient":
+    """Build the pooled HTTP client used for OpenAI requests."""
+    import httpx
+    from openai import DefaultAsyncHttpxClient
+
+    limits = httpx.Limits(
+        max_connections=settings.openai_max_connections,
+        max_keepalive_connections=settings.openai_max_keepalive_connections,
+        keepalive_expiry=settings.openai_keepalive_expiry,
+    )
+    timeout = httpx.Timeout(
+        settings.openai_request_deadline, connect=settings.openai_connect_timeout
+    )
+    try:
+        return DefaultAsyncHttpxClient(
+            limits=limits, timeout=timeout, http2=settings.openai_http2
+        )
+    except ImportError:
+        logger.warning("OPENAI_HTTP2 needs the h2 package, using HTTP/1.1")
+        return DefaultAsyncHttpxClient(limits=limits, timeout=timeout)
+
+
+class _StreamAborted(Exception):
+    """Raised inside the client when a stream ends because of an error."""
+
+
+class StreamInterrupted(Exception):
+    """Raised when a stream fails after some of the response was yielded."""
 
 
 class OpenAIClient:
-    """Wrapper for OpenAI API interactions."""
+    """
+    Wrapper for OpenAI API interactions.
+
+    Constructing it is cheap: the SDK client and its connection pool are
+    created on first use, normally by start() once the bot is ready.
+    """
 
     def __init__(self, settings: Settings):
         self.settings = settings
-        self.client = AsyncOpenAI(api_key=settings.openai_api_key)
+        self.http_client: Optional["httpx.AsyncClient"] = None
+        self._client: Optional["AsyncOpenAI"] = None
+        self.scheduler = RequestScheduler(
+            settings.openai_max_in_flight, settings.openai_max_queue
+        )
+        self.retry_policy = RetryPolicy(
+            max_retries=settings.openai_max_retries,
+            base_delay=settings.openai_retry_base_delay,
+            max_delay=settings.openai_retry_max_delay,
+            deadline=settings.openai_request_deadline,
+        )
+        self.router = ModelRouter(
+            settings.openai_model,
+            settings.openai_fallback_model or None,
+            short_prompt_chars=settings.route_short_prompt_chars,
+            short_context_tokens=settings.route_short_context_tokens,
+            queue_depth=settings.route_queue_depth,
+            error_rate=settings.route_error_rate,
+        )
+        # Models fail independently, so each has its own circuit
+        self.breakers: Dict[str, CircuitBreaker] = {
+            model: CircuitBreaker(
+                failure_threshold=settings.circuit_failure_threshold,
+                reset_timeout=settings.circuit_reset_timeout,
+            )
+            for model in self.router.models
+        }
+        self.breaker = self.breakers[settings.openai_model]
+        self.embedding_breaker = CircuitBreaker(
+            failure_threshold=settings.circuit_failure_threshold,
+            reset_timeout=settings.circuit_reset_timeout,
+        )
+        self.prompt_cache = PromptCacheStats(settings.max_conversations or 10000)
+        self.cache: Optional[ResponseCache] = None
+        if settings.response_cache:
+            self.cache = ResponseCache(
+                max_entries=settings.response_cache_size,
+                ttl=settings.response_cache_ttl,
+                disk_path=settings.response_cache_path,
+                stateless_only=settings.response_cache_stateless_only,
+            )
+
+        self._last_used = time.monotonic()
+        self._warmup_task: Optional[asyncio.Task] = None
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        """The SDK client, created on first access."""
+        if self._client is None:
+            from openai import AsyncOpenAI
+
+            self.http_client = create_http_client(self.settings)
+            # Retries are handled here, with deadlines and the circuit breaker
+            self._client = AsyncOpenAI(
+                api_key=self.settings.openai_api_key,
+                base_url=self.settings.openai_base_url,
+                max_retries=0,
+                http_client=self.http_client,
+            )
+        return self._client
+
+    def start(self) -> None:
+        """
+        Create the SDK client, then warm up the connection pool and start
+        keepalive pings, if enabled.
+        """
+        # Built now, so the first request doesn't pay for it
+        self.client
+        if self.settings.openai_warmup_connections and self._warmup_task is None:
+            self._warmup_task = asyncio.create_task(self._initial_warm_up())
+        if self.settings.openai_keepalive_interval and self._keepalive_task is None:
+            self._keepalive_task = asyncio.create_task(self._keepalive_loop())
+
+    async def warm_up(self, connections: Optional[int] = None) -> None:
+        """
+        Open pooled connections ahead of the first requests.
+
+        Args:
+            connections: Connections to open, defaults to OPENAI_WARMUP_CONNECTIONS
+
+        Raises:
+            The first error if any connection failed
+        """
+        count = connections or max(self.settings.openai_warmup_connections, 1)
+        # Concurrent requests each need their own connection
+        results = await asyncio.gather(
+            *(self._ping() for _ in range(count)), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def _ping(self) -> None:
+        self._last_used = time.monotonic()
+        deadline_at = self._last_used + 2 * self.settings.openai_connect_timeout
+        # Listing models is free and goes through the same pool and auth
+        await self.client.models.list(timeout=self._timeout(deadline_at))
+
+    async def _initial_warm_up(self) -> None:
+        started_at = time.monotonic()
+        try:
+            await self.warm_up()
+        except Exception as e:
+            logger.warning(f"OpenAI connection warm-up failed: {e}")
+            return
+        logger.info(
+            f"Warmed up {self.settings.openai_warmup_connections} OpenAI "
+            f"connections in {time.monotonic() - started_at:.2f}s"
+        )
+
+    async def _keepalive_loop(self) -> None:
+        interval = self.settings.openai_keepalive_interval
+        while True:
+            await asyncio.sleep(interval)
+            idle = time.monotonic() - self._last_used >= interval
+            if not idle or self.breaker.is_open():
+                continue
+            try:
+                await self.warm_up()
+            except Exception as e:
+                logger.warning(f"OpenAI keepalive ping failed: {e}")
+
+    def circuit_open(self) -> bool:
+        """Whether every model's circuit is open, so requests would fail fast."""
+        return all(breaker.is_open() for breaker in self.breakers.values())
+
+    def route(self, prompt_chars: int, conversation_tokens: int) -> Route:
+        """
+        Pick the model for a user's prompt from its size and the current load.
+
+        Args:
+            prompt_chars: Length of the user's prompt
+            conversation_tokens: Prompt tokens of the whole request
+        """
+        return self.router.choose(
+            prompt_chars,
+            conversation_tokens,
+            self.scheduler.queued,
+            self.breaker.is_open(),
+        )
+
+    def _claim(self, route: Route) -> bool:
+        """
+        Check whether an attempt may be sent, failing over to the other model
+        if the route's circuit is open. That works both ways, so requests
+        routed to the fallback use the primary while the fallback is down.
+        """
+        if self.breakers[route.model].allow():
+            return True
+        for model in self.router.models:
+            if model != route.model and self.breakers[model].allow():
+                logger.warning(
+                    f"{route.model} circuit is open, failing over to {model}"
+                )
+                route.model = model
+                route.reason = Route.CIRCUIT_OPEN
+                return True
+        return False
+
+    def _record_success(self, route: Route) -> None:
+        self.breakers[route.model].record_success()
+        self.router.record(route.model, failed=False)
+
+    def _record_failure(self, route: Route, error_class: ErrorClass) -> None:
+        ERRORS.labels(error_class.value).inc()
+        self.breakers[route.model].record_failure(error_class)
+        self.router.record(route.model, failed=error_class.retryable)
+
+    def register_metrics(self) -> None:
+        """Export the pool, scheduler and prompt cache as the process's gauges."""
+        POOL_CONNECTIONS.set_function(lambda: self.pool_stats()["connections"])
+        POOL_IDLE_CONNECTIONS.set_function(lambda: self.pool_stats()["idle"])
+        self.scheduler.register_metrics()
+        self.prompt_cache.register_metrics()
+
+    def pool_stats(self) -> Dict[str, int]:
+        """Count the connections in the HTTP pool, by state."""
+        # httpx doesn't expose its pool, so look at httpcore's through the transport
+        pool = getattr(getattr(self.http_client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", None) or [])
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {
+            "connections": len(connections),
+            "idle": idle,
+            "active": len(connections) - idle,
+        }
+
+    def _timeout(self, deadline_at: float) -> "httpx.Timeout":
+        """Timeout for an attempt that must finish by deadline_at."""
+        import httpx
+
+        remaining = max(deadline_at - time.monotonic(), 0.001)
+        return httpx.Timeout(
+            remaining, connect=min(self.settings.openai_connect_timeout, remaining)
+        )
+
+    def _cache_key(
+        self, messages: List[Dict[str, str]], max_tokens: int, model: str
+    ) -> Optional[str]:
+        """Get the cache key for a request, or None if it isn't cacheable."""
+        if self.cache is None or not self.cache.cacheable(messages):
+            return None
+        return make_cache_key(model, max_tokens, messages)
+
+    def _log_usage(self, usage, user_id: int) -> None:
+        details = usage.prompt_tokens_details
+        cached_tokens = (details.cached_tokens or 0) if details else 0
+        TOKENS.labels("prompt").inc(usage.prompt_tokens)
+        TOKENS.labels("cached").inc(cached_tokens)
+        TOKENS.labels("completion").inc(usage.completion_tokens)
+        self.prompt_cache.record(user_id, usage.prompt_tokens, cached_tokens)
+        request_logger.debug(
+            "Token usage - Prompt: {prompt_tokens} ({cached_tokens} cached), "
+            "Completion: {completion_tokens}, Total: {total_tokens}",
+            prompt_tokens=usage.prompt_tokens,
+            cached_tokens=cached_tokens,
+            completion_tokens=usage.completion_tokens,
+            total_tokens=usage.total_tokens,
+        )
+
+    def _cache_options(self, user_id: int) -> dict:
+        """Extra request options that help OpenAI reuse a user's cached prompt."""
+        if not self.settings.openai_prompt_cache_key or not user_id:
+            return {}
+        # Requests with the same key are routed to the same cache
+        return {"prompt_cache_key": f"user-{user_id}"}
+
+    async def _should_retry(
+        self, error: Exception, attempt: int, deadline_at: float, route: Route
+    ) -> bool:
+        """Record a failed attempt and wait before retrying it if worthwhile."""
+        error_class = classify_error(error)
+        self._record_failure(route, error_class)
+        delay = None
+        # The next attempt may fail over to another model
+        if not self.circuit_open():
+            delay = self.retry_policy.get_delay(
+                attempt, error_class, get_retry_after(error), deadline_at
+            )
+
+        if delay is None:
+            logger.error(f"OpenAI API error ({error_class.value}): {error}")
+            return False
+
+        logger.warning(
+            f"OpenAI API error ({error_class.value}), retrying in {delay:.2f}s: {error}"
+        )
+        await asyncio.sleep(delay)
+        return True
 
     async def get_chat_completion(
-        self, messages: List[Dict[str, str]]
+        self,
+        messages: List[Dict[str, str]],
+        user_id: int = 0,
+        max_tokens: Optional[int] = None,
+        route: Optional[Route] = None,
+        cache: bool = True,
     ) -> Optional[str]:
         """
         Get a chat completion from OpenAI.
 
+        Cached responses are returned without calling OpenAI. Transient
+        failures are retried with jittered backoff until the request deadline.
+        While every model's circuit is open this returns immediately.
+
         Args:
             messages: List of messages in OpenAI format
+            user_id: User the request is for, used to share the queue fairly
+            max_tokens: Completion token limit, defaults to MAX_RESPONSE_TOKENS
+            route: Model to use, from route(). Defaults to the primary model,
+                and is updated if the request fails over.
+            cache: Whether the response cache may be used. Requests carrying
+                private data that isn't a prompt, like a transcript to
+                summarize, pass False so it never reaches the cache.
 
         Returns:
             Assistant's response text or None if error
+
+        Raises:
+            SchedulerFull: If too many requests are already queued
         """
-        try:
-            response: ChatCompletion = await self.client.chat.completions.create(
-                model=self.settings.openai_model,
-                messages=messages,
-                max_tokens=self.settings.max_response_tokens,
-            )
-
-            if response.choices and len(response.choices) > 0:
-                content = response.choices[0].message.content
-
-                # Log token usage
-                if response.usage:
-                    logger.debug(
-                        f"Token usage - Prompt: {response.usage.prompt_tokens}, "
-                        f"Completion: {response.usage.completion_tokens}, "
-                        f"Total: {response.usage.total_tokens}"
-                    )
-
-                return content
-            else:
-                logger.error("No choices in OpenAI response")
+        if max_tokens is None:
+            max_tokens = self.settings.max_response_tokens
+        if route is None:
+            route = Route(self.router.primary)
+        cache_key = None
+        if cache:
+            cache_key = self._cache_key(messages, max_tokens, route.model)
+        if cache_key is not None:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        if self.circuit_open():
+            logger.error("OpenAI circuit is open, failing fast")
+            return None
+
+        async with self.scheduler.slot(user_id):
+            content = await self._get_chat_completion(
+                messages, max_tokens, route, user_id
+            )
+        ROUTES.labels(route.model, route.reason).inc()
+
+        if cache_key is not None and content:
+            self.cache.put(cache_key, content)
+        return content
+
+    async def _get_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        route: Route,
+        user_id: int,
+    ) -> Optional[str]:
+        deadline_at = time.monotonic() + self.retry_policy.deadline
+        attempt = 0
+        while True:
+            if not self._claim(route):
+                logger.error("OpenAI circuit is open, failing fast")
                 return None
+            started_at = self._last_used = time.monotonic()
+            try:
+                response: "ChatCompletion" = await self.client.chat.completions.create(
+                    model=route.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    timeout=self._timeout(deadline_at),
+                    **self._cache_options(user_id),
+                )
+                self._record_success(route)
+                OPENAI_LATENCY.labels("completion").observe(
+                    time.monotonic() - started_at
+                )
+                break
+            except Exception as e:
+                if not await self._should_retry(e, attempt, deadline_at, route):
+                    return None
+                attempt += 1
+
+        if response.choices and len(response.choices) > 0:
+            content = response.choices[0].message.content
+
+            # Log token usage
+            if response.usage:
+                self._log_usage(response.usage, user_id)
+
+            return content
+        else:
+            logger.error("No choices in OpenAI response")
+            return None
+
+    async def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        user_id: int = 0,
+        route: Optional[Route] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a chat completion from OpenAI.
+
+        Failures before the first delta are retried like get_chat_completion.
+        Once content has been yielded the stream can't be restarted, so later
+        failures raise StreamInterrupted and the partial text must be treated
+        as incomplete.
+
+        Args:
+            messages: List of messages in OpenAI format
+            user_id: User the request is for, used to share the queue fairly
+            route: Model to use, as for get_chat_completion
+
+        Yields:
+            Content deltas as they arrive. Errors before the first one are
+            logged and end the stream without content.
+
+        Raises:
+            SchedulerFull: If too many requests are already queued
+            StreamInterrupted: If the stream failed after yielding content
+        """
+        if route is None:
+            route = Route(self.router.primary)
+        cache_key = self._cache_key(
+            messages, self.settings.max_response_tokens, route.model
+        )
+        if cache_key is not None:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        if self.circuit_open():
+            logger.error("OpenAI circuit is open, failing fast")
+            return
+
+        parts: List[str] = []
+        async with self.scheduler.slot(user_id):
+            try:
+                stream = self._stream_chat_completion(messages, route, user_id)
+                async for delta in stream:
+                    parts.append(delta)
+                    yield delta
+            except _StreamAborted:
+                if parts:
+                    raise StreamInterrupted() from None
+                return
+            finally:
+                ROUTES.labels(route.model, route.reason).inc()
+
+        # Only streams that completed normally are cached
+        if cache_key is not None and parts:
+            self.cache.put(cache_key, "".join(parts))
+
+    async def _stream_chat_completion(
+        self, messages: List[Dict[str, str]], route: Route, user_id: int
+    ) -> AsyncIterator[str]:
+        deadline_at = time.monotonic() + self.retry_policy.deadline
+        attempt = 0
+        while True:
+            if not self._claim(route):
+                logger.error("OpenAI circuit is open, failing fast")
+                raise _StreamAborted()
+
+            started = False
+            started_at = self._last_used = time.monotonic()
+            try:
+                stream = await self.client.chat.completions.create(
+                    model=route.model,
+                    messages=messages,
+                    max_tokens=self.settings.max_response_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    timeout=self._timeout(deadline_at),
+                    **self._cache_options(user_id),
+                )
+
+                async for chunk in stream:
+                    # The final chunk carries usage and no choices
+                    if chunk.usage:
+                        self._log_usage(chunk.usage, user_id)
+
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not started:
+                            started = True
+                            TIME_TO_FIRST_TOKEN.observe(time.monotonic() - started_at)
+                        yield chunk.choices[0].delta.content
+
+                self._record_success(route)
+                OPENAI_LATENCY.labels("stream").observe(time.monotonic() - started_at)
+                return
+
+            except Exception as e:
+                if started:
+                    self._record_failure(route, classify_error(e))
+                    logger.error(f"OpenAI API streaming error: {e}")
+                    raise _StreamAborted() from e
+                if not await self._should_retry(e, attempt, deadline_at, route):
+                    raise _StreamAborted() from e
+                attempt += 1
+
+    async def get_embeddings(
+        self, texts: List[str], model: str, dimensions: int, timeout: float
+    ) -> Optional[List[List[float]]]:
+        """
+        Embed texts in one request.
+
+        Embeddings only enrich prompts, so they get a single attempt and
+        aren't queued behind completions.
 
+        Args:
+            texts: Texts to embed
+            model: Embedding model
+            dimensions: Length of the returned vectors
+            timeout: Seconds the request may take
+
+        Returns:
+            One vector per text, in order, or None if error
+        """
+        if not self.embedding_breaker.allow():
+            return None
+        deadline_at = time.monotonic() + timeout
+        try:
+            response = await self.client.embeddings.create(
+                model=model,
+                input=texts,
+                dimensions=dimensions,
+                timeout=self._timeout(deadline_at),
+            )
+        except Exception as e:
+            error_class = classify_error(e)
+            ERRORS.labels(error_class.value).inc()
+            self.embedding_breaker.record_failure(error_class)
+            logger.error(f"OpenAI embeddings error: {e}")
+            return None
+        self.embedding_breaker.record_success()
+        if response.usage:
+            TOKENS.labels("embedding").inc(response.usage.prompt_tokens)
+        return [item.embedding for item in response.data]
+
+    async def create_batch(
+        self, filename: str, data: bytes, endpoint: str, completion_window: str
+    ) -> Optional[str]:
+        """
+        Upload a Batch API input file and start a batch for it.
+
+        Batches aren't interactive, so failures aren't retried here or counted
+        against the circuit; the caller tries again later.
+
+        Args:
+            filename: Name of the uploaded file
+            data: JSONL requests, one per line
+            endpoint: API path every request in the file calls
+            completion_window: Time OpenAI has to finish the batch, e.g. "24h"
+
+        Returns:
+            The batch id, or None if error
+        """
+        try:
+            uploaded = await self.client.files.create(
+                file=(filename, data, "application/jsonl"), purpose="batch"
+            )
+            batch = await self.client.batches.create(
+                input_file_id=uploaded.id,
+                endpoint=endpoint,
+                completion_window=completion_window,
+            )
+        except Exception as e:
+            ERRORS.labels(classify_error(e).value).inc()
+            logger.error(f"OpenAI batch submission error: {e}")
+            return None
+        return batch.id
+
+    async def get_batch(self, batch_id: str) -> Optional["Batch"]:
+        """Get the status of a batch, or None if error."""
+        try:
+            return await self.client.batches.retrieve(batch_id)
+        except Exception as e:
+            ERRORS.labels(classify_error(e).value).inc()
+            logger.error(f"OpenAI batch status error for {batch_id}: {e}")
+            return None
+
+    async def get_file_content(self, file_id: str) -> Optional[str]:
+        """Download a file, such as a batch's output, or None if error."""
+        try:
+            response = await self.client.files.content(file_id)
         except Exception as e:
-            logger.error(f"OpenAI API error: {e}")
+            ERRORS.labels(classify_error(e).value).inc()
+            logger.error(f"OpenAI file download error for {file_id}: {e}")
             return None
+        return response.text
 
     async def close(self) -> None:
-        """Close the OpenAI client."""
-        await self.client.close()
+        """Stop keepalive pings and close the OpenAI client and response cache."""
+        for task in (self._warmup_task, self._keepalive_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._warmup_task = None
+        self._keepalive_task = None
+        if self.cache is not None:
+            await self.cache.close()
+        if self._client is not None:
+            await self._client.close()
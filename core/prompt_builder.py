@@ -1,19 +1,71 @@
 """Build prompts for OpenAI API."""
 
-from typing import List, Dict
+from typing import Dict, List, Optional
 
+from config.prompts import MEMORY_PREFIX, SUMMARIZE_PROMPT, SUMMARY_PREFIX
 
-def build_messages(conversation_history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+
+def build_messages(
+    system_message: Dict[str, str],
+    conversation_history: List[Dict[str, str]],
+    summary_message: Optional[Dict[str, str]] = None,
+    memory_message: Optional[Dict[str, str]] = None,
+) -> List[Dict[str, str]]:
     """
     Build message list for OpenAI API.
 
+    Messages are ordered from the most to the least stable, because OpenAI
+    caches prompts by their longest repeated prefix: the system prompt, the
+    summary and the history are the same from one turn to the next, while
+    recalled turns differ for every prompt and so go just before the newest
+    message.
+
+    Args:
+        system_message: System prompt in OpenAI format
+        conversation_history: Recent messages with role and content
+        summary_message: Summary of older messages, if any
+        memory_message: Older turns recalled from long-term memory, if any
+
+    Returns:
+        Formatted message list ready for OpenAI API: system prompt, summary,
+        earlier turns, recalled turns, then the newest message
+    """
+    messages = [system_message]
+    if summary_message is not None:
+        messages.append(summary_message)
+    messages.extend(conversation_history[:-1])
+    if memory_message is not None:
+        messages.append(memory_message)
+    messages.extend(conversation_history[-1:])
+    return messages
+
+
+def build_summary_message(summary: str) -> Dict[str, str]:
+    """Wrap a running summary as a system message."""
+    return {"role": "system", "content": SUMMARY_PREFIX + summary}
+
+
+def build_memory_message(turns: List[str]) -> Dict[str, str]:
+    """Wrap turns recalled from long-term memory as a system message."""
+    return {"role": "system", "content": MEMORY_PREFIX + "\n\n".join(turns)}
+
+
+def build_summary_request(
+    summary: Optional[str], messages: List[Dict[str, str]]
+) -> List[Dict[str, str]]:
+    """
+    Build a request asking the model to fold messages into a summary.
+
     Args:
-        conversation_history: List of messages with role and content
+        summary: Current running summary, if any
+        messages: Messages to fold in, oldest first
 
     Returns:
-        Formatted message list ready for OpenAI API
+        Message list ready for OpenAI API
     """
-    return conversation_history
+    transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+    prompt = SUMMARIZE_PROMPT.format(summary=summary or "(none)", messages=transcript)
+    return [{"role": "user", "content": prompt}]
 
 
 def validate_message_format(messages: List[Dict[str, str]]) -> bool:
@@ -0,0 +1,70 @@
+"""Accounting of prompt tokens served from OpenAI's prompt cache."""
+
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from utils.metrics import Gauge
+
+PROMPT_CACHE_HIT_RATIO = Gauge(
+    "discordgpt_prompt_cache_hit_ratio",
+    "Share of prompt tokens OpenAI served from its prompt cache",
+)
+
+
+class PromptCacheStats:
+    """
+    Prompt and cached token totals, overall and per user.
+
+    Per-user totals are kept for the max_users most recently active users,
+    so their memory is bounded like the conversations themselves.
+    """
+
+    def __init__(self, max_users: int = 10000):
+        self.max_users = max_users
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        # user_id -> [prompt tokens, cached tokens], least recent first
+        self._users: "OrderedDict[int, List[int]]" = OrderedDict()
+
+    def register_metrics(self) -> None:
+        """Export these totals' hit rate as the process's gauge."""
+        PROMPT_CACHE_HIT_RATIO.set_function(lambda: self.hit_rate() or 0.0)
+
+    def record(self, user_id: int, prompt_tokens: int, cached_tokens: int) -> None:
+        """Record the usage of one request."""
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        if not user_id:
+            return
+        totals = self._users.get(user_id)
+        if totals is None:
+            totals = self._users[user_id] = [0, 0]
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        totals[0] += prompt_tokens
+        totals[1] += cached_tokens
+
+    def get(self, user_id: int) -> Tuple[int, int]:
+        """Get a user's prompt and cached token totals."""
+        totals = self._users.get(user_id)
+        return (totals[0], totals[1]) if totals else (0, 0)
+
+    def hit_rate(self, user_id: Optional[int] = None) -> Optional[float]:
+        """
+        Share of prompt tokens that were cached.
+
+        Args:
+            user_id: User to report on, or None for all requests
+
+        Returns:
+            The ratio, or None before any prompt tokens were recorded
+        """
+        if user_id is None:
+            prompt_tokens, cached_tokens = self.prompt_tokens, self.cached_tokens
+        else:
+            prompt_tokens, cached_tokens = self.get(user_id)
+        if not prompt_tokens:
+            return None
+        return cached_tokens / prompt_tokens
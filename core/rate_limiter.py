@@ -0,0 +1,112 @@
+"""Token-bucket rate limiting for users and the OpenAI quota."""
+
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by an arbitrary id, refilled continuously.
+
+    Buckets are kept in least-recently-updated order. A bucket idle long enough
+    to refill completely is indistinguishable from a new one, so those are
+    dropped from the front on every check. Each check is amortized O(1) and
+    memory only grows with the number of recently active keys.
+    """
+
+    def __init__(
+        self, rate: float, per: float = 60.0, capacity: Optional[float] = None
+    ):
+        """
+        Args:
+            rate: Tokens refilled per period
+            per: Period length in seconds
+            capacity: Maximum burst size, defaults to rate
+        """
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.refill_rate = rate / per
+        self.idle_ttl = self.capacity / self.refill_rate
+        # key -> [tokens, last update time]
+        self._buckets: "OrderedDict[Hashable, List[float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _evict_idle(self, now: float) -> None:
+        while self._buckets:
+            _, (_, updated) = next(iter(self._buckets.items()))
+            if now - updated < self.idle_ttl:
+                break
+            self._buckets.popitem(last=False)
+
+    def check(self, key: Hashable, cost: float = 1.0, consume: bool = True) -> float:
+        """
+        Try to take tokens from a key's bucket.
+
+        Args:
+            key: Bucket id, e.g. a user id
+            cost: Tokens required, clamped to the bucket capacity
+            consume: Whether to take the tokens when available
+
+        Returns:
+            0 if the tokens are available, otherwise seconds until they will be
+        """
+        now = time.monotonic()
+        self._evict_idle(now)
+        cost = min(cost, self.capacity)
+
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            tokens = self.capacity
+        else:
+            refilled = (now - bucket[1]) * self.refill_rate
+            tokens = min(self.capacity, bucket[0] + refilled)
+
+        if tokens >= cost:
+            retry_after = 0.0
+            if consume:
+                tokens -= cost
+        else:
+            retry_after = (cost - tokens) / self.refill_rate
+
+        self._buckets[key] = [tokens, now]
+        return retry_after
+
+
+class OpenAIRateLimiter:
+    """Global buckets mirroring the OpenAI requests and tokens per minute limits."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests: Optional[RateLimiter] = None
+        self.tokens: Optional[RateLimiter] = None
+        if requests_per_minute:
+            self.requests = RateLimiter(requests_per_minute)
+        if tokens_per_minute:
+            self.tokens = RateLimiter(tokens_per_minute)
+
+    def check(self, tokens: int) -> float:
+        """
+        Reserve one request and an estimated token count.
+
+        OpenAI counts max_tokens against the tokens-per-minute limit when a
+        request is received, so callers should pass prompt tokens plus
+        max_tokens. Nothing is consumed unless both buckets have room.
+
+        Returns:
+            0 if the request may proceed, otherwise seconds to wait
+        """
+        retry_after = 0.0
+        if self.requests is not None:
+            retry_after = self.requests.check(None, 1, consume=False)
+        if self.tokens is not None:
+            token_wait = self.tokens.check(None, tokens, consume=False)
+            retry_after = max(retry_after, token_wait)
+        if retry_after > 0:
+            return retry_after
+
+        if self.requests is not None:
+            self.requests.check(None, 1)
+        if self.tokens is not None:
+            self.tokens.check(None, tokens)
+        return 0.0
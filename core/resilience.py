@@ -0,0 +1,194 @@
+"""Error classification, retry backoff and circuit breaking for OpenAI calls."""
+
+import random
+import time
+from enum import Enum
+from typing import Optional
+
+from utils.metrics import Counter
+
+ERRORS = Counter(
+    "discordgpt_errors_total", "Errors by class across the pipeline", ["error_class"]
+)
+
+
+class ErrorClass(str, Enum):
+    """Broad categories of OpenAI request failures."""
+
+    RATE_LIMITED = "rate_limited"
+    SERVER = "server"
+    TIMEOUT = "timeout"
+    CONNECTION = "connection"
+    CLIENT = "client"
+    UNKNOWN = "unknown"
+
+    @property
+    def retryable(self) -> bool:
+        """Whether the same request may succeed if sent again."""
+        return self in RETRYABLE_ERRORS
+
+    @property
+    def upstream_failure(self) -> bool:
+        """Whether the error suggests the upstream service is unhealthy."""
+        return self in UPSTREAM_FAILURES
+
+
+RETRYABLE_ERRORS = frozenset(
+    {
+        ErrorClass.RATE_LIMITED,
+        ErrorClass.SERVER,
+        ErrorClass.TIMEOUT,
+        ErrorClass.CONNECTION,
+    }
+)
+UPSTREAM_FAILURES = frozenset(
+    {ErrorClass.SERVER, ErrorClass.TIMEOUT, ErrorClass.CONNECTION}
+)
+
+
+def classify_error(error: Exception) -> ErrorClass:
+    """Classify an exception raised by the OpenAI SDK."""
+    # The SDK is loaded lazily, and was by whatever raised the error
+    import openai
+
+    # Timeout is a subclass of connection error, so check it first
+    if isinstance(error, openai.APITimeoutError):
+        return ErrorClass.TIMEOUT
+    if isinstance(error, openai.APIConnectionError):
+        return ErrorClass.CONNECTION
+    if isinstance(error, openai.RateLimitError):
+        return ErrorClass.RATE_LIMITED
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code == 429:
+            return ErrorClass.RATE_LIMITED
+        if error.status_code >= 500 or error.status_code in (408, 409):
+            return ErrorClass.SERVER
+        return ErrorClass.CLIENT
+    return ErrorClass.UNKNOWN
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Get the server-requested delay in seconds from an error's headers."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        # HTTP-date values are rare from OpenAI, fall back to backoff
+        pass
+    return None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by attempts and a deadline."""
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        deadline: float = 60.0,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def get_delay(
+        self,
+        attempt: int,
+        error_class: ErrorClass,
+        retry_after: Optional[float],
+        deadline_at: float,
+    ) -> Optional[float]:
+        """
+        Decide whether and when to retry a failed attempt.
+
+        Args:
+            attempt: Number of the attempt that failed, starting at 0
+            error_class: Classification of the failure
+            retry_after: Server-requested delay, if any
+            deadline_at: Monotonic time by which the request must finish
+
+        Returns:
+            Seconds to wait before retrying, or None to give up
+        """
+        if not error_class.retryable or attempt >= self.max_retries:
+            return None
+
+        ceiling = min(self.max_delay, self.base_delay * 2**attempt)
+        delay = random.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        # Don't sleep past the deadline only to fail afterwards
+        if time.monotonic() + delay >= deadline_at:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Fail fast while the upstream is down.
+
+    After failure_threshold consecutive upstream failures the circuit opens
+    and requests are refused for reset_timeout seconds. Then a single trial
+    request is let through: success closes the circuit, failure reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def is_open(self) -> bool:
+        """Whether requests are currently being refused."""
+        if self.state == self.CLOSED:
+            return False
+        if self.state == self.HALF_OPEN and not self._trial_in_flight:
+            return False
+        # A trial that never reported back is given up after reset_timeout
+        return time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        """Check whether a request may be sent, claiming the trial if due."""
+        if self.state == self.CLOSED:
+            return True
+        if self.is_open():
+            return False
+        self.state = self.HALF_OPEN
+        self.opened_at = time.monotonic()
+        self._trial_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        """Record a successful request, closing the circuit."""
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self, error_class: ErrorClass) -> None:
+        """Record a failed request, opening the circuit if needed."""
+        if not error_class.upstream_failure:
+            # The upstream answered, so the trial request proves it's up
+            if self.state == self.HALF_OPEN:
+                self.record_success()
+            return
+
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._trial_in_flight = False
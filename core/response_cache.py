@@ -0,0 +1,186 @@
+"""Cache of completions for repeated prompts."""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from core.storage import SQLiteWorker
+from utils.logger import get_logger
+from utils.metrics import Counter
+
+logger = get_logger()
+
+CACHE_LOOKUPS = Counter(
+    "discordgpt_response_cache_lookups_total",
+    "Response cache lookups by result",
+    ["result"],
+)
+
+
+def normalize_content(content: str) -> str:
+    """Normalize text so trivially different prompts share a cache entry."""
+    return " ".join(content.split()).casefold()
+
+
+def make_cache_key(model: str, max_tokens: int, messages: List[Dict[str, str]]) -> str:
+    """
+    Hash the parts of a request that determine its completion.
+
+    Args:
+        model: Model name
+        max_tokens: Completion token limit
+        messages: Messages in OpenAI format
+
+    Returns:
+        Hex digest identifying the request
+    """
+    normalized = [(msg["role"], normalize_content(msg["content"])) for msg in messages]
+    payload = json.dumps([model, max_tokens, normalized], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_stateless(messages: List[Dict[str, str]]) -> bool:
+    """Whether a request is a first turn, with no history besides the prompt."""
+    return sum(1 for msg in messages if msg["role"] != "system") == 1
+
+
+class DiskCache:
+    """SQLite tier for the response cache, accessed through a SQLiteWorker."""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS responses ("
+        "key TEXT PRIMARY KEY, "
+        "response TEXT NOT NULL, "
+        "expires_at REAL NOT NULL)",
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = SQLiteWorker(path, self.SCHEMA, "response-cache")
+
+    def _get(self, key: str) -> Optional[Tuple[str, float]]:
+        row = (
+            self._db.connect()
+            .execute(
+                "SELECT response, expires_at FROM responses "
+                "WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return tuple(row) if row else None
+
+    def _put(self, key: str, response: str, expires_at: float) -> None:
+        conn = self._db.connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, expires_at) "
+                "VALUES (?, ?, ?)",
+                (key, response, expires_at),
+            )
+            conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+
+    async def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """Get a response and its wall-clock expiry time."""
+        return await self._db.run(self._get, key)
+
+    async def put(self, key: str, response: str, expires_at: float) -> None:
+        """Store a response until a wall-clock expiry time."""
+        await self._db.run(self._put, key, response, expires_at)
+
+    async def close(self) -> None:
+        """Close the database and stop the cache thread."""
+        await self._db.close()
+
+
+class ResponseCache:
+    """
+    Two-tier LRU + TTL cache of completions.
+
+    Entries are keyed by model, max_tokens and the normalized message list.
+    The in-memory tier is always used; the optional disk tier survives
+    restarts and is consulted on memory misses. With stateless_only, only
+    first-turn requests are cached, since later turns rarely repeat.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl: float = 3600.0,
+        disk_path: Optional[str] = None,
+        stateless_only: bool = True,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stateless_only = stateless_only
+        self.disk = DiskCache(disk_path) if disk_path else None
+        # key -> (wall-clock expiry, response)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._disk_writes: Set[asyncio.Task] = set()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def cacheable(self, messages: List[Dict[str, str]]) -> bool:
+        """Whether a request may be served from or stored in the cache."""
+        return not self.stateless_only or is_stateless(messages)
+
+    def _remember(self, key: str, expires_at: float, response: str) -> None:
+        self._entries[key] = (expires_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        """Look up a response, checking memory first and then disk."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                CACHE_LOOKUPS.labels("memory_hit").inc()
+                return entry[1]
+            del self._entries[key]
+
+        if self.disk is not None:
+            try:
+                row = await self.disk.get(key)
+            except Exception as e:
+                logger.error(f"Response cache read failed: {e}")
+                row = None
+            if row is not None:
+                response, expires_at = row
+                self._remember(key, expires_at, response)
+                self.disk_hits += 1
+                CACHE_LOOKUPS.labels("disk_hit").inc()
+                return response
+
+        self.misses += 1
+        CACHE_LOOKUPS.labels("miss").inc()
+        return None
+
+    def put(self, key: str, response: str) -> None:
+        """Store a response in memory and write it to disk in the background."""
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, response)
+        if self.disk is not None:
+            task = asyncio.create_task(self._write(key, response, expires_at))
+            self._disk_writes.add(task)
+            task.add_done_callback(self._disk_writes.discard)
+
+    async def _write(self, key: str, response: str, expires_at: float) -> None:
+        try:
+            await self.disk.put(key, response, expires_at)
+        except Exception as e:
+            logger.error(f"Response cache write failed: {e}")
+
+    async def close(self) -> None:
+        """Finish pending disk writes and close the disk tier, if any."""
+        if self._disk_writes:
+            await asyncio.gather(*self._disk_writes)
+        if self.disk is not None:
+            await self.disk.close()
@@ -0,0 +1,138 @@
+"""Per-request choice between the primary model and a cheaper, faster one."""
+
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from utils.metrics import Counter
+
+ROUTES = Counter(
+    "discordgpt_model_routes_total",
+    "OpenAI requests by model and the reason it was chosen",
+    ["model", "reason"],
+)
+
+# Recent attempts per model the error rate is computed over, and how many are
+# needed before it is trusted
+ERROR_WINDOW = 50
+MIN_ERROR_SAMPLES = 10
+
+
+class Route:
+    """The model a request is sent to and why. Updated if it fails over."""
+
+    __slots__ = ("model", "reason")
+
+    # Reasons, from the most to the least pressing
+    CIRCUIT_OPEN = "circuit_open"
+    ERROR_RATE = "error_rate"
+    QUEUE_DEPTH = "queue_depth"
+    SHORT_PROMPT = "short_prompt"
+    PRIMARY = "primary"
+
+    def __init__(self, model: str, reason: str = PRIMARY):
+        self.model = model
+        self.reason = reason
+
+    def __repr__(self) -> str:
+        return f"Route({self.model!r}, {self.reason!r})"
+
+
+class ModelRouter:
+    """
+    Send each request to the primary model or the fallback model.
+
+    Requests go to the fallback when the primary's circuit is open, when its
+    recent error rate reaches error_rate, when queue_depth requests are
+    already waiting, or for short prompts in small conversations. Each
+    trigger is disabled when its threshold is 0, and without a fallback model
+    every request goes to the primary.
+    """
+
+    def __init__(
+        self,
+        primary: str,
+        fallback: Optional[str] = None,
+        short_prompt_chars: int = 0,
+        short_context_tokens: int = 0,
+        queue_depth: int = 0,
+        error_rate: float = 0.0,
+    ):
+        self.primary = primary
+        self.fallback = fallback if fallback != primary else None
+        self.short_prompt_chars = short_prompt_chars
+        self.short_context_tokens = short_context_tokens
+        self.queue_depth = queue_depth
+        self.error_rate_threshold = error_rate
+        # model -> whether each recent attempt failed, newest last
+        self._outcomes: Dict[str, Deque[bool]] = {}
+
+    @property
+    def models(self) -> tuple:
+        """Models requests may be sent to, primary first."""
+        return (self.primary, self.fallback) if self.fallback else (self.primary,)
+
+    def record(self, model: str, failed: bool) -> None:
+        """Record the outcome of an attempt on a model."""
+        outcomes = self._outcomes.get(model)
+        if outcomes is None:
+            outcomes = self._outcomes[model] = deque(maxlen=ERROR_WINDOW)
+        outcomes.append(failed)
+
+    def error_rate(self, model: str) -> float:
+        """Fraction of recent attempts on a model that failed."""
+        outcomes = self._outcomes.get(model)
+        if not outcomes or len(outcomes) < MIN_ERROR_SAMPLES:
+            return 0.0
+        return sum(outcomes) / len(outcomes)
+
+    def _reason(
+        self,
+        prompt_chars: int,
+        conversation_tokens: int,
+        queued: int,
+        primary_open: bool,
+    ) -> str:
+        if primary_open:
+            return Route.CIRCUIT_OPEN
+        if (
+            self.error_rate_threshold
+            and self.error_rate(self.primary) >= self.error_rate_threshold
+        ):
+            return Route.ERROR_RATE
+        if self.queue_depth and queued >= self.queue_depth:
+            return Route.QUEUE_DEPTH
+        if (
+            self.short_prompt_chars
+            and prompt_chars <= self.short_prompt_chars
+            and (
+                not self.short_context_tokens
+                or conversation_tokens <= self.short_context_tokens
+            )
+        ):
+            return Route.SHORT_PROMPT
+        return Route.PRIMARY
+
+    def choose(
+        self,
+        prompt_chars: int = 0,
+        conversation_tokens: int = 0,
+        queued: int = 0,
+        primary_open: bool = False,
+    ) -> Route:
+        """
+        Pick the model for a request.
+
+        Args:
+            prompt_chars: Length of the user's prompt
+            conversation_tokens: Prompt tokens of the whole request
+            queued: Requests currently waiting for a slot
+            primary_open: Whether the primary model's circuit is open
+
+        Returns:
+            The route, which the client may still fail over
+        """
+        if self.fallback is None:
+            return Route(self.primary)
+        reason = self._reason(prompt_chars, conversation_tokens, queued, primary_open)
+        model = self.primary if reason == Route.PRIMARY else self.fallback
+        return Route(model, reason)
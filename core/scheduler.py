@@ -0,0 +1,141 @@
+"""Bounded, fair scheduling of outbound OpenAI requests."""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Hashable
+
+from utils.logger import get_logger, get_sampled_logger
+from utils.metrics import Counter, Gauge, Histogram
+
+logger = get_logger()
+request_logger = get_sampled_logger()
+
+QUEUE_WAIT = Histogram(
+    "discordgpt_queue_wait_seconds", "Time OpenAI requests wait for a slot"
+)
+REQUESTS_SHED = Counter(
+    "discordgpt_requests_shed_total", "OpenAI requests refused by a full queue"
+)
+IN_FLIGHT = Gauge("discordgpt_openai_in_flight", "OpenAI requests in flight")
+QUEUED = Gauge("discordgpt_openai_queued", "OpenAI requests waiting for a slot")
+
+
+class SchedulerFull(Exception):
+    """Raised when the request queue is full and the request is shed."""
+
+
+class RequestScheduler:
+    """
+    Cap in-flight requests and queue the rest fairly across users.
+
+    Waiting requests are grouped per user and slots are handed out round-robin
+    between users, so one user with several queued requests can't starve the
+    others. When max_queue requests are already waiting, new ones are shed
+    with SchedulerFull instead of piling up.
+    """
+
+    def __init__(self, max_in_flight: int = 16, max_queue: int = 100):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.queued = 0
+        # user id -> waiting futures, in round-robin order
+        self._waiters: "OrderedDict[Hashable, Deque]" = OrderedDict()
+
+        # Queue statistics
+        self.shed = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def register_metrics(self) -> None:
+        """Export this scheduler's slots and queue as the process's gauges."""
+        IN_FLIGHT.set_function(lambda: self.in_flight)
+        QUEUED.set_function(lambda: self.queued)
+
+    def is_full(self) -> bool:
+        """Whether a new request would be shed right now."""
+        return self.in_flight >= self.max_in_flight and self.queued >= self.max_queue
+
+    async def acquire(self, user_id: Hashable) -> float:
+        """
+        Wait for an in-flight slot.
+
+        Args:
+            user_id: Key used to share slots fairly
+
+        Returns:
+            Seconds spent waiting in the queue
+
+        Raises:
+            SchedulerFull: If the queue is full
+        """
+        if self.in_flight < self.max_in_flight and not self.queued:
+            self.in_flight += 1
+            QUEUE_WAIT.observe(0.0)
+            return 0.0
+        if self.queued >= self.max_queue:
+            self.shed += 1
+            REQUESTS_SHED.inc()
+            raise SchedulerFull()
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user_id, deque()).append(future)
+        self.queued += 1
+        start = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed to us just before cancellation
+                self.release()
+            else:
+                self._remove_waiter(user_id, future)
+            raise
+
+        waited = time.monotonic() - start
+        self.waits += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        QUEUE_WAIT.observe(waited)
+        request_logger.debug(
+            "Request for {user_id} waited {waited:.3f}s for a slot",
+            user_id=user_id,
+            waited=waited,
+        )
+        return waited
+
+    def _remove_waiter(self, user_id: Hashable, future: asyncio.Future) -> None:
+        waiters = self._waiters.get(user_id)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self.queued -= 1
+            if not waiters:
+                del self._waiters[user_id]
+
+    def release(self) -> None:
+        """Free a slot, handing it to the next user in round-robin order."""
+        while self._waiters:
+            user_id, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                self._waiters.move_to_end(user_id)
+            else:
+                del self._waiters[user_id]
+            if not future.done():
+                # The slot passes directly to the waiter
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, user_id: Hashable) -> AsyncIterator[float]:
+        """Hold an in-flight slot for the duration of the block."""
+        waited = await self.acquire(user_id)
+        try:
+            yield waited
+        finally:
+            self.release()
@@ -0,0 +1,268 @@
+"""Compact binary snapshots of conversations, read lazily through mmap."""
+
+import mmap
+import os
+import struct
+import zlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# File layout, all integers little-endian:
+#
+#   header   MAGIC, u16 version, u16 flags
+#   records  u32 length, payload (zlib-compressed if FLAG_COMPRESSED)
+#   index    u64 user id, u64 record offset per user, sorted by user id
+#   footer   u64 index offset, u64 user count, INDEX_MAGIC
+#
+# A record payload is:
+#
+#   u32 summary length (NO_SUMMARY if there is none), summary
+#   u32 message count, then per message u8 role, u32 length, content
+#
+# Text is UTF-8. The index is at the end so the file can be written in one
+# pass, and its fixed-size entries are binary searched in place, so opening a
+# snapshot reads nothing but the footer.
+MAGIC = b"DGPTSNAP"
+INDEX_MAGIC = b"DGPTINDX"
+VERSION = 1
+FLAG_COMPRESSED = 1
+
+HEADER = struct.Struct("<8sHH")
+FOOTER = struct.Struct("<QQ8s")
+INDEX_ENTRY = struct.Struct("<QQ")
+LENGTH = struct.Struct("<I")
+MESSAGE_HEADER = struct.Struct("<BI")
+NO_SUMMARY = 0xFFFFFFFF
+
+# (role, content) pairs, with roles as core.conversation.Role values
+SnapshotMessages = List[Tuple[int, str]]
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is missing, truncated or of another version."""
+
+
+def encode_record(summary: Optional[str], messages: SnapshotMessages) -> bytes:
+    """Encode one user's summary and messages as an uncompressed payload."""
+    parts = []
+    if summary is None:
+        parts.append(LENGTH.pack(NO_SUMMARY))
+    else:
+        data = summary.encode("utf-8")
+        parts.append(LENGTH.pack(len(data)))
+        parts.append(data)
+    parts.append(LENGTH.pack(len(messages)))
+    for role, content in messages:
+        data = content.encode("utf-8")
+        parts.append(MESSAGE_HEADER.pack(role, len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+
+def decode_record(payload: bytes) -> Tuple[Optional[str], SnapshotMessages]:
+    """Decode an uncompressed payload into a summary and messages."""
+    view = memoryview(payload)
+    (length,) = LENGTH.unpack_from(view, 0)
+    offset = LENGTH.size
+    summary = None
+    if length != NO_SUMMARY:
+        summary = str(view[offset : offset + length], "utf-8")
+        offset += length
+    (count,) = LENGTH.unpack_from(view, offset)
+    offset += LENGTH.size
+
+    messages = []
+    for _ in range(count):
+        role, length = MESSAGE_HEADER.unpack_from(view, offset)
+        offset += MESSAGE_HEADER.size
+        messages.append((role, str(view[offset : offset + length], "utf-8")))
+        offset += length
+    return summary, messages
+
+
+class SnapshotWriter:
+    """
+    Write a snapshot one record at a time.
+
+    Records must be written in increasing user id order. The file is written
+    next to path and only replaces it once finished, so a crash mid-write
+    leaves the previous snapshot intact. Only the index, 16 bytes per user,
+    is kept in memory.
+    """
+
+    def __init__(self, path: str, compress: bool = False):
+        self.path = path
+        self.compress = compress
+        self.count = 0
+        self._temp_path = f"{path}.tmp"
+        self._index = bytearray()
+        self._last_user_id = -1
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self._temp_path, "wb")
+        flags = FLAG_COMPRESSED if compress else 0
+        self._file.write(HEADER.pack(MAGIC, VERSION, flags))
+
+    def write(self, user_id: int, payload: bytes, compressed: bool = False) -> None:
+        """
+        Append a user's encoded record.
+
+        A compressed payload, like one copied as stored from a compressed
+        snapshot, is only decompressed if this snapshot isn't compressed.
+        """
+        if user_id <= self._last_user_id:
+            raise ValueError("Snapshot records must be in increasing user id order")
+        if compressed and not self.compress:
+            payload = zlib.decompress(payload)
+        elif self.compress and not compressed:
+            payload = zlib.compress(payload)
+        self._index += INDEX_ENTRY.pack(user_id, self._file.tell())
+        self._file.write(LENGTH.pack(len(payload)))
+        self._file.write(payload)
+        self._last_user_id = user_id
+        self.count += 1
+
+    def write_many(self, records: Iterable[Tuple[int, bytes]]) -> None:
+        """Append several (user id, encoded record) pairs."""
+        for user_id, payload in records:
+            self.write(user_id, payload)
+
+    def write_records(self, records: Iterable[Tuple[int, bytes, bool]]) -> None:
+        """Append several (user id, record, whether it's compressed) triples."""
+        for user_id, payload, compressed in records:
+            self.write(user_id, payload, compressed)
+
+    def finish(self) -> None:
+        """Write the index and footer and move the snapshot into place."""
+        index_offset = self._file.tell()
+        self._file.write(self._index)
+        self._file.write(FOOTER.pack(index_offset, self.count, INDEX_MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+
+    def abort(self) -> None:
+        """Discard a partly written snapshot."""
+        self._file.close()
+        try:
+            os.remove(self._temp_path)
+        except FileNotFoundError:
+            pass
+
+
+def write_snapshot(
+    path: str, records: Iterable[Tuple[int, bytes]], compress: bool = False
+) -> int:
+    """
+    Stream (user id, encoded record) pairs into a snapshot file.
+
+    Args:
+        path: Snapshot file to create or replace
+        records: Records in increasing user id order, typically a generator
+        compress: Whether to zlib-compress each record
+
+    Returns:
+        Number of users written
+    """
+    writer = SnapshotWriter(path, compress)
+    try:
+        writer.write_many(records)
+        writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.count
+
+
+class SnapshotReader:
+    """
+    Memory-mapped, read-only access to a snapshot.
+
+    Opening one only checks the header and footer; records are decoded when a
+    user is looked up, and pages the OS never touches are never read.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < HEADER.size + FOOTER.size:
+                raise SnapshotError(f"Snapshot {path} is truncated")
+            # The mapping stays valid after the file is closed
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, flags = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path} is not a conversation snapshot")
+        if version != VERSION:
+            raise SnapshotError(f"Snapshot {path} has unsupported version {version}")
+        self.compressed = bool(flags & FLAG_COMPRESSED)
+
+        self._index_offset, self.count, index_magic = FOOTER.unpack_from(
+            self._map, size - FOOTER.size
+        )
+        if (
+            index_magic != INDEX_MAGIC
+            or self._index_offset + self.count * INDEX_ENTRY.size != size - FOOTER.size
+        ):
+            raise SnapshotError(f"Snapshot {path} is truncated")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _entry(self, position: int) -> Tuple[int, int]:
+        return INDEX_ENTRY.unpack_from(
+            self._map, self._index_offset + position * INDEX_ENTRY.size
+        )
+
+    def _find(self, user_id: int) -> Optional[int]:
+        """Binary search the index for a user's record offset."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            entry_user_id, offset = self._entry(middle)
+            if entry_user_id == user_id:
+                return offset
+            if entry_user_id < user_id:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def _stored(self, offset: int) -> bytes:
+        (length,) = LENGTH.unpack_from(self._map, offset)
+        start = offset + LENGTH.size
+        return self._map[start : start + length]
+
+    def _payload(self, offset: int) -> bytes:
+        payload = self._stored(offset)
+        return zlib.decompress(payload) if self.compressed else payload
+
+    def __contains__(self, user_id: int) -> bool:
+        return self._find(user_id) is not None
+
+    def stored_records(self) -> Iterator[Tuple[int, bytes]]:
+        """
+        Iterate over (user id, record as stored), by user id.
+
+        Records are compressed if the snapshot is, and are never decompressed,
+        so copying them into another snapshot costs no zlib work.
+        """
+        for position in range(self.count):
+            user_id, offset = self._entry(position)
+            yield user_id, self._stored(offset)
+
+    def get_payload(self, user_id: int) -> Optional[bytes]:
+        """Get a user's uncompressed encoded record, or None if absent."""
+        offset = self._find(user_id)
+        return None if offset is None else self._payload(offset)
+
+    def get(self, user_id: int) -> Optional[Tuple[Optional[str], SnapshotMessages]]:
+        """Get a user's summary and messages, or None if absent."""
+        payload = self.get_payload(user_id)
+        return None if payload is None else decode_record(payload)
+
+    def close(self) -> None:
+        """Unmap the file."""
+        self._map.close()
@@ -0,0 +1,322 @@
+"""Pluggable persistent storage for conversation history."""
+
+import asyncio
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger()
+
+
+class DiskWorker:
+    """
+    One dedicated thread for a component's blocking disk work.
+
+    Everything that touches the component's files runs through run(), so the
+    event loop never blocks on disk and the files need no locking.
+    """
+
+    def __init__(self, thread_name: str):
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=thread_name
+        )
+
+    async def run(self, func, *args):
+        """Run a blocking function on the worker thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def close(self) -> None:
+        """Stop the worker thread once the work already submitted is done."""
+        self._executor.shutdown(wait=True)
+
+
+class SQLiteWorker(DiskWorker):
+    """
+    A SQLite database in WAL mode, used from one dedicated thread.
+
+    The database is opened, and its schema created, on first use. connect()
+    may only be called from functions passed to run().
+    """
+
+    def __init__(
+        self,
+        path: str,
+        schema: Sequence[str],
+        thread_name: str,
+        pragmas: Sequence[str] = (),
+    ):
+        super().__init__(thread_name)
+        self.path = path
+        self.schema = schema
+        self.pragmas = pragmas
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def connect(self) -> sqlite3.Connection:
+        """Open the database on first use and create the schema."""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            for pragma in self.pragmas:
+                conn.execute(f"PRAGMA {pragma}")
+            for statement in self.schema:
+                conn.execute(statement)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def close(self) -> None:
+        """Close the database and stop the worker thread."""
+        await self.run(self._close)
+        await super().close()
+
+
+class StoreOp(NamedTuple):
+    """A pending write to a conversation store."""
+
+    kind: str  # "append", "reset" or "summarize"
+    user_id: int
+    role: str = ""
+    content: str = ""
+    # Newest messages left after folding the rest into the summary in
+    # content ("summarize"). Memory evicts in blocks while the store trims one
+    # row at a time, so the store may hold older rows memory no longer has.
+    keep: int = 0
+
+
+class ConversationStore(ABC):
+    """Interface for conversation storage backends."""
+
+    def __init__(self, max_messages: int = 20):
+        self.max_messages = max_messages
+
+    @abstractmethod
+    async def load(self, user_id: int) -> List[Tuple[str, str]]:
+        """
+        Load a user's most recent messages.
+
+        Args:
+            user_id: Discord user ID
+
+        Returns:
+            Up to max_messages (role, content) pairs, oldest first
+        """
+
+    async def load_summary(self, user_id: int) -> Optional[str]:
+        """Load the running summary of a user's older messages, if any."""
+        return None
+
+    async def was_reset(self, user_id: int) -> bool:
+        """Whether a user's history was ever reset, making older copies stale."""
+        return False
+
+    @abstractmethod
+    async def write_batch(self, ops: List[StoreOp]) -> None:
+        """
+        Apply a batch of writes atomically and in order.
+
+        Args:
+            ops: Pending writes collected since the last flush
+        """
+
+    async def close(self) -> None:
+        """Release any resources held by the store."""
+
+
+class MemoryStore(ConversationStore):
+    """In-process store with the same interface, for tests and development."""
+
+    def __init__(self, max_messages: int = 20):
+        super().__init__(max_messages)
+        self.data: Dict[int, List[Tuple[str, str]]] = {}
+        self.summaries: Dict[int, str] = {}
+        self.resets: Set[int] = set()
+
+    async def load(self, user_id: int) -> List[Tuple[str, str]]:
+        """Load a user's most recent messages."""
+        return list(self.data.get(user_id, [])[-self.max_messages :])
+
+    async def load_summary(self, user_id: int) -> Optional[str]:
+        """Load the running summary of a user's older messages, if any."""
+        return self.summaries.get(user_id)
+
+    async def was_reset(self, user_id: int) -> bool:
+        """Whether a user's history was ever reset."""
+        return user_id in self.resets
+
+    async def write_batch(self, ops: List[StoreOp]) -> None:
+        """Apply a batch of writes in order."""
+        for op in ops:
+            if op.kind == "reset":
+                self.data.pop(op.user_id, None)
+                self.summaries.pop(op.user_id, None)
+                self.resets.add(op.user_id)
+            elif op.kind == "summarize":
+                history = self.data.get(op.user_id, [])
+                del history[: max(len(history) - op.keep, 0)]
+                self.summaries[op.user_id] = op.content
+            else:
+                history = self.data.setdefault(op.user_id, [])
+                history.append((op.role, op.content))
+                del history[: -self.max_messages]
+
+
+class SQLiteStore(ConversationStore):
+    """
+    SQLite store in WAL mode.
+
+    All database access runs on the store's SQLiteWorker. Each batch is a
+    single transaction, so a crash loses at most the writes that had not been
+    flushed yet and never leaves a partial batch behind.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "user_id INTEGER NOT NULL, "
+        "role TEXT NOT NULL, "
+        "content TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_user ON messages (user_id, id)",
+        "CREATE TABLE IF NOT EXISTS summaries ("
+        "user_id INTEGER PRIMARY KEY, "
+        "summary TEXT NOT NULL)",
+        # Users whose history was reset, so a snapshot's copy is stale
+        "CREATE TABLE IF NOT EXISTS resets (user_id INTEGER PRIMARY KEY)",
+    )
+
+    def __init__(self, path: str, max_messages: int = 20):
+        super().__init__(max_messages)
+        self.path = path
+        self._db = SQLiteWorker(
+            path, self.SCHEMA, "sqlite-store", pragmas=("synchronous=NORMAL",)
+        )
+
+    def _load(self, user_id: int) -> List[Tuple[str, str]]:
+        rows = (
+            self._db.connect()
+            .execute(
+                "SELECT role, content FROM messages WHERE user_id = ? "
+                "ORDER BY id DESC LIMIT ?",
+                (user_id, self.max_messages),
+            )
+            .fetchall()
+        )
+        rows.reverse()
+        return rows
+
+    def _load_summary(self, user_id: int) -> Optional[str]:
+        row = (
+            self._db.connect()
+            .execute("SELECT summary FROM summaries WHERE user_id = ?", (user_id,))
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def _was_reset(self, user_id: int) -> bool:
+        row = (
+            self._db.connect()
+            .execute("SELECT 1 FROM resets WHERE user_id = ?", (user_id,))
+            .fetchone()
+        )
+        return row is not None
+
+    def _write_batch(self, ops: List[StoreOp]) -> None:
+        conn = self._db.connect()
+        touched = set()
+        with conn:
+            for op in ops:
+                if op.kind == "reset":
+                    conn.execute(
+                        "DELETE FROM messages WHERE user_id = ?", (op.user_id,)
+                    )
+                    conn.execute(
+                        "DELETE FROM summaries WHERE user_id = ?", (op.user_id,)
+                    )
+                    conn.execute(
+                        "INSERT OR IGNORE INTO resets (user_id) VALUES (?)",
+                        (op.user_id,),
+                    )
+                elif op.kind == "summarize":
+                    conn.execute(
+                        "DELETE FROM messages WHERE user_id = ? AND id NOT IN ("
+                        "SELECT id FROM messages WHERE user_id = ? "
+                        "ORDER BY id DESC LIMIT ?)",
+                        (op.user_id, op.user_id, op.keep),
+                    )
+                    conn.execute(
+                        "INSERT OR REPLACE INTO summaries (user_id, summary) "
+                        "VALUES (?, ?)",
+                        (op.user_id, op.content),
+                    )
+                else:
+                    conn.execute(
+                        "INSERT INTO messages (user_id, role, content) "
+                        "VALUES (?, ?, ?)",
+                        (op.user_id, op.role, op.content),
+                    )
+                    touched.add(op.user_id)
+
+            # Keep only the rows that can still be loaded
+            for user_id in touched:
+                conn.execute(
+                    "DELETE FROM messages WHERE user_id = ? AND id <= ("
+                    "SELECT id FROM messages WHERE user_id = ? "
+                    "ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (user_id, user_id, self.max_messages),
+                )
+
+    async def load(self, user_id: int) -> List[Tuple[str, str]]:
+        """Load a user's most recent messages."""
+        return await self._db.run(self._load, user_id)
+
+    async def load_summary(self, user_id: int) -> Optional[str]:
+        """Load the running summary of a user's older messages, if any."""
+        return await self._db.run(self._load_summary, user_id)
+
+    async def was_reset(self, user_id: int) -> bool:
+        """Whether a user's history was ever reset."""
+        return await self._db.run(self._was_reset, user_id)
+
+    async def write_batch(self, ops: List[StoreOp]) -> None:
+        """Apply a batch of writes in a single transaction."""
+        await self._db.run(self._write_batch, ops)
+
+    async def close(self) -> None:
+        """Close the database and stop the store thread."""
+        await self._db.close()
+
+
+def create_store(
+    backend: str, path: str, max_messages: int
+) -> Optional[ConversationStore]:
+    """
+    Create a conversation store from configuration.
+
+    Args:
+        backend: "sqlite", "memory" or "none"
+        path: Database file path for the SQLite backend
+        max_messages: Number of messages kept per user
+
+    Returns:
+        Configured store, or None to keep history in process only
+    """
+    if backend == "sqlite":
+        logger.info(f"Using SQLite conversation store at {path}")
+        return SQLiteStore(path, max_messages)
+    if backend == "memory":
+        return MemoryStore(max_messages)
+    if backend == "none":
+        return None
+    raise ValueError(f"Unknown conversation store backend: {backend}")
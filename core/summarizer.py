@@ -0,0 +1,77 @@
+"""Background summarization of older conversation history."""
+
+import asyncio
+from typing import Dict
+
+from core.conversation import Conversation, ConversationManager
+from core.openai_client import OpenAIClient
+from core.prompt_builder import build_summary_request
+from utils.logger import get_logger
+
+logger = get_logger()
+
+
+class ConversationSummarizer:
+    """
+    Fold the oldest turns of long conversations into a running summary.
+
+    Once a conversation holds threshold messages, the oldest batch_size of
+    them are summarized together with the previous summary by a background
+    task. Replies never wait for it: until the summary is ready the messages
+    stay in history, and at most one summary per user runs at a time.
+    """
+
+    def __init__(
+        self,
+        conversation_manager: ConversationManager,
+        openai_client: OpenAIClient,
+        threshold: int = 16,
+        batch_size: int = 8,
+        max_tokens: int = 300,
+    ):
+        self.conversation_manager = conversation_manager
+        self.openai_client = openai_client
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def maybe_summarize(self, user_id: int) -> None:
+        """Start summarizing a user's conversation if it's long enough."""
+        if user_id in self._tasks:
+            return
+        conversation = self.conversation_manager.conversations.get(user_id)
+        if conversation is None or conversation.message_count() < self.threshold:
+            return
+
+        task = asyncio.create_task(self._summarize(user_id, conversation))
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(user_id, None))
+
+    async def _summarize(self, user_id: int, conversation: Conversation) -> None:
+        folded = conversation.messages[: self.batch_size]
+        request = build_summary_request(
+            conversation.summary, [msg.to_dict() for msg in folded]
+        )
+        try:
+            # The request holds the transcript, which must never be cached
+            summary = await self.openai_client.get_chat_completion(
+                request, user_id, max_tokens=self.max_tokens, cache=False
+            )
+        except Exception as e:
+            logger.error(f"Failed to summarize conversation for user {user_id}: {e}")
+            return
+
+        if not summary:
+            logger.warning(f"Empty summary for user {user_id}, keeping history")
+            return
+
+        self.conversation_manager.apply_summary(user_id, conversation, summary, folded)
+        logger.debug(f"Folded {len(folded)} messages into summary for user {user_id}")
+
+    async def close(self) -> None:
+        """Cancel summaries that are still running."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,42 @@
+"""Token counting for prompt budgeting."""
+
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+# Tokens added by the chat format around each message (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Average characters per token for English text, used without tiktoken
+APPROX_CHARS_PER_TOKEN = 4
+
+
+class TokenCounter:
+    """Count tokens with tiktoken when installed, or approximate otherwise."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.encoding = self._load_encoding(model)
+
+    @staticmethod
+    def _load_encoding(model: str) -> Optional["tiktoken.Encoding"]:
+        """Load the tokenizer for a model, if tiktoken is available."""
+        if tiktoken is None:
+            return None
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+
+    def count(self, text: str) -> int:
+        """Count the tokens in a piece of text."""
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return -(-len(text) // APPROX_CHARS_PER_TOKEN)
+
+    def count_message(self, content: str) -> int:
+        """Count the tokens a message occupies in a chat prompt."""
+        return self.count(content) + MESSAGE_OVERHEAD_TOKENS
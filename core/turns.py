@@ -0,0 +1,217 @@
+"""Per-user serialization of conversation turns."""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+)
+
+from utils.logger import get_logger
+
+logger = get_logger()
+
+TURN_POLICIES = ("queue", "coalesce", "reject")
+
+
+class _UserTurns:
+    """Lock and waiting prompts for one user."""
+
+    __slots__ = ("lock", "users", "pending")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Coroutines holding or waiting for the lock
+        self.users = 0
+        # Prompts waiting to be merged into the next turn (coalesce policy)
+        self.pending: List[str] = []
+
+
+class UserTurnQueue:
+    """
+    Run each user's turns one at a time, in arrival order.
+
+    Different users never wait on each other. State is created on a user's
+    first turn and dropped as soon as no turn is running or waiting, so idle
+    users cost nothing.
+
+    Policies for prompts that arrive while a turn is running:
+        queue: wait for the running turn, up to max_pending waiting turns
+        coalesce: merge all waiting prompts into a single next turn
+        reject: refuse the prompt
+    """
+
+    def __init__(self, policy: str = "queue", max_pending: int = 3):
+        if policy not in TURN_POLICIES:
+            raise ValueError(f"Unknown turn policy: {policy}")
+        self.policy = policy
+        self.max_pending = max_pending
+        self._users: Dict[int, _UserTurns] = {}
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def check(self, user_id: int) -> Optional[str]:
+        """
+        Check whether a new prompt from a user would be accepted.
+
+        Returns:
+            A rejection message, or None if the prompt may proceed
+        """
+        state = self._users.get(user_id)
+        if state is None or not state.lock.locked():
+            return None
+        if self.policy == "reject":
+            return "⏳ I'm still answering your previous message. Please wait."
+        if self.policy == "queue" and state.users > self.max_pending:
+            return "⏳ You have too many messages waiting. Please wait."
+        return None
+
+    @asynccontextmanager
+    async def turn(self, user_id: int, prompt: str) -> AsyncIterator[Optional[str]]:
+        """
+        Wait for the user's previous turns, then hold the turn.
+
+        Yields:
+            The prompt to process, which includes any merged prompts, or None
+            if the prompt was merged into another waiting turn
+        """
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserTurns()
+
+        if self.policy == "coalesce" and state.pending:
+            # Another waiting turn will pick this prompt up
+            state.pending.append(prompt)
+            yield None
+            return
+
+        merging = self.policy == "coalesce" and state.lock.locked()
+        if merging:
+            state.pending.append(prompt)
+
+        state.users += 1
+        try:
+            async with state.lock:
+                if merging:
+                    prompt = "\n\n".join(state.pending)
+                    state.pending.clear()
+                yield prompt
+        finally:
+            self._release(user_id, state)
+
+    @asynccontextmanager
+    async def hold(self, user_id: int) -> AsyncIterator[None]:
+        """
+        Wait for the user's previous turns, then hold the turn for work that
+        isn't a prompt, like adding a deferred answer to the history.
+
+        Nothing is ever merged into it, whatever the policy.
+        """
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserTurns()
+        state.users += 1
+        try:
+            async with state.lock:
+                yield
+        finally:
+            self._release(user_id, state)
+
+    def _release(self, user_id: int, state: _UserTurns) -> None:
+        state.users -= 1
+        if state.users == 0 and not state.pending:
+            del self._users[user_id]
+
+
+class _Burst:
+    """Items one user sent in quick succession, and when."""
+
+    __slots__ = ("items", "first_at", "last_at", "task")
+
+    def __init__(self, now: float):
+        self.items: List[Any] = []
+        self.first_at = now
+        self.last_at = now
+        # Task waiting out the delay, then running the handler
+        self.task: Optional[asyncio.Task] = None
+
+
+class MessageDebouncer:
+    """
+    Merge the messages a user sends in quick succession.
+
+    Each message restarts the user's delay. Once delay seconds pass without
+    another message, or max_delay seconds after the first, the handler is
+    called once with all of them, in order. The handler runs in its own task,
+    so messages arriving meanwhile start the next burst.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[int, List[Any]], Awaitable[None]],
+        delay: float = 1.0,
+        max_delay: float = 4.0,
+    ):
+        self.handler = handler
+        self.delay = delay
+        self.max_delay = max(max_delay, delay)
+        self._bursts: Dict[int, _Burst] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._bursts)
+
+    def push(self, user_id: int, item: Any) -> None:
+        """Add a user's message to their current burst, starting one if needed."""
+        now = time.monotonic()
+        burst = self._bursts.get(user_id)
+        if burst is None:
+            burst = self._bursts[user_id] = _Burst(now)
+            burst.task = self._spawn(self._wait(user_id, burst))
+        burst.items.append(item)
+        burst.last_at = now
+
+    def flush(self) -> None:
+        """Hand every waiting burst to the handler now, without its delay."""
+        for user_id, burst in list(self._bursts.items()):
+            burst.task.cancel()
+            burst.task = self._spawn(self._handle(user_id, burst))
+
+    def _spawn(self, coroutine: Awaitable[None]) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _wait(self, user_id: int, burst: _Burst) -> None:
+        while True:
+            due = min(burst.last_at + self.delay, burst.first_at + self.max_delay)
+            remaining = due - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        await self._handle(user_id, burst)
+
+    async def _handle(self, user_id: int, burst: _Burst) -> None:
+        # Until here the burst counts as waiting, and takes new messages
+        del self._bursts[user_id]
+        try:
+            await self.handler(user_id, burst.items)
+        except Exception as e:
+            logger.error(f"Failed to handle messages from user {user_id}: {e}")
+
+    async def close(self) -> None:
+        """Drop bursts still waiting and cancel running handlers."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._bursts.clear()
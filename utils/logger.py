@@ -1,28 +1,134 @@
 """Logging configuration using loguru."""
 
+import json
+import random
 import sys
+from typing import Dict, Optional
 
 from loguru import logger
 
+from config.settings import Settings
+
+TEXT_FORMAT = (
+    "{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}"
+)
+CONSOLE_FORMAT = "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+
+# Extra fields used internally, left out of JSON output
+_INTERNAL_EXTRA = ("json",)
+
+# Fraction of sampled lines kept per level, e.g. {"INFO": 0.1}
+_sample_rates: Dict[str, float] = {}
+_redact_prompts = False
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """Parse "LEVEL=rate" pairs separated by commas, e.g. "INFO=0.1,DEBUG=0.01"."""
+    rates = {}
+    for pair in value.split(","):
+        if not pair.strip():
+            continue
+        level, _, rate = pair.partition("=")
+        rates[level.strip().upper()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+def _json_format(record) -> str:
+    """Render a record as one JSON object per line."""
+    entry = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "logger": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "message": record["message"],
+    }
+    for key, value in record["extra"].items():
+        if key not in _INTERNAL_EXTRA:
+            entry[key] = value
+    if record["exception"] is not None:
+        entry["exception"] = repr(record["exception"].value)
+    record["extra"]["json"] = json.dumps(entry, default=str)
+    return "{extra[json]}\n"
+
+
+def setup_logger(settings: Optional[Settings] = None, name: str = "discordgpt") -> None:
+    """
+    Configure logger with appropriate format and level.
+
+    Without settings, logs text to stderr and to a daily file. With settings,
+    the format, levels, background writing, sampling and prompt redaction
+    come from the LOG_* options.
+
+    Args:
+        settings: Application settings
+        name: Log file prefix, unique per process
+    """
+    global _sample_rates, _redact_prompts
+
+    console_level, file_level = "INFO", "DEBUG"
+    json_output, enqueue = False, False
+    if settings is not None:
+        console_level, file_level = settings.log_level, settings.log_file_level
+        json_output = settings.log_format == "json"
+        # Sinks write from a background thread, off the event loop
+        enqueue = settings.log_enqueue
+        _sample_rates = parse_sample_rates(settings.log_sample_rates)
+        _redact_prompts = settings.log_redact_prompts
 
-def setup_logger() -> None:
-    """Configure logger with appropriate format and level."""
     logger.remove()
     logger.add(
         sys.stderr,
-        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-        level="INFO",
-        colorize=True,
+        format=_json_format if json_output else CONSOLE_FORMAT,
+        level=console_level,
+        colorize=not json_output,
+        enqueue=enqueue,
     )
     logger.add(
-        "logs/discordgpt_{time:YYYY-MM-DD}.log",
+        f"logs/{name}_{{time:YYYY-MM-DD}}.log",
         rotation="00:00",
         retention="7 days",
-        level="DEBUG",
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
+        level=file_level,
+        format=_json_format if json_output else TEXT_FORMAT,
+        enqueue=enqueue,
     )
 
 
 def get_logger():
     """Get the configured logger instance."""
     return logger
+
+
+class SampledLogger:
+    """
+    Logger for high-volume lines, keeping a configured fraction per level.
+
+    Dropped lines cost one random number: they are never formatted.
+    """
+
+    def _log(self, level: str, message: str, *args, **kwargs) -> None:
+        rate = _sample_rates.get(level, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            return
+        logger.opt(depth=2).bind(sampled=True).log(level, message, *args, **kwargs)
+
+    def debug(self, message: str, *args, **kwargs) -> None:
+        self._log("DEBUG", message, *args, **kwargs)
+
+    def info(self, message: str, *args, **kwargs) -> None:
+        self._log("INFO", message, *args, **kwargs)
+
+
+_sampled_logger = SampledLogger()
+
+
+def get_sampled_logger() -> SampledLogger:
+    """Get the logger for high-volume lines subject to LOG_SAMPLE_RATES."""
+    return _sampled_logger
+
+
+def redact_prompt(prompt: str) -> str:
+    """Get a prompt preview for logs, or only its length with LOG_REDACT_PROMPTS."""
+    if _redact_prompts:
+        return f"<redacted, {len(prompt)} characters>"
+    return prompt[:50] + "..."